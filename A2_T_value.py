@@ -1,4 +1,4 @@
-from Objects.Problem import ProblemSet
+from Objects.Sweep import Sweep
 
 if __name__ == "__main__":
     instanceList =  [
@@ -6,5 +6,9 @@ if __name__ == "__main__":
                     ]
     nDestroyOps = 4
     nRepairOps = 5
-    problemSet = ProblemSet(instanceList)
-    problemSet.runALNS(nDestroyOps, nRepairOps, plotIntermediateSolutions=False, verbose = False)
\ No newline at end of file
+    grid = {"T": [10, 40, 100, 1000]}
+    seeds = [1, 2, 3]
+    sweep = Sweep(instanceList, grid, seeds, nDestroyOps, nRepairOps)
+    sweep.run(verbose = True)
+    sweep.printTables()
+    sweep.writeTables("Results/T_value.csv")
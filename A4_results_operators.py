@@ -1,7 +1,9 @@
 from Objects.Problem import ProblemSet
+from Objects.ResultsStore import RESULTS_DB, ResultsStore
 
 if __name__ == "__main__":
-    baselineCost = [1700.7059682222073, 
+    # measurements of the baseline from before the results store, stored in it on the first run
+    legacyCost = [1700.7059682222073, 
                        2084.8087319244783, 
                        1583.757764322537, 
                        1885.1711044781907, 
@@ -16,7 +18,7 @@ if __name__ == "__main__":
                        9732.728888788635, 
                        10876.936432963526, 
                        9970.33747823218]   
-    baselineT = [2.7229589000344276, 
+    legacyT = [2.7229589000344276, 
                  1.9903085000114515, 
                  2.7795700000133365, 
                  2.19861259998288, 
@@ -48,10 +50,16 @@ if __name__ == "__main__":
                 "Ca4-3,5,100.txt",
                 "Ca5-3,5,100.txt",
                     ]
-    nDestroyOps = 4
-    nRepairOps = 3
+    nDestroyOps = 6
+    nRepairOps = 6
+    store = ResultsStore(RESULTS_DB)
+    store.addBaseline("A4 baseline", instanceList, legacyCost, legacyT)
+    baselineCost, baselineT = store.means("A4 baseline", instanceList)
     problemSet = ProblemSet(instanceList)
-    problemSet.runALNS(nDestroyOps, nRepairOps, plotIntermediateSolutions=False, verbose = False)
+    # runs of the same code, operators and parameters are taken from the store instead of run again
+    problemSet.runALNS(nDestroyOps, nRepairOps, plotIntermediateSolutions=False, verbose = False,
+                       store=store, label="A4", reuse=True)
+    store.close()
     deltaC = [problemSet.costSolution[i] / baselineCost[i] for i in range(len(baselineCost))]
     deltaT = [problemSet.tSolution[i] / baselineT[i] for i in range(len(baselineT))]
     meanDC = sum(deltaC)/len(deltaC)
@@ -1,9 +1,11 @@
 from Objects.Problem import ProblemSet
+from Objects.ResultsStore import RESULTS_DB, ResultsStore
 import matplotlib.pyplot as plt
 
 if __name__ == "__main__":
-    baselineCost = [1841.3428780442798, 2013.774128187077, 1685.1656288966808, 1874.6091078294385, 1769.153213030219, 5788.733284616809, 5543.234238488508, 5802.884367257584, 5588.309429850857, 5319.255237848907, 11769.112085282555, 11164.186012775008, 10957.281215444844, 12203.217139415603, 11199.82894055436]
-    baselineT = [1.7435487000038847, 1.5389491000096314, 1.5751547000254504, 1.7424930999986827, 1.7003817999502644, 3.478625599993393, 3.623696500028018, 3.426829500007443, 3.393680300039705, 3.3393831999856047, 6.521005499991588, 6.660739599959925, 6.823008200037293, 7.115664299984928, 7.41411050001625]
+    # measurements of the baseline from before the results store, stored in it on the first run
+    legacyCost = [1841.3428780442798, 2013.774128187077, 1685.1656288966808, 1874.6091078294385, 1769.153213030219, 5788.733284616809, 5543.234238488508, 5802.884367257584, 5588.309429850857, 5319.255237848907, 11769.112085282555, 11164.186012775008, 10957.281215444844, 12203.217139415603, 11199.82894055436]
+    legacyT = [1.7435487000038847, 1.5389491000096314, 1.5751547000254504, 1.7424930999986827, 1.7003817999502644, 3.478625599993393, 3.623696500028018, 3.426829500007443, 3.393680300039705, 3.3393831999856047, 6.521005499991588, 6.660739599959925, 6.823008200037293, 7.115664299984928, 7.41411050001625]
     instanceList =  [
                 "Ca1-2,3,15.txt",
                 "Ca2-2,3,15.txt",
@@ -23,8 +25,14 @@ if __name__ == "__main__":
                     ]
     nDestroyOps = 3
     nRepairOps = 4
+    store = ResultsStore(RESULTS_DB)
+    store.addBaseline("A5 baseline", instanceList, legacyCost, legacyT)
+    baselineCost, baselineT = store.means("A5 baseline", instanceList)
     problemSet = ProblemSet(instanceList)
-    problemSet.runALNS(nDestroyOps, nRepairOps, plotIntermediateSolutions=False, verbose = False)
+    # runs of the same code, operators and parameters are taken from the store instead of run again
+    problemSet.runALNS(nDestroyOps, nRepairOps, plotIntermediateSolutions=False, verbose = False,
+                       store=store, label="A5", reuse=True)
+    store.close()
     deltaC = [problemSet.costSolution[i] / baselineCost[i] for i in range(len(baselineCost))]
     deltaT = [problemSet.tSolution[i] / baselineT[i] for i in range(len(baselineT))]
     nInst = [[20]*5, [60]*5, [108]*5]
@@ -7,7 +7,7 @@ from Objects.Problem import ProblemSet
 from Objects.Setup import instanceList
 
 if __name__ == "__main__":
-    nDestroyOps = 4
-    nRepairOps = 5
+    nDestroyOps = 6
+    nRepairOps = 6
     problemSet = ProblemSet(instanceList)
     problemSet.runALNS(nDestroyOps, nRepairOps, plotIntermediateSolutions=False,  verbose = False)
\ No newline at end of file
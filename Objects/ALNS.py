@@ -3,9 +3,18 @@
 @author: Original template by Rolf van Lieshout and Krissada Tundulyasaree
 """
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from Objects.Solution import Solution
-from random import Random
+from Objects.Fingerprint import SolutionCache
+from Objects.LocalSearch import LocalSearch
+from Objects.LowerBound import LowerBound
+from Objects.RandomService import RandomService
+from Objects.RoutePool import RoutePool
+from Objects.Validator import validateSolution
+from Objects.Scheduler import SlidingWindowBandit
 import copy
+import json
+import os
 import time
 import math
 
@@ -19,9 +28,106 @@ class Parameters:
     randomSeed = 1  # value of the random seed
     T = 100 # Temperature for Simulated Annealing
     Cool = 0.99 # Cooling rate
+    localSearchOnBest = False # polish every new global best solution with local search (changes the costs, times and operator statistics of the reference runs)
+    localSearchInterval = 0 # apply local search to the candidate solution every k iterations, 0 to disable
+    localSearchFirstImprovement = True # first-improvement (True) or best-improvement (False) local search
+    scheduler = "roulette" # operator selection: "roulette" (score weights / mean time) or "bandit" (improvement per second)
+    operatorTime = "wall" # operator run time for the schedulers: "wall" (seconds) or "evaluations" (1 + number of route evaluations, deterministic, so a seeded run and its resumes are reproducible)
+    schedulerWindow = 50 # number of recent operator uses the bandit takes into account
+    schedulerExploration = 0.3 # exploration weight of the bandit
+    debugCostTracking = False # cross-check the incrementally tracked cost against a full recomputation every iteration and validate every accepted solution
+    batchSize = 1 # number of candidate neighbours generated from the current solution per iteration
+    batchWorkers = 4 # worker processes that evaluate a batch, 1 evaluates the candidates in this process
+    rejectDuplicates = False # reject candidate solutions that were seen before without evaluating their acceptance (changes the acceptance and so the reference results)
+    duplicateCacheSize = 10000 # number of solution fingerprints that are remembered
+    exactFirstEchelon = False # build the optimal first echelon for the satellite demands in every repair instead of the operator's heuristic
+    poolInterval = 0 # recombine the pooled second-echelon routes by set partitioning every k iterations, 0 to disable. Each recombination solves a MILP of up to poolTimeLimit seconds, so e.g. k=20 makes a 150-iteration run 7-9 times slower
+    poolSize = 5000 # maximum number of routes in the route pool
+    poolTimeLimit = 2.0 # time limit in seconds of a set-partitioning recombination
+    targetGap = 0.0 # stop as soon as the relative gap between the best solution and the lower bound is at most this, 0 to disable
+    timeWindows = False # read the customer time windows of the instances and respect them in the second echelon
     # can add parameters such as cooling rate etc.
 
 
+# parameters that are stored in a checkpoint, since they determine how the run continues
+CHECKPOINT_PARAMETERS = ("nIterations", "minSizeNBH", "randomSeed", "Cool", "localSearchOnBest", "localSearchInterval",
+                         "localSearchFirstImprovement", "scheduler", "schedulerWindow", "schedulerExploration", "batchSize",
+                         "rejectDuplicates", "duplicateCacheSize", "exactFirstEchelon", "timeWindows", "targetGap",
+                         "poolInterval", "poolSize", "poolTimeLimit", "operatorTime")
+
+
+def operatorClock(problem) -> tuple:
+    """
+    Function that returns the clock the operator run times are measured with and the amount added
+    to every measurement: time.perf_counter and 0 for Parameters.operatorTime "wall", or the number
+    of route evaluations of the problem and 1 for "evaluations". Operators that evaluate no route,
+    like the destroy operators, then all take one unit.
+    """
+    if Parameters.operatorTime == "evaluations":
+        cache = problem.routeCache
+        return (lambda: cache.hits + cache.misses), 1
+    return time.perf_counter, 0
+
+
+def applyOperators(solution: Solution, destroyHeuristicNr: int, repairHeuristicNr: int, sizeNBH: int,
+                   rng: RandomService) -> tuple[float, float]:
+    """
+    Function that destroys and repairs a solution in place. Every operator draws from its own
+    random substream and noise buffer of rng.
+
+    Parameters
+    ----------
+    solution : the solution to destroy and repair.
+    destroyHeuristicNr : number of the destroy operator.
+    repairHeuristicNr : number of the repair operator.
+    sizeNBH : size of the neighborhood.
+    rng : the random service of the run or of the candidate.
+
+    Returns
+    -------
+    tDestroy, tRepair : run times of the destroy and the repair operator, see operatorClock.
+    """
+    clock, unit = operatorClock(solution.problem)
+    randomDestroy = rng.random(f"destroy{destroyHeuristicNr}")
+    noiseDestroy = rng.noise(f"destroy{destroyHeuristicNr}")
+    randomRepair = rng.random(f"repair{repairHeuristicNr}")
+    noiseRepair = rng.noise(f"repair{repairHeuristicNr}")
+    exactFirst = Parameters.exactFirstEchelon
+
+    #perform the destroy 
+    startTime_destroy = clock() # precision timing
+    if destroyHeuristicNr == 1:
+        solution.executeRandomRemoval(sizeNBH, randomDestroy, False)
+    elif destroyHeuristicNr == 2:
+        solution.executeWorstRemoval(sizeNBH, randomDestroy, False, False)
+    elif destroyHeuristicNr == 3:
+        solution.executeWorstRemoval(sizeNBH, randomDestroy, False, True, noiseDestroy)
+    elif destroyHeuristicNr == 4: # SHOWS POOR PERFORMANCE, NOT USED
+        solution.executeRelatedRemoval(sizeNBH, randomDestroy, False)
+    elif destroyHeuristicNr == 5:
+        solution.executeStringRemoval(sizeNBH, randomDestroy)
+    else:
+        solution.executeRouteRemoval(sizeNBH, randomDestroy)
+    tDestroy = clock()-startTime_destroy + unit
+
+    #perform the repair
+    startTime_repair = clock() # precision timing
+    if repairHeuristicNr == 1:
+        solution.executeRandomInsertion(randomRepair, exactFirst)
+    elif repairHeuristicNr == 2:
+        solution.executeGreedyInsertion(randomRepair, True, noiseRepair, exactFirst)
+    elif repairHeuristicNr == 3:
+        solution.executeRegretInsertion(randomRepair, True, noiseRepair, exactFirst)
+    elif repairHeuristicNr == 4: # SHOWS POOR PERFORMANCE, NOT USED
+        solution.executeRegretInsertion(randomRepair, False, exactFirst=exactFirst)
+    elif repairHeuristicNr == 5: # SHOWS POOR PERFORMANCE, NOT USED
+        solution.executeGreedyInsertion(randomRepair, False, exactFirst=exactFirst)
+    else:
+        solution.executeSplitInsertion(randomRepair, exactFirst)
+    tRepair = clock()-startTime_repair + unit
+    return tDestroy, tRepair
+
+
 class ALNS:
     """
     Class that models the ALNS algorithm. 
@@ -34,13 +140,19 @@ class ALNS:
     nRepairOps :  number of repair operators.
     wDestroyOps : weight of destroy operator.
     wRepairOps : weight of repair operator.
-    randomGen :  random number generator
+    rng : random service with an independent substream per operator, for reproducibility
+    randomGen :  random number generator for the decisions of the ALNS itself
     currentSolution : The current solution in the ALNS algorithm
     bestSolution : The best solution currently found
     bestCost : Cost of the best solution
+    T : current temperature for Simulated Annealing, starts at Parameters.T
+    destroyScheduler, repairScheduler : OperatorScheduler that selects the operators, None for the
+        built-in roulette wheel on the weights. Any OperatorScheduler can be plugged in here.
+    iteration : number of iterations that have been completed
+    solutionCache : the fingerprints and costs of the seen solutions, with duplicate statistics
 
     """
-    def __init__(self,problem, nDestroyOps: int, nRepairOps: int, verbose: bool = False):
+    def __init__(self,problem, nDestroyOps: int, nRepairOps: int, verbose: bool = False, workerID: int = 0):
         self.problem = problem
         self.nDestroyOps = nDestroyOps
         self.nRepairOps = nRepairOps
@@ -52,7 +164,23 @@ class ALNS:
         self.tRepairOps = [0]*nRepairOps #initially all repair operators have time 0
         self.nUsedRepairOps = [0]*nRepairOps #initially all destroy operators are used 0 times
         self.wLambda = 0.5 #parameter that controls the sensitivity of the weights
-        self.randomGen = Random(Parameters.randomSeed) #used for reproducibility
+        self.rng = RandomService(Parameters.randomSeed, workerID) #used for reproducibility
+        self.randomGen = self.rng.random("alns")
+        self.T = Parameters.T #temperature, cooled after every iteration
+        self.iteration = 0 #number of completed iterations
+        self.currentSolution = None #constructed at the start of execute
+        self.localSearch = LocalSearch(problem, Parameters.localSearchFirstImprovement) #second-echelon local search
+        self.solutionCache = SolutionCache(Parameters.duplicateCacheSize) #fingerprints of the seen solutions
+        self.lowerBound = LowerBound(problem) #lower bound on the cost, for the optimality gap
+        self.routePool = RoutePool(problem, Parameters.poolSize) if Parameters.poolInterval > 0 else None #pool of the seen second-echelon routes
+        if Parameters.scheduler == "bandit":
+            self.destroyScheduler = SlidingWindowBandit(nDestroyOps, Parameters.schedulerWindow, Parameters.schedulerExploration)
+            self.repairScheduler = SlidingWindowBandit(nRepairOps, Parameters.schedulerWindow, Parameters.schedulerExploration)
+        elif Parameters.scheduler == "roulette":
+            self.destroyScheduler = None
+            self.repairScheduler = None
+        else:
+            raise ValueError(f"Unknown scheduler {Parameters.scheduler}")
         self.solutionTrend = list() #list that stores the best solution found at each iteration
         self.currentSolutionTrend = list() #list that stores the current solution found at each iteration
         self.bestSolutionTrend = list() #list that stores the best solution found at each iteration
@@ -64,68 +192,203 @@ class ALNS:
         """
         self.currentSolution = Solution(self.problem,list(),list(),list(self.problem.customers.copy()))
         # Generate the second-echelon and first echelon routes by random insertion
-        self.currentSolution.executeRandomInsertion(self.randomGen)
+        self.currentSolution.executeRandomInsertion(self.rng.random("initialSolution"), Parameters.exactFirstEchelon)
         # Calculate the cost
         self.currentSolution.computeCost()
+        self.solutionCache.check(self.currentSolution.fingerprint, self.currentSolution.cost)
         self.bestSolution = copy.deepcopy(self.currentSolution)
         self.bestCost = self.currentSolution.cost
         self.solutionTrend.append(self.bestCost)
         if self.verbose:
             print("Created initial solution with cost: "+str(self.bestCost))
         
-    def execute(self, plotIntermediateSolutions: bool = False):
+    def constructWarmStartSolution(self, priorSolution: Solution):
         """
-        Method that executes the ALNS
+        Method that constructs the initial solution from the solution of a previous, similar
+        problem instead of random insertion. Vanished customers are dropped and new customers
+        are repaired in with greedy insertion, which also rebuilds the first echelon.
+        Calling execute afterwards continues the ALNS from this solution.
+
+        Parameters
+        ----------
+        priorSolution : a solution of the previous problem.
+        """
+        self.currentSolution = priorSolution.adaptTo(self.problem)
+        if self.verbose:
+            print(f"Warm start: kept {len(self.currentSolution.served)} customers in {len(self.currentSolution.routes_2)} routes, "
+                  f"{len(self.currentSolution.notServed)} customers to insert")
+        self.currentSolution.executeGreedyInsertion(self.rng.random("warmStart"), False, exactFirst=Parameters.exactFirstEchelon)
+        # Calculate the cost
+        self.currentSolution.computeCost()
+        self.solutionCache.check(self.currentSolution.fingerprint, self.currentSolution.cost)
+        self.bestSolution = copy.deepcopy(self.currentSolution)
+        self.bestCost = self.currentSolution.cost
+        self.solutionTrend.append(self.bestCost)
+        if self.verbose:
+            print("Created warm start solution with cost: "+str(self.bestCost))
+
+    def execute(self, plotIntermediateSolutions: bool = False, plotFinal: bool = True,
+                checkpointFile: str = None, checkpointInterval: int = 100, callback = None, traceFile: str = None):
+        """
+        Method that executes the ALNS. A run restored by loadCheckpoint continues
+        from the iteration after the checkpoint.
+
+        Parameters
+        ----------
+        plotIntermediateSolutions : plot the routes of new best and very bad solutions.
+        plotFinal : plot the solution trend, the repair weights and the best solution at the end.
+        checkpointFile : if given, the state is saved to this file every checkpointInterval iterations.
+        checkpointInterval : number of iterations between checkpoints.
+        callback : function that is called with the ALNS after every iteration. The run stops
+            early if it returns True.
+        traceFile : if given, every iteration is recorded to this file (gzip-compressed if it ends
+            with .gz), so it can be replayed with Objects.Trace. Only for batchSize 1.
         """
         starttime = time.time() # get the start time
-        self.constructInitialSolution()
+        if self.currentSolution is None:
+            self.constructInitialSolution()
         
-        for i in range(Parameters.nIterations):
-            #copy the current solution
-            self.tempSolution = copy.deepcopy(self.currentSolution)
-            #decide on the size of the neighbourhood
-            sizeNBH = self.randomGen.randint(Parameters.minSizeNBH,len(self.problem.locations)//2)
-            #decide on the destroy and repair operator numbers
-            destroyOpNr = self.determineDestroyOpNr()
-            repairOpNr = self.determineRepairOpNr()
-            #execute the destroy and the repair and evaluate the result
-            self.destroyAndRepair(destroyOpNr, repairOpNr, sizeNBH)
-            # Determine the first echelon route using the Greedy insertion
-            self.tempSolution.computeCost()
-            if self.verbose:
-                print(f"Iteration {i}: Found solution with cost: {self.tempSolution.cost}")
-            #determine if the new solution is accepted
-            score = self.checkIfAcceptNewSol(i, destroyOpNr, repairOpNr, plotIntermediateSolutions)
-            #update the ALNS weights
-            self.updateWeights(destroyOpNr, repairOpNr, score)
-            #update the time and number of uses of the operators
-            self.nUsedDestroyOps[destroyOpNr-1] += 1
-            self.nUsedRepairOps[repairOpNr-1] += 1
-            #store the best solution found at each iteration
-            self.solutionTrend.append(self.tempSolution.cost)
-            self.currentSolutionTrend.append(self.currentSolution.cost)
-            self.bestSolutionTrend.append(self.bestSolution.cost)
+        trace = None
+        if traceFile is not None:
+            if Parameters.batchSize > 1:
+                raise ValueError("Iterations can only be traced with batchSize 1")
+            # imported here, since Objects.Trace imports this module
+            from Objects.Trace import TraceWriter
+            trace = TraceWriter(traceFile, self)
+        pool = None
+        shared = None
+        if Parameters.batchSize > 1 and Parameters.batchWorkers > 1:
+            # imported here, since Objects.SharedProblem imports this module
+            from Objects.SharedProblem import SharedProblem
+            shared = SharedProblem(self.problem)
+            pool = ProcessPoolExecutor(max_workers=Parameters.batchWorkers)
+        try:
+            for i in range(self.iteration, Parameters.nIterations):
+                if Parameters.batchSize > 1:
+                    #generate a batch of candidates, the best one becomes tempSolution
+                    destroyOpNr, repairOpNr = self.evaluateBatch(pool, shared)
+                else:
+                    #copy the current solution
+                    self.tempSolution = copy.deepcopy(self.currentSolution)
+                    #decide on the size of the neighbourhood
+                    sizeNBH = self.randomGen.randint(Parameters.minSizeNBH,len(self.problem.locations)//2)
+                    #decide on the destroy and repair operator numbers
+                    destroyOpNr = self.determineDestroyOpNr()
+                    repairOpNr = self.determineRepairOpNr()
+                    if trace is not None:
+                        trace.begin(i, self, destroyOpNr, repairOpNr, sizeNBH)
+                    #execute the destroy and the repair and evaluate the result
+                    self.destroyAndRepair(destroyOpNr, repairOpNr, sizeNBH)
+                # the cost is tracked by the destroy and repair operators
+                self.tempSolution.updateCost()
+                if trace is not None:
+                    trace.end(self.tempSolution, self.tDestroy, self.tRepair)
+                if Parameters.debugCostTracking:
+                    self.tempSolution.checkCost()
+                    cachedCost = self.solutionCache.get(self.tempSolution.fingerprint)
+                    if cachedCost is not None and abs(cachedCost - self.tempSolution.cost) > 1e-6*max(1, abs(cachedCost)):
+                        raise RuntimeError(f"Fingerprint collision: cost {self.tempSolution.cost} was seen as {cachedCost}")
+                #solutions that were seen before are rejected in O(1)
+                duplicate = self.solutionCache.check(self.tempSolution.fingerprint, self.tempSolution.cost) and Parameters.rejectDuplicates
+                if not duplicate and Parameters.localSearchInterval > 0 and (i+1) % Parameters.localSearchInterval == 0:
+                    self.localSearch.improve(self.tempSolution)
+                if self.verbose:
+                    print(f"Iteration {i}: Found solution with cost: {self.tempSolution.cost}")
+                #report the improvement per operator run time to the schedulers
+                improvement = self.currentSolution.cost - self.tempSolution.cost
+                if self.destroyScheduler is not None:
+                    self.destroyScheduler.update(destroyOpNr, improvement, self.tDestroy)
+                if self.repairScheduler is not None:
+                    self.repairScheduler.update(repairOpNr, improvement, self.tRepair)
+                #determine if the new solution is accepted
+                score = self.checkIfAcceptNewSol(i, destroyOpNr, repairOpNr, plotIntermediateSolutions, duplicate)
+                if Parameters.debugCostTracking and score > 0:
+                    errors = validateSolution(self.currentSolution)
+                    if errors:
+                        raise RuntimeError(f"Accepted an invalid solution in iteration {i}: {errors}")
+                #update the ALNS weights
+                self.updateWeights(destroyOpNr, repairOpNr, score)
+                for j in range(self.nRepairOps):
+                    self.wRepairOpsTrend[j].append(self.wRepairOps[j])
+                #pool the routes of the candidate and recombine them periodically
+                if self.routePool is not None:
+                    self.routePool.addSolution(self.tempSolution)
+                    if (i+1) % Parameters.poolInterval == 0:
+                        self.recombineRoutes()
+                #update the time and number of uses of the operators
+                self.nUsedDestroyOps[destroyOpNr-1] += 1
+                self.nUsedRepairOps[repairOpNr-1] += 1
+                #store the best solution found at each iteration
+                self.solutionTrend.append(self.tempSolution.cost)
+                self.currentSolutionTrend.append(self.currentSolution.cost)
+                self.bestSolutionTrend.append(self.bestSolution.cost)
+                self.iteration = i+1
+                if checkpointFile is not None and self.iteration % checkpointInterval == 0:
+                    self.saveCheckpoint(checkpointFile)
+                if callback is not None and callback(self):
+                    if self.verbose:
+                        print(f"Stopped by the callback after iteration {i}")
+                    break
+                if self.lowerBound.gap(self.bestSolution.cost) <= Parameters.targetGap:
+                    if self.verbose:
+                        print(f"Stopped after iteration {i}: gap {self.lowerBound.gap(self.bestSolution.cost):.4f} "
+                              f"reached the target {Parameters.targetGap}")
+                    break
 
-            if self.verbose:
-                if self.tempSolution.cost > 1.75*self.bestSolution.cost:
-                    print(f"Very bad solution found. Destory operator: {destroyOpNr}, repair operator: {repairOpNr}")
-                    if plotIntermediateSolutions:
-                        self.tempSolution.plotRoutes(f"ALNS Iteration {i}")              
+                if self.verbose:
+                    if self.tempSolution.cost > 1.75*self.bestSolution.cost:
+                        print(f"Very bad solution found. Destory operator: {destroyOpNr}, repair operator: {repairOpNr}")
+                        if plotIntermediateSolutions:
+                            self.tempSolution.plotRoutes(f"ALNS Iteration {i}")              
+        finally:
+            if pool is not None:
+                pool.shutdown()
+                shared.close()
+            if trace is not None:
+                trace.close()
 
         endtime = time.time() # get the end time
         cpuTime = round(endtime-starttime)
-        self.plotSolutionTrend()
-        self.PlotRepairTrend()
-        self.bestSolution.plotRoutes("ALNS Best Solution")
+        if plotFinal:
+            self.plotSolutionTrend()
+            self.PlotRepairTrend()
+            self.bestSolution.plotRoutes("ALNS Best Solution")
 
         print("Terminated. Final cost: "+str(self.bestSolution.cost)+", cpuTime: "+str(cpuTime)+" seconds")
+        print(f"Lower bound: {self.lowerBound.value:.2f}, gap: {self.lowerBound.gap(self.bestSolution.cost):.4f}")
         print(f"Time for the destroy operators: {self.tDestroyOps}. Weights for the destroy operators: {self.wDestroyOps}")
 
         print(f"Time for the repair operators: {self.tRepairOps}. Weights for the repair operators: {self.wRepairOps}")
+        print(f"Route cache hit rate: {self.problem.routeCache.hitRate():.3f} ({len(self.problem.routeCache)} routes)")
+        print(f"Duplicate solutions: {self.solutionCache.nDuplicates} of {self.solutionCache.nLookups} ({self.solutionCache.duplicateRate():.3f})")
+        if self.routePool is not None:
+            print(f"Route pool: {len(self.routePool)} routes, {self.routePool.nImprovements} of "
+                  f"{self.routePool.nRecombinations} recombinations improved the second echelon")
+        if self.problem.firstEchelonSolver is not None:
+            print(f"Exact first echelon cache hit rate: {self.problem.firstEchelonSolver.hitRate():.3f}")
     
-    def checkIfAcceptNewSol(self, i: int, destroyOpNr: int, repairOpNr: int, plotIntermediateSolutions: bool = False):
+    def recombineRoutes(self):
         """
-        Method that checks if we accept the newly found solution
+        Method that recombines the pooled routes by set partitioning. A recombined solution that is
+        better than the best solution becomes the best and the current solution.
+        """
+        solution = self.routePool.recombine(self.bestSolution, Parameters.poolTimeLimit, self.rng.random("routePool"),
+                                            Parameters.exactFirstEchelon)
+        if solution is None or solution.cost >= self.bestCost:
+            return
+        self.solutionCache.check(solution.fingerprint, solution.cost)
+        if self.verbose:
+            print(f"Recombined the route pool into a new global best solution with cost {solution.cost}, "
+                  f"gap {self.lowerBound.gap(solution.cost):.4f}")
+        self.bestCost = solution.cost
+        self.bestSolution = solution
+        self.currentSolution = copy.deepcopy(solution)
+
+    def checkIfAcceptNewSol(self, i: int, destroyOpNr: int, repairOpNr: int, plotIntermediateSolutions: bool = False,
+                            duplicate: bool = False):
+        """
+        Method that checks if we accept the newly found solution. A duplicate, a solution that was
+        seen before, is rejected without drawing a random number or copying it.
 
         Returns
         -------
@@ -133,23 +396,30 @@ class ALNS:
         """
         # if we found a global best solution, we always accept
         if self.tempSolution.cost < self.bestCost:
+            if Parameters.localSearchOnBest:
+                self.localSearch.improve(self.tempSolution)
             self.bestCost = self.tempSolution.cost
             self.bestSolution = copy.deepcopy(self.tempSolution)
             self.currentSolution = copy.deepcopy(self.tempSolution)
             if self.verbose:
-                print(f"Found new global best solution using destroy operator {destroyOpNr} and repair operator {repairOpNr}")
+                print(f"Found new global best solution using destroy operator {destroyOpNr} and repair operator {repairOpNr}, "
+                      f"gap {self.lowerBound.gap(self.bestCost):.4f}")
             score = 2
-            Parameters.T = Parameters.Cool*Parameters.T
+            self.T = Parameters.Cool*self.T
 
             if plotIntermediateSolutions:
                 self.tempSolution.plotRoutes(f"ALNS Iteration {i}")
             return score
         
+        elif duplicate:
+            self.T = Parameters.Cool*self.T
+            return 0
+
         else:
             diff = self.tempSolution.cost - self.currentSolution.cost
-            prob = math.exp(-diff/Parameters.T)
+            prob = math.exp(-diff/self.T)
             p = self.randomGen.random()
-            Parameters.T = Parameters.Cool*Parameters.T
+            self.T = Parameters.Cool*self.T
             if p < prob:
                 self.currentSolution = copy.deepcopy(self.tempSolution)
                 score = 1
@@ -169,16 +439,15 @@ class ALNS:
         self.wDestroyOps = [i/sum(self.wDestroyOps) for i in self.wDestroyOps] #normalize the weights
         self.wRepairOps = [i/sum(self.wRepairOps) for i in self.wRepairOps] #normalize the weights
 
-        for i in range(self.nRepairOps):
-            self.wRepairOpsTrend[i].append(self.wRepairOps[i])
-
     
     def determineDestroyOpNr(self) -> int:
         """
         Method that determines the destroy operator that will be applied. 
-        Currently we just pick a random one with equal probabilities. 
-        Could be extended with weights
+        The destroy scheduler decides if there is one, otherwise the operator is
+        drawn with the weights divided by the mean operator time.
         """
+        if self.destroyScheduler is not None:
+            return self.destroyScheduler.select(self.randomGen)
         # if NOT all operators have been used at least once, we use the regular weights
         if 0 in self.nUsedDestroyOps:
              return self.randomGen.choices(range(1,self.nDestroyOps+1),weights=self.wDestroyOps,k=1)[0]
@@ -191,9 +460,11 @@ class ALNS:
     def determineRepairOpNr(self) -> int:
         """
         Method that determines the repair operator that will be applied. 
-        Currently we just pick a random one with equal probabilities. 
-        Could be extended with weights
+        The repair scheduler decides if there is one, otherwise the operator is
+        drawn with the weights divided by the mean operator time.
         """
+        if self.repairScheduler is not None:
+            return self.repairScheduler.select(self.randomGen)
         if 0 in self.nUsedRepairOps:
             return self.randomGen.choices(range(1,self.nRepairOps+1),weights=self.wRepairOps,k=1)[0]
         
@@ -214,33 +485,13 @@ class ALNS:
         sizeNBH : size of the neighborhood.
 
         """
-        #perform the destroy 
-        startTime_destroy = time.perf_counter() # precision timing
-        if destroyHeuristicNr == 1:
-            self.tempSolution.executeRandomRemoval(sizeNBH,self.randomGen, False)
-        elif destroyHeuristicNr == 2:
-            self.tempSolution.executeWorstRemoval(sizeNBH,self.randomGen, False, False)
-        elif destroyHeuristicNr == 3:
-            self.tempSolution.executeWorstRemoval(sizeNBH, self.randomGen, False, True)
-        else: # SHOWS POOR PERFORMANCE, NOT USED
-            self.tempSolution.executeRelatedRemoval(sizeNBH,self.randomGen, False)
-        tDestroy = time.perf_counter()-startTime_destroy
-
-        #perform the repair
-        startTime_repair = time.perf_counter() # precision timing
-        if repairHeuristicNr == 1:
-            self.tempSolution.executeRandomInsertion(self.randomGen)
-        elif repairHeuristicNr == 2:
-            self.tempSolution.executeGreedyInsertion(self.randomGen, True)
-        elif repairHeuristicNr == 3:
-            self.tempSolution.executeRegretInsertion(self.randomGen, True)
-        elif repairHeuristicNr == 4: # SHOWS POOR PERFORMANCE, NOT USED
-            self.tempSolution.executeRegretInsertion(self.randomGen, False)
-        else: # SHOWS POOR PERFORMANCE, NOT USED
-            self.tempSolution.executeGreedyInsertion(self.randomGen, False)
-            
-        tRepair = time.perf_counter()-startTime_repair
+        self.tDestroy, self.tRepair = applyOperators(self.tempSolution, destroyHeuristicNr, repairHeuristicNr, sizeNBH, self.rng)
+        self.recordOperatorTimes(destroyHeuristicNr, repairHeuristicNr, self.tDestroy, self.tRepair)
 
+    def recordOperatorTimes(self, destroyHeuristicNr: int, repairHeuristicNr: int, tDestroy: float, tRepair: float):
+        """
+        Method that updates the average run times of the operators with a new use
+        """
         #store average perform times (iterative expression)
         if self.nUsedDestroyOps[destroyHeuristicNr-1] == 0:
             self.tDestroyOps[destroyHeuristicNr-1] = tDestroy
@@ -249,6 +500,129 @@ class ALNS:
             self.tDestroyOps[destroyHeuristicNr-1] = (self.nUsedDestroyOps[destroyHeuristicNr-1]*self.tDestroyOps[destroyHeuristicNr-1] + tDestroy)/(self.nUsedDestroyOps[destroyHeuristicNr-1]+1)
             self.tRepairOps[repairHeuristicNr-1] = (self.nUsedRepairOps[repairHeuristicNr-1]*self.tRepairOps[repairHeuristicNr-1] + tRepair)/(self.nUsedRepairOps[repairHeuristicNr-1]+1)
 
+    def evaluateBatch(self, pool = None, shared = None) -> tuple[int, int]:
+        """
+        Method that generates Parameters.batchSize candidates from the current solution, each with its own
+        neighbourhood size, operator pair and random seed, and evaluates them in the worker pool or, without
+        a pool, in this process. The best candidate becomes tempSolution and is returned to execute, which
+        decides on its acceptance. The other candidates update the operator times, the schedulers and the
+        weights right away, with score 1 if they improve on the current solution and 0 otherwise.
+
+        Parameters
+        ----------
+        pool : the executor of the workers, None to evaluate the candidates in this process.
+        shared : the SharedProblem of the workers.
+
+        Returns
+        -------
+        destroyOpNr, repairOpNr : the operators of the best candidate.
+        """
+        candidates = []
+        for _ in range(Parameters.batchSize):
+            sizeNBH = self.randomGen.randint(Parameters.minSizeNBH,len(self.problem.locations)//2)
+            candidates.append((self.determineDestroyOpNr(), self.determineRepairOpNr(), sizeNBH, self.randomGen.getrandbits(32)))
+        if pool is None:
+            results = []
+            for destroyOpNr, repairOpNr, sizeNBH, seed in candidates:
+                solution = copy.deepcopy(self.currentSolution)
+                tDestroy, tRepair = applyOperators(solution, destroyOpNr, repairOpNr, sizeNBH, RandomService(seed))
+                solution.updateCost()
+                results.append((solution, solution.cost, tDestroy, tRepair))
+        else:
+            from Objects.SharedProblem import evaluateCandidate
+            currentData = self.currentSolution.toDict()
+            futures = [pool.submit(evaluateCandidate, shared.handle, currentData, *candidate) for candidate in candidates]
+            results = [future.result() for future in futures]
+        iBest = min(range(len(results)), key=lambda j: results[j][1])
+        for j, (destroyOpNr, repairOpNr, sizeNBH, seed) in enumerate(candidates):
+            solution, cost, tDestroy, tRepair = results[j]
+            self.recordOperatorTimes(destroyOpNr, repairOpNr, tDestroy, tRepair)
+            if j == iBest:
+                continue
+            if self.destroyScheduler is not None:
+                self.destroyScheduler.update(destroyOpNr, self.currentSolution.cost - cost, tDestroy)
+            if self.repairScheduler is not None:
+                self.repairScheduler.update(repairOpNr, self.currentSolution.cost - cost, tRepair)
+            # lambda decays once per iteration, with the update of the best candidate
+            self.updateWeights(destroyOpNr, repairOpNr, 1 if cost < self.currentSolution.cost else 0, decay=1.0)
+            self.nUsedDestroyOps[destroyOpNr-1] += 1
+            self.nUsedRepairOps[repairOpNr-1] += 1
+        solution, cost, self.tDestroy, self.tRepair = results[iBest]
+        self.tempSolution = solution if pool is None else Solution.fromDict(self.problem, solution)
+        return candidates[iBest][0], candidates[iBest][1]
+
+    def saveCheckpoint(self, fileName: str):
+        """
+        Method that saves the full state of the ALNS to a json file, so the run can be
+        continued with loadCheckpoint. The file is replaced atomically.
+        """
+        state = {"problem": self.problem.name,
+                 "nDestroyOps": self.nDestroyOps,
+                 "nRepairOps": self.nRepairOps,
+                 "parameters": {name: getattr(Parameters, name) for name in CHECKPOINT_PARAMETERS},
+                 "iteration": self.iteration,
+                 "T": self.T,
+                 "wLambda": self.wLambda,
+                 "randomState": self.rng.getstate(),
+                 "wDestroyOps": self.wDestroyOps,
+                 "tDestroyOps": self.tDestroyOps,
+                 "nUsedDestroyOps": self.nUsedDestroyOps,
+                 "wRepairOps": self.wRepairOps,
+                 "tRepairOps": self.tRepairOps,
+                 "nUsedRepairOps": self.nUsedRepairOps,
+                 "bestCost": self.bestCost,
+                 "currentSolution": self.currentSolution.toDict(),
+                 "bestSolution": self.bestSolution.toDict(),
+                 "solutionTrend": self.solutionTrend,
+                 "currentSolutionTrend": self.currentSolutionTrend,
+                 "bestSolutionTrend": self.bestSolutionTrend,
+                 "wRepairOpsTrend": self.wRepairOpsTrend,
+                 "destroyScheduler": self.destroyScheduler.getstate() if self.destroyScheduler is not None else None,
+                 "repairScheduler": self.repairScheduler.getstate() if self.repairScheduler is not None else None,
+                 "solutionCache": self.solutionCache.getstate(),
+                 "routePool": self.routePool.getstate() if self.routePool is not None else None}
+        with open(fileName + ".tmp", "w") as f:
+            json.dump(state, f, separators=(",", ":"))
+        os.replace(fileName + ".tmp", fileName)
+
+    def loadCheckpoint(problem, fileName: str, verbose: bool = False) -> "ALNS":
+        """
+        Method that restores an ALNS saved by saveCheckpoint. Calling execute on the result
+        continues the run where it stopped. Note that the Parameters of the run are restored too.
+        The resumed run only repeats the uninterrupted one exactly with Parameters.operatorTime
+        "evaluations": both schedulers weigh the operators by their run times, which differ between
+        runs when they are measured in seconds.
+
+        Parameters
+        ----------
+        problem : the problem instance of the run.
+        fileName : the checkpoint file.
+        verbose : print progress information.
+        """
+        with open(fileName) as f:
+            state = json.load(f)
+        if state["problem"] != problem.name:
+            raise ValueError(f"Checkpoint is for problem {state['problem']}, not {problem.name}")
+        for name, value in state["parameters"].items():
+            setattr(Parameters, name, value)
+        alns = ALNS(problem, state["nDestroyOps"], state["nRepairOps"], verbose)
+        alns.rng.setstate(state["randomState"])
+        alns.randomGen = alns.rng.random("alns")
+        for name in ("iteration", "T", "wLambda", "wDestroyOps", "tDestroyOps", "nUsedDestroyOps", "wRepairOps",
+                     "tRepairOps", "nUsedRepairOps", "bestCost", "solutionTrend", "currentSolutionTrend",
+                     "bestSolutionTrend", "wRepairOpsTrend"):
+            setattr(alns, name, state[name])
+        if alns.destroyScheduler is not None and state["destroyScheduler"] is not None:
+            alns.destroyScheduler.setstate(state["destroyScheduler"])
+        if alns.repairScheduler is not None and state["repairScheduler"] is not None:
+            alns.repairScheduler.setstate(state["repairScheduler"])
+        alns.solutionCache.setstate(state["solutionCache"])
+        if alns.routePool is not None and state.get("routePool") is not None:
+            alns.routePool.setstate(state["routePool"])
+        alns.currentSolution = Solution.fromDict(problem, state["currentSolution"])
+        alns.bestSolution = Solution.fromDict(problem, state["bestSolution"])
+        return alns
+
     def plotSolutionTrend(self):
         """
         Method that plots the solution trend
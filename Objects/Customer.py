@@ -2,7 +2,8 @@ from Objects.Location import Location
 
 class Customer:
     """
-    Class that represents a customer with its location and nodeID
+    Class that represents a customer with its location and nodeID. The delivery location
+    is the interned location of the customer node, so deliveryLoc.nodeID == ID.
 
     Attributes
     ----------
@@ -11,14 +12,25 @@ class Customer:
     ID : id of customer.
 
     """
+    __slots__ = ("deliveryLoc", "ID")
 
     def __init__(self, deliveryLoc: Location, ID: int):
 
         self.deliveryLoc = deliveryLoc
         self.ID = ID
 
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # customers are shared between solutions, only the served/notServed lists are copied
+        return self
+
+    def __reduce__(self):
+        return (Customer, (self.deliveryLoc, self.ID))
+
     def __str__(self):
         """
         Method that prints the customer ID and the delivery location
         """
-        return f"({self.ID} ,{self.deliveryLoc})"
\ No newline at end of file
+        return f"({self.ID} ,{self.deliveryLoc})"
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Satellite-cluster decomposition of the ALNS for very large instances
+"""
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import math
+import numpy as np
+import time
+from Objects.ALNS import ALNS, Parameters
+from Objects.Problem import TWO_E_CVRP
+from Objects.RandomService import RandomService
+from Objects.Route import Route
+from Objects.Solution import Solution
+from Objects.Sweep import SWEEP_PARAMETERS, setParameters
+
+
+def subProblem(problem: TWO_E_CVRP, satelliteIDs: list[int], customerIDs: list[int], name: str) -> tuple[TWO_E_CVRP, list[int]]:
+    """
+    Function that returns the problem restricted to all depots, the given satellites and customers.
+    The distance matrix is sliced from the full problem instead of being recomputed.
+
+    Returns
+    -------
+    sub : the sub-problem.
+    nodeMap : the nodeID in the full problem of every nodeID of the sub-problem.
+    """
+    nodeMap = [d.nodeID for d in problem.depots] + list(satelliteIDs) + list(customerIDs)
+    locations = [problem.locations[i] for i in nodeMap]
+    nD = len(problem.depots)
+    nS = len(satelliteIDs)
+    customerLoc = locations[nD+nS:]
+    customers = [problem.customers[i - nD - len(problem.satellites)] for i in customerIDs]
+    sub = TWO_E_CVRP(name, customers, customerLoc, locations[:nD], locations[nD:nD+nS],
+                     np.ascontiguousarray(problem.distMatrix[np.ix_(nodeMap, nodeMap)]), timeWindows=problem.timeWindows)
+    return sub, nodeMap
+
+
+def secondEchelonCost(problem, routes: list[Route]) -> float:
+    """
+    Function that returns the distance plus vehicle cost of second-echelon routes
+    """
+    return sum(route.distance for route in routes) + problem.cost_second*len(routes)
+
+
+def solveCluster(job: dict) -> dict:
+    """
+    Function that solves the second echelon of a sub-problem with the ALNS, used by the workers of Decomposition.
+    The ALNS minimises the total cost of the sub-problem, including a first echelon that is rebuilt later,
+    so the accepted solution with the cheapest second echelon is kept instead of the best solution. With a
+    warm start this is never more expensive than the prior routes.
+
+    Parameters
+    ----------
+    job : dict with the sub-problem, nodeMap, priorRoutes (node sequences and loads in the sub-problem
+        for a warm start, or None), params, seed, workerID, nDestroyOps and nRepairOps.
+
+    Returns
+    -------
+    result : dict with the best second-echelon routes as (nodeIDs of the full problem, loads),
+        their second-echelon cost and the run time.
+    """
+    start_time = time.perf_counter()
+    sub = job["problem"]
+    nodeMap = job["nodeMap"]
+    setParameters(job["params"], job["seed"])
+    alns = ALNS(sub, job["nDestroyOps"], job["nRepairOps"], workerID=job["workerID"])
+    best = {"cost": math.inf, "routes": []}
+
+    def keepBest(solution: Solution):
+        if len(solution.notServed) > 0:
+            return
+        routes = [route for route in solution.routes_2 if len(route.locations) > 2]
+        cost = secondEchelonCost(sub, routes)
+        if cost < best["cost"] - 1e-9:
+            best["cost"] = cost
+            best["routes"] = [([nodeMap[loc.nodeID] for loc in route.locations], list(route.servedLoad)) for route in routes]
+
+    if job["priorRoutes"] is not None:
+        routes = [Route([sub.locations[n] for n in nodes], sub, False, list(loads)) for nodes, loads in job["priorRoutes"]]
+        alns.constructWarmStartSolution(Solution(sub, routes, [], []))
+        keepBest(alns.currentSolution)
+    alns.execute(plotFinal=False, callback=lambda alns: keepBest(alns.currentSolution))
+    keepBest(alns.bestSolution)
+    return {"routes": best["routes"], "cost": best["cost"], "time": time.perf_counter() - start_time}
+
+
+class Decomposition:
+    """
+    Class that solves a large 2E-CVRP by decomposition. The customers are partitioned into
+    satellite-centred clusters with the distance matrix: every customer joins the nearest satellite
+    that can reach it, and clusters larger than maxClusterSize are split into angular sectors
+    around their satellite. The second echelon of every cluster is solved by an independent
+    sub-ALNS, in parallel. The routes are merged and the first echelon is built once.
+    Optional boundary-refinement rounds re-solve pairs of neighbouring clusters together, with
+    the routes that serve customers near their common border, so customers can change cluster.
+
+    Attributes
+    ----------
+    problem : the problem instance.
+    nDestroyOps : number of destroy operators of the sub-ALNS.
+    nRepairOps : number of repair operators of the sub-ALNS.
+    maxClusterSize : maximum number of customers in a cluster.
+    refinementRounds : number of boundary-refinement rounds.
+    nNeighbours : a customer is near a border if one of its nNeighbours nearest customers is in another cluster.
+    nWorkers : number of worker processes, 1 solves the clusters in this process.
+    verbose : print progress information.
+    clusters : list of (satellite nodeID, customer nodeIDs) per cluster.
+    routes : the current second-echelon routes as [cluster index, nodeIDs, loads].
+    """
+    def __init__(self, problem: TWO_E_CVRP, nDestroyOps: int, nRepairOps: int, maxClusterSize: int = 100,
+                 refinementRounds: int = 0, nNeighbours: int = 5, nWorkers: int = 1, verbose: bool = False):
+        self.problem = problem
+        self.nDestroyOps = nDestroyOps
+        self.nRepairOps = nRepairOps
+        self.maxClusterSize = maxClusterSize
+        self.refinementRounds = refinementRounds
+        self.nNeighbours = nNeighbours
+        self.nWorkers = nWorkers
+        self.verbose = verbose
+        self.clusters = []
+        self.routes = []
+
+    def clusterCustomers(self) -> list[tuple[int, list[int]]]:
+        """
+        Method that partitions the customers into satellite-centred clusters of at most maxClusterSize customers
+        """
+        D = self.problem.distMatrix
+        satIDs = [sat.nodeID for sat in self.problem.satellites]
+        members = {s: [] for s in satIDs}
+        for loc in self.problem.customerLoc:
+            # the nearest satellite that can reach the customer, else the nearest satellite
+            reaching = [s for s in satIDs if loc.nodeID in self.problem.satelliteReach[s]] or satIDs
+            members[min(reaching, key=lambda s: D[s, loc.nodeID])].append(loc.nodeID)
+        self.clusters = []
+        for s in satIDs:
+            if len(members[s]) == 0:
+                continue
+            sat = self.problem.locations[s]
+            # split large clusters into sectors of equal size around the satellite
+            byAngle = sorted(members[s], key=lambda c: math.atan2(self.problem.locations[c].yLoc - sat.yLoc,
+                                                                  self.problem.locations[c].xLoc - sat.xLoc))
+            nSectors = math.ceil(len(byAngle)/self.maxClusterSize)
+            size = math.ceil(len(byAngle)/nSectors)
+            for k in range(nSectors):
+                self.clusters.append((s, byAngle[k*size:(k+1)*size]))
+        return self.clusters
+
+    def runJobs(self, jobs: list[dict]) -> list[dict]:
+        """
+        Method that solves the sub-problem jobs, in parallel if nWorkers > 1
+        """
+        params = {name: getattr(Parameters, name) for name in SWEEP_PARAMETERS if name != "wLambda"}
+        seed = Parameters.randomSeed
+        for job in jobs:
+            job.update(params=params, seed=seed, nDestroyOps=self.nDestroyOps, nRepairOps=self.nRepairOps)
+        try:
+            if self.nWorkers == 1:
+                return [solveCluster(job) for job in jobs]
+            with ProcessPoolExecutor(max_workers=self.nWorkers) as pool:
+                return list(pool.map(solveCluster, jobs))
+        finally:
+            # the sub-ALNS runs changed the Parameters of this process
+            setParameters(params, seed)
+
+    def borderPairs(self) -> dict[tuple[int, int], set[int]]:
+        """
+        Method that returns, for every pair of neighbouring clusters, the customers near their border
+        """
+        clusterOf = {}
+        for iCluster, nodes, loads in self.routes:
+            for n in nodes[1:-1]:
+                clusterOf[n] = iCluster
+        custIDs = [loc.nodeID for loc in self.problem.customerLoc]
+        D = self.problem.distMatrix[np.ix_(custIDs, custIDs)]
+        k = min(self.nNeighbours + 1, len(custIDs))
+        nearest = np.argpartition(D, k-1, axis=1)[:, :k]
+        pairs = {}
+        for i, c in enumerate(custIDs):
+            for j in nearest[i]:
+                other = custIDs[j]
+                if clusterOf[other] != clusterOf[c]:
+                    pair = (min(clusterOf[c], clusterOf[other]), max(clusterOf[c], clusterOf[other]))
+                    pairs.setdefault(pair, set()).update((c, other))
+        return pairs
+
+    def refine(self, refined: set[tuple[int, int]]) -> int:
+        """
+        Method that performs one boundary-refinement round. Pairs of neighbouring clusters that were not
+        refined before are chosen, most border customers first, such that every cluster is in at most
+        one pair. The routes of a pair that visit border customers are re-solved together, warm started
+        from the current routes, and replaced if their second-echelon cost decreases.
+
+        Returns
+        -------
+        nPairs : number of pairs that were re-solved, 0 if all neighbouring pairs have been refined.
+        """
+        pairs = sorted(((len(border), pair, border) for pair, border in self.borderPairs().items() if pair not in refined),
+                       reverse=True)
+        used = set()
+        chosen = []
+        for _, pair, border in pairs:
+            if pair[0] in used or pair[1] in used:
+                continue
+            used.update(pair)
+            refined.add(pair)
+            chosen.append((pair, border))
+        jobs = []
+        selections = []
+        for iJob, (pair, border) in enumerate(chosen):
+            selected = [iRoute for iRoute, (iCluster, nodes, loads) in enumerate(self.routes)
+                        if iCluster in pair and not border.isdisjoint(nodes[1:-1])]
+            satIDs = sorted({self.routes[iRoute][1][0] for iRoute in selected})
+            custIDs = [n for iRoute in selected for n in self.routes[iRoute][1][1:-1]]
+            sub, nodeMap = subProblem(self.problem, satIDs, custIDs, f"{self.problem.name} border {pair}")
+            subID = {n: i for i, n in enumerate(nodeMap)}
+            prior = [([subID[n] for n in self.routes[iRoute][1]], self.routes[iRoute][2]) for iRoute in selected]
+            jobs.append({"problem": sub, "nodeMap": nodeMap, "priorRoutes": prior, "workerID": len(self.clusters) + iJob})
+            selections.append((pair, selected))
+        removed = set()
+        for (pair, selected), result in zip(selections, self.runJobs(jobs)):
+            old = secondEchelonCost(self.problem, [self.toRoute(*self.routes[iRoute][1:]) for iRoute in selected])
+            if result["cost"] < old - 1e-9:
+                removed.update(selected)
+                clusterOf = {n: self.routes[iRoute][0] for iRoute in selected for n in self.routes[iRoute][1][1:-1]}
+                for nodes, loads in result["routes"]:
+                    # a route joins the cluster of most of its customers
+                    iCluster = Counter(clusterOf[n] for n in nodes[1:-1]).most_common(1)[0][0]
+                    self.routes.append([iCluster, nodes, loads])
+            if self.verbose:
+                print(f"Refined clusters {pair}: second-echelon cost {old:.2f} -> {result['cost']:.2f}")
+        self.routes = [route for iRoute, route in enumerate(self.routes) if iRoute not in removed]
+        return len(chosen)
+
+    def toRoute(self, nodes: list[int], loads: list[int]) -> Route:
+        """
+        Method that returns the second-echelon route of the full problem with the given nodeIDs and loads
+        """
+        route = Route([self.problem.locations[n] for n in nodes], self.problem, False, list(loads))
+        nD = len(self.problem.depots) + len(self.problem.satellites)
+        route.customers = [self.problem.customers[n - nD] for n in nodes[1:-1]]
+        return route
+
+    def solve(self) -> Solution:
+        """
+        Method that solves the problem by decomposition
+
+        Returns
+        -------
+        solution : the merged solution with the first echelon built by greedy insertion.
+        """
+        start_time = time.perf_counter()
+        self.clusterCustomers()
+        jobs = []
+        for iCluster, (s, custIDs) in enumerate(self.clusters):
+            sub, nodeMap = subProblem(self.problem, [s], custIDs, f"{self.problem.name} cluster {iCluster}")
+            jobs.append({"problem": sub, "nodeMap": nodeMap, "priorRoutes": None, "workerID": iCluster})
+        self.routes = []
+        for iCluster, result in enumerate(self.runJobs(jobs)):
+            self.routes.extend([iCluster, nodes, loads] for nodes, loads in result["routes"])
+        if self.verbose:
+            print(f"Solved {len(self.clusters)} clusters in {time.perf_counter() - start_time:.1f} seconds")
+
+        refined = set()
+        for _ in range(self.refinementRounds):
+            if self.refine(refined) == 0:
+                break
+
+        # merge the routes and build the first echelon once
+        routes_2 = [self.toRoute(nodes, loads) for iCluster, nodes, loads in self.routes]
+        served = [cust for route in routes_2 for cust in route.customers]
+        solution = Solution(self.problem, routes_2, served, [])
+        solution.routes_1 = []
+        if Parameters.exactFirstEchelon:
+            solution.executeExactInsertionFirst()
+        else:
+            solution.executeGreedyInsertionFirst(RandomService(Parameters.randomSeed).random("decomposition"), False)
+        solution.computeCost()
+        if self.verbose:
+            print(f"Decomposition cost: {solution.cost}, time: {time.perf_counter() - start_time:.1f} seconds")
+        return solution
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Order-independent fingerprints of solutions, to recognise solutions that were seen before
+"""
+from collections import OrderedDict
+
+MASK = (1 << 64) - 1  # fingerprints are 64-bit integers
+
+
+def arcKey(i: int, j: int, firstEchelon: bool) -> int:
+    """
+    Function that returns the pseudo-random 64-bit key of the undirected arc between nodes i and j
+    of an echelon: the splitmix64 hash of the arc, so no table of keys has to be stored
+    """
+    if i > j:
+        i, j = j, i
+    x = (((i << 32) | j) << 1 | firstEchelon) + 0x9E3779B97F4A7C15
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+def routeFingerprint(route) -> int:
+    """
+    Function that returns the fingerprint of a route: the sum of the keys of its arcs modulo 2^64.
+    The fingerprint of a solution is the sum over its routes, so it does not depend on the order of
+    the routes or their direction and is updated in O(route length) when one route changes. A sum is
+    used instead of the xor of classic Zobrist hashing, since the arc of a single-customer route is
+    driven twice and would cancel out.
+    """
+    nodes = [loc.nodeID for loc in route.locations]
+    firstEchelon = route.isFirstEchelonRoute is True
+    return sum(arcKey(nodes[k-1], nodes[k], firstEchelon) for k in range(1, len(nodes))) & MASK
+
+
+class SolutionCache:
+    """
+    Class that remembers the cost of the most recently seen solutions by their fingerprint, as a
+    bounded LRU cache, and counts how many candidate solutions were seen before.
+
+    Attributes
+    ----------
+    maxSize : maximum number of fingerprints that are kept.
+    costs : the cost of each fingerprint, least recently seen first.
+    nLookups : number of checked solutions.
+    nDuplicates : number of checked solutions that were seen before.
+    """
+    def __init__(self, maxSize: int = 10000):
+        self.maxSize = maxSize
+        self.costs = OrderedDict()
+        self.nLookups = 0
+        self.nDuplicates = 0
+
+    def check(self, fingerprint: int, cost: float) -> bool:
+        """
+        Method that records a solution and returns True if it was seen before
+        """
+        self.nLookups += 1
+        if fingerprint in self.costs:
+            self.nDuplicates += 1
+            self.costs.move_to_end(fingerprint)
+            return True
+        self.costs[fingerprint] = cost
+        if len(self.costs) > self.maxSize:
+            self.costs.popitem(last=False)
+        return False
+
+    def get(self, fingerprint: int):
+        """
+        Method that returns the cost of a solution that was seen before, or None
+        """
+        return self.costs.get(fingerprint)
+
+    def duplicateRate(self) -> float:
+        return self.nDuplicates / self.nLookups if self.nLookups > 0 else 0.0
+
+    def __len__(self) -> int:
+        return len(self.costs)
+
+    def getstate(self) -> dict:
+        return {"costs": list(self.costs.items()), "nLookups": self.nLookups, "nDuplicates": self.nDuplicates}
+
+    def setstate(self, state: dict):
+        self.costs = OrderedDict((fingerprint, cost) for fingerprint, cost in state["costs"])
+        self.nLookups = state["nLookups"]
+        self.nDuplicates = state["nDuplicates"]
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Exact first echelon for the few satellites of a 2E-CVRP
+"""
+from collections import OrderedDict, deque
+import heapq
+import numpy as np
+
+
+class FirstEchelonSolver:
+    """
+    Class that builds a cheapest first echelon for given satellite demands, with split deliveries.
+
+    A route type is a subset of the satellites, driven from the depot with the shortest tour through
+    it. The tours of all subsets are computed once per problem by Held-Karp dynamic programming. A
+    multiset of route types can carry the demand iff, for every subset U of the satellites, at least
+    ceil(demand(U) / capacity) routes visit U (Hall's theorem), so the first echelon is a covering
+    problem over the 2^nS - 1 route types. Since the distances satisfy the triangle inequality there
+    is an optimal solution without split cycles (Dror and Trudeau, 1989): its routes that visit more
+    than one satellite form a hyperforest on the satellites. The hyperforests are enumerated once per
+    problem. For the demand of a call, every forest is completed with the fewest single-satellite
+    trips at once, and the forests for which that is not enough are completed by an A* search over
+    extra trips. The loads are then assigned to the vehicles by augmenting paths.
+
+    The number of hyperforests grows quickly with the number of satellites, so the solver is meant
+    for the instances with up to MAX_SATELLITES satellites.
+
+    Attributes
+    ----------
+    problem : the problem the first echelon belongs to.
+    tourCost : cost_first plus the length of the shortest depot tour of each subset (bitmask) of satellites.
+    tours : (depot index, satellite indices in tour order) of the shortest tour of each subset.
+    members : 0/1 matrix of the satellites (columns) in the subsets 1 .. 2^nS - 1 (rows).
+    forests : the hyperforests of route types that visit more than one satellite.
+    cache : the cheapest first echelon of the most recent satellite demands.
+    hits : number of calls answered from the cache.
+    misses : number of calls that were solved.
+    """
+    MAX_SATELLITES = 6
+
+    def __init__(self, problem, cacheSize: int = 10000):
+        self.problem = problem
+        nD = len(problem.depots)
+        nS = len(problem.satellites)
+        if nS > self.MAX_SATELLITES:
+            raise ValueError(f"The exact first echelon supports at most {self.MAX_SATELLITES} satellites, got {nS}")
+        self.nSatellites = nS
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.computeTours(nD, nS)
+        full = (1 << nS) - 1
+        # small integer counts are stored as floats, so the matrix products use BLAS
+        self.members = np.array([[U >> s & 1 for s in range(nS)] for U in range(1, full+1)], dtype=float)
+        self.singleCost = np.array([self.tourCost[1 << s] for s in range(nS)])
+        self.enumerateForests()
+        self.enumeratePartitions()
+        self.prepared = {}
+
+    def computeTours(self, nD: int, nS: int):
+        """
+        Method that computes the shortest depot tour of every subset of satellites by Held-Karp
+        dynamic programming per depot: path[mask][last] is the shortest path from the depot that
+        visits the satellites in mask and ends at satellite last.
+        """
+        D = self.problem.distList
+        sat = [s.nodeID for s in self.problem.satellites]
+        full = (1 << nS) - 1
+        self.tourCost = [0.0]*(full+1)
+        self.tours = [None]*(full+1)
+        for iDepot in range(nD):
+            depot = self.problem.depots[iDepot].nodeID
+            path = [[float("inf")]*nS for _ in range(full+1)]
+            parent = [[-1]*nS for _ in range(full+1)]
+            for s in range(nS):
+                path[1 << s][s] = D[depot][sat[s]]
+            for mask in range(1, full+1):
+                for last in range(nS):
+                    length = path[mask][last]
+                    if length == float("inf"):
+                        continue
+                    for nxt in range(nS):
+                        if mask >> nxt & 1:
+                            continue
+                        extended = length + D[sat[last]][sat[nxt]]
+                        if extended < path[mask | 1 << nxt][nxt]:
+                            path[mask | 1 << nxt][nxt] = extended
+                            parent[mask | 1 << nxt][nxt] = last
+            for mask in range(1, full+1):
+                last = min(range(nS), key=lambda s: path[mask][s] + D[sat[s]][depot])
+                length = path[mask][last] + D[sat[last]][depot] + self.problem.cost_first
+                if self.tours[mask] is None or length < self.tourCost[mask]:
+                    order = []
+                    m = mask
+                    while last >= 0:
+                        order.append(last)
+                        m, last = m ^ 1 << last, parent[m][last]
+                    self.tourCost[mask] = length
+                    self.tours[mask] = (iDepot, order[::-1])
+
+    def enumerateForests(self):
+        """
+        Method that enumerates the hyperforests of route types that visit more than one satellite:
+        sets of such types in which no two types are connected twice, tracked with the component of
+        every satellite. For every forest it stores the number of its routes that visit each subset,
+        its cost and the union of its satellites.
+        """
+        nS = self.nSatellites
+        full = (1 << nS) - 1
+        multi = [T for T in range(1, full+1) if T & (T-1)]
+        self.forests = []
+        component = list(range(nS))
+
+        def extend(start: int, chosen: list[int]):
+            self.forests.append(tuple(chosen))
+            for j in range(start, len(multi)):
+                T = multi[j]
+                satellites = [s for s in range(nS) if T >> s & 1]
+                roots = {component[s] for s in satellites}
+                if len(roots) < len(satellites):
+                    continue
+                saved = component[:]
+                for s in range(nS):
+                    if component[s] in roots:
+                        component[s] = satellites[0]
+                chosen.append(T)
+                extend(j+1, chosen)
+                chosen.pop()
+                component[:] = saved
+
+        extend(0, [])
+        subsets = np.arange(1, full+1)
+        self.forestTouch = np.array([[sum(1 for T in forest if T & U) for U in subsets] for forest in self.forests],
+                                    dtype=float).reshape(len(self.forests), full)
+        self.forestCost = np.array([sum(self.tourCost[T] for T in forest) for forest in self.forests])
+        self.forestUnion = np.array([np.bitwise_or.reduce(forest) if forest else 0 for forest in self.forests], dtype=np.int64)
+
+    def enumeratePartitions(self):
+        """
+        Method that enumerates the partitions of the satellites into subsets, as 0/1 rows over the
+        subsets. The extra single trips for subsets that are visited too little can be bounded from
+        below by the sum over the disjoint subsets of any partition.
+        """
+        partitions = [[]]
+        for s in range(self.nSatellites):
+            partitions = [blocks[:i] + [blocks[i] | 1 << s] + blocks[i+1:] for blocks in partitions for i in range(len(blocks))] \
+                         + [blocks + [1 << s] for blocks in partitions]
+        self.partitionMatrix = np.zeros((len(partitions), len(self.members)))
+        for row, blocks in enumerate(partitions):
+            self.partitionMatrix[row, [U-1 for U in blocks]] = 1
+
+    def extraBound(self, lack: np.ndarray, minSingle: np.ndarray) -> np.ndarray:
+        """
+        Method that returns a lower bound on the cost of the extra single trips, given by how many
+        routes each subset lacks (last axis of lack)
+        """
+        return ((np.maximum(lack, 0)*minSingle) @ self.partitionMatrix.T).max(axis=-1)
+
+    def prepare(self, active: int) -> tuple:
+        """
+        Method that returns the forests that only visit the satellites in active (bitmask), their
+        visits and costs, and for every subset the cost of the cheapest single trip to an active
+        satellite in it
+        """
+        if active not in self.prepared:
+            rows = np.flatnonzero((self.forestUnion & ~active) == 0)
+            minSingle = np.zeros(len(self.members))
+            for iU in range(len(self.members)):
+                options = [self.singleCost[s] for s in range(self.nSatellites) if (iU+1) >> s & active >> s & 1]
+                if options:
+                    minSingle[iU] = min(options)
+            self.prepared[active] = (rows, self.forestTouch[rows], self.forestCost[rows], minSingle)
+        return self.prepared[active]
+
+    def solve(self, demand: list[int]) -> list[tuple[int, list[int], list[int]]]:
+        """
+        Method that returns a cheapest first echelon for the demand of each satellite
+
+        Parameters
+        ----------
+        demand : the demand of each satellite.
+
+        Returns
+        -------
+        routes : list of (depot index, satellite indices in visiting order, load of each visited satellite).
+        """
+        key = tuple(demand)
+        routes = self.cache.get(key)
+        if routes is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return routes
+        self.misses += 1
+        routes = self.assignLoads(self.optimise(demand), demand)
+        self.cache[key] = routes
+        if len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+        return routes
+
+    def optimise(self, demand: list[int]) -> list[int]:
+        """
+        Method that returns the route types (bitmasks, repeated per vehicle) of a cheapest first echelon
+        """
+        nS = self.nSatellites
+        dem = np.array(demand, dtype=float)
+        active = sum(1 << s for s in range(nS) if demand[s] > 0)
+        if active == 0:
+            return []
+        rows, touch, cost, minSingle = self.prepare(active)
+        capacity = self.problem.capacity_first
+        need = np.ceil(self.members @ dem / capacity)
+        singles = [(1 << s) - 1 for s in range(nS)]
+        # fewest single trips of every forest, and the subsets that are still visited too little
+        trips = np.maximum(need[singles] - touch[:, singles], 0)
+        base = cost + trips @ self.singleCost
+        lack = need - touch - trips @ self.members.T
+        feasible = (lack <= 0).all(axis=1)
+        bestCost, best = float("inf"), None
+        if feasible.any():
+            k = np.flatnonzero(feasible)[base[feasible].argmin()]
+            bestCost, best = base[k], (k, trips[k])
+        # the other forests need extra single trips: A* search with extraBound over the extra trips
+        # of the forests that may still be better, in the order of their bound
+        bound = base + self.extraBound(lack, minSingle)
+        candidates = np.flatnonzero(~feasible & (bound < bestCost))
+        for k in candidates[np.argsort(bound[candidates], kind="stable")]:
+            if bound[k] >= bestCost:
+                break
+            heap = [(bound[k], base[k], tuple(trips[k]))]
+            seen = {heap[0][2]}
+            while heap:
+                estimate, c, x = heapq.heappop(heap)
+                if estimate >= bestCost:
+                    break
+                lacking = need - touch[k] - self.members @ np.array(x)
+                U = int(lacking.argmax())
+                if lacking[U] <= 0:
+                    bestCost, best = c, (k, np.array(x))
+                    break
+                # the bounds after one more single trip to each satellite
+                estimates = c + self.singleCost + self.extraBound(lacking - self.members.T, minSingle)
+                for s in range(nS):
+                    if (U+1) >> s & active >> s & 1 and estimates[s] < bestCost:
+                        y = x[:s] + (x[s]+1,) + x[s+1:]
+                        if y not in seen:
+                            seen.add(y)
+                            heapq.heappush(heap, (estimates[s], c + self.singleCost[s], y))
+        k, x = best
+        types = list(self.forests[rows[k]])
+        for s in range(nS):
+            types.extend([1 << s]*int(x[s]))
+        return types
+
+    def assignLoads(self, types: list[int], demand: list[int]) -> list[tuple[int, list[int], list[int]]]:
+        """
+        Method that splits the demand over vehicles of the given route types. Every unit of demand is
+        loaded on a vehicle with free capacity that visits its satellite, if needed after shifting
+        loads between vehicles along a shortest augmenting path. Satellites that get no load are
+        skipped, which does not make a tour longer by the triangle inequality.
+        """
+        capacity = self.problem.capacity_first
+        visits = [[s for s in self.tours[T][1]] for T in types]
+        free = [capacity]*len(types)
+        loads = [dict.fromkeys(sats, 0) for sats in visits]
+        vehiclesOf = [[v for v, sats in enumerate(visits) if s in sats] for s in range(self.nSatellites)]
+        for s, remaining in enumerate(demand):
+            while remaining > 0:
+                # breadth-first search from the vehicles that visit s to a vehicle with free capacity,
+                # moving along a load that a vehicle carries for a satellite another vehicle visits
+                previous = {v: None for v in vehiclesOf[s]}
+                queue = deque(vehiclesOf[s])
+                end = None
+                while queue:
+                    v = queue.popleft()
+                    if free[v] > 0:
+                        end = v
+                        break
+                    for t, load in loads[v].items():
+                        if load > 0 and t != s:
+                            for w in vehiclesOf[t]:
+                                if w not in previous:
+                                    previous[w] = (v, t)
+                                    queue.append(w)
+                if end is None:
+                    raise RuntimeError(f"The route types {types} cannot carry the demand {demand}")
+                path = []
+                v = end
+                while previous[v] is not None:
+                    path.append((previous[v][0], previous[v][1], v))
+                    v = previous[v][0]
+                amount = min([remaining, free[end]] + [loads[u][t] for u, t, w in path])
+                for u, t, w in path:
+                    loads[u][t] -= amount
+                    loads[w][t] += amount
+                loads[v][s] += amount
+                free[end] -= amount
+                remaining -= amount
+        routes = []
+        for T, sats, load in zip(types, visits, loads):
+            served = [s for s in sats if load[s] > 0]
+            if served:
+                routes.append((self.tours[T][0], served, [load[s] for s in served]))
+        return routes
+
+    def hitRate(self) -> float:
+        """
+        Method that returns the fraction of calls that were answered from the cache
+        """
+        calls = self.hits + self.misses
+        return self.hits / calls if calls > 0 else 0.0
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Local search on the second-echelon routes
+"""
+from collections import defaultdict
+from Objects.Route import Route
+
+EPS = 1e-9  # minimal improvement of a move
+
+
+class LocalSearch:
+    """
+    Class that improves the second-echelon routes of a solution with 2-opt, Or-opt (intra-route)
+    and relocate, swap (inter-route) moves. Every move is evaluated in O(1) from the distance
+    matrix and must respect the capacity and range_second. Inter-route moves are only made between
+    routes of the same satellite, so the satellite demands and the first-echelon routes stay valid.
+    If the problem has time windows, an improving move is only applied if the changed routes still
+    respect them, which is checked in O(route length).
+
+    Attributes
+    ----------
+    problem : the problem instance.
+    firstImprovement : True to apply the first improving move that is found, False to apply
+        the best move of a neighbourhood.
+    operators : the neighbourhoods to use, in order: "twoOpt", "orOpt", "relocate" and/or "swap".
+    maxPasses : maximum number of passes over all neighbourhoods per call.
+    nCalls : number of calls of improve.
+    nImprovements : number of improving moves applied.
+    """
+    def __init__(self, problem, firstImprovement: bool = True, operators: list[str] = ("twoOpt", "orOpt", "relocate", "swap"),
+                 maxPasses: int = 50):
+        self.problem = problem
+        self.firstImprovement = firstImprovement
+        self.operators = list(operators)
+        self.maxPasses = maxPasses
+        self.nCalls = 0
+        self.nImprovements = 0
+        self.dist = problem.distList
+        self.demand = [loc.demand for loc in problem.locations]
+        self.locations = problem.locations
+
+    def improve(self, solution) -> bool:
+        """
+        Method that applies local search to the second-echelon routes of a solution until no
+        improving move is left. The solution is updated in place, including its cost.
+
+        Returns
+        -------
+        improved : True if the solution was improved.
+        """
+        self.nCalls += 1
+        routes = [[loc.nodeID for loc in route.locations] for route in solution.routes_2 if len(route.locations) > 2]
+        loads = [sum(self.demand[n] for n in nodes[1:-1]) for nodes in routes]
+        dists = [sum(self.dist[nodes[i-1]][nodes[i]] for i in range(1, len(nodes))) for nodes in routes]
+        nMoves = 0
+        for _ in range(self.maxPasses):
+            improved = False
+            for operator in self.operators:
+                while self.applyMove(operator, routes, loads, dists):
+                    improved = True
+                    nMoves += 1
+            if not improved:
+                break
+        if nMoves == 0:
+            return False
+
+        # rebuild the routes from the node sequences
+        customers = {cust.ID: cust for cust in solution.served}
+        newRoutes = []
+        for nodes in routes:
+            if len(nodes) <= 2:
+                continue
+            locations = [self.problem.locations[n] for n in nodes]
+            route = Route(locations, self.problem, False, [self.demand[n] for n in nodes[1:-1]])
+            if not route.feasible:
+                # rounding pushed a route over the range, keep the old solution
+                return False
+            route.customers = [customers[n] for n in nodes[1:-1]]
+            newRoutes.append(route)
+        for route in solution.routes_2:
+            solution.trackRoute(route, False, -1)
+        for route in newRoutes:
+            solution.trackRoute(route, False)
+        solution.routes_2 = newRoutes
+        solution.updateCost()
+        self.nImprovements += nMoves
+        return True
+
+    def applyMove(self, operator: str, routes: list[list[int]], loads: list[int], dists: list[float]) -> bool:
+        """
+        Method that applies the first or the best improving move of a neighbourhood
+
+        Parameters
+        ----------
+        operator : name of the neighbourhood.
+        routes : node sequences of the routes.
+        loads : load of each route.
+        dists : distance of each route.
+
+        Returns
+        -------
+        applied : True if an improving move was found and applied.
+        """
+        moves = getattr(self, operator + "Moves")(routes, loads, dists)
+        if self.problem.timeWindows:
+            moves = (move for move in moves if self.keepsWindows(operator, routes, move))
+        if self.firstImprovement:
+            move = next(moves, None)
+        else:
+            move = min(moves, key=lambda m: m[0], default=None)
+        if move is None:
+            return False
+        getattr(self, operator + "Apply")(routes, loads, dists, *move)
+        return True
+
+    def keepsWindows(self, operator: str, routes: list[list[int]], move: tuple) -> bool:
+        """
+        Method that returns True if the routes changed by a move still respect the time windows
+        """
+        touched = {move[1]} if operator in ("twoOpt", "orOpt") else {move[1], move[3]}
+        # apply the move to copies of the touched routes, loads and distances are not needed
+        trial = {r: list(routes[r]) for r in touched}
+        getattr(self, operator + "Apply")(trial, defaultdict(int), defaultdict(float), *move)
+        return all(self.windowsFeasible(trial[r]) for r in touched)
+
+    def windowsFeasible(self, nodes: list[int]) -> bool:
+        """
+        Method that returns True if every service of a node sequence starts within its time window
+        """
+        D = self.dist
+        time = 0.0
+        for k in range(1, len(nodes)):
+            prev, cur = self.locations[nodes[k-1]], self.locations[nodes[k]]
+            time = max(cur.windowStart, time + prev.servTime + D[prev.nodeID][cur.nodeID])
+            if time > cur.windowEnd:
+                return False
+        return True
+
+    def twoOptMoves(self, routes, loads, dists):
+        """
+        Generator of the improving reversals (delta, r, i, j) of segment i..j in route r
+        """
+        D = self.dist
+        for r, a in enumerate(routes):
+            for i in range(1, len(a)-2):
+                for j in range(i+1, len(a)-1):
+                    delta = D[a[i-1]][a[j]] + D[a[i]][a[j+1]] - D[a[i-1]][a[i]] - D[a[j]][a[j+1]]
+                    if delta < -EPS:
+                        yield delta, r, i, j
+
+    def twoOptApply(self, routes, loads, dists, delta, r, i, j):
+        routes[r][i:j+1] = routes[r][i:j+1][::-1]
+        dists[r] += delta
+
+    def orOptMoves(self, routes, loads, dists):
+        """
+        Generator of the improving moves (delta, r, i, L, k) of the segment of L customers starting at i
+        to the position after k in the same route r
+        """
+        D = self.dist
+        for r, a in enumerate(routes):
+            n = len(a)
+            for L in range(1, 4):
+                for i in range(1, n-L):
+                    first, last = a[i], a[i+L-1]
+                    removal = D[a[i-1]][a[i+L]] - D[a[i-1]][first] - D[last][a[i+L]]
+                    if removal >= -EPS:
+                        continue
+                    for k in range(n-1):
+                        if i-1 <= k <= i+L-1:
+                            continue
+                        delta = removal + D[a[k]][first] + D[last][a[k+1]] - D[a[k]][a[k+1]]
+                        if delta < -EPS:
+                            yield delta, r, i, L, k
+
+    def orOptApply(self, routes, loads, dists, delta, r, i, L, k):
+        a = routes[r]
+        segment = a[i:i+L]
+        del a[i:i+L]
+        pos = k+1 if k < i else k+1-L
+        a[pos:pos] = segment
+        dists[r] += delta
+
+    def relocateMoves(self, routes, loads, dists):
+        """
+        Generator of the improving moves (delta, r1, i, r2, k) of customer i of route r1 to the position
+        after k in route r2 of the same satellite. Emptying a route also saves its vehicle cost.
+        """
+        D = self.dist
+        capacity = self.problem.capacity_second
+        maxRange = self.problem.range_second
+        for r1, a in enumerate(routes):
+            for i in range(1, len(a)-1):
+                c = a[i]
+                removal = D[a[i-1]][a[i+1]] - D[a[i-1]][c] - D[c][a[i+1]]
+                if len(a) == 3:
+                    removal -= self.problem.cost_second
+                for r2, b in enumerate(routes):
+                    if r2 == r1 or len(b) <= 2 or b[0] != a[0] or loads[r2] + self.demand[c] > capacity:
+                        continue
+                    for k in range(len(b)-1):
+                        insertion = D[b[k]][c] + D[c][b[k+1]] - D[b[k]][b[k+1]]
+                        if removal + insertion < -EPS and dists[r2] + insertion <= maxRange:
+                            yield removal + insertion, r1, i, r2, k
+
+    def relocateApply(self, routes, loads, dists, delta, r1, i, r2, k):
+        D = self.dist
+        a, b = routes[r1], routes[r2]
+        c = a[i]
+        dists[r1] += D[a[i-1]][a[i+1]] - D[a[i-1]][c] - D[c][a[i+1]]
+        dists[r2] += D[b[k]][c] + D[c][b[k+1]] - D[b[k]][b[k+1]]
+        del a[i]
+        b.insert(k+1, c)
+        loads[r1] -= self.demand[c]
+        loads[r2] += self.demand[c]
+
+    def swapMoves(self, routes, loads, dists):
+        """
+        Generator of the improving exchanges (delta, r1, i, r2, j) of customer i of route r1 and
+        customer j of route r2 of the same satellite
+        """
+        D = self.dist
+        capacity = self.problem.capacity_second
+        maxRange = self.problem.range_second
+        for r1, a in enumerate(routes):
+            for r2 in range(r1+1, len(routes)):
+                b = routes[r2]
+                if b[0] != a[0]:
+                    continue
+                for i in range(1, len(a)-1):
+                    c1 = a[i]
+                    for j in range(1, len(b)-1):
+                        c2 = b[j]
+                        diff = self.demand[c2] - self.demand[c1]
+                        if loads[r1] + diff > capacity or loads[r2] - diff > capacity:
+                            continue
+                        delta1 = D[a[i-1]][c2] + D[c2][a[i+1]] - D[a[i-1]][c1] - D[c1][a[i+1]]
+                        delta2 = D[b[j-1]][c1] + D[c1][b[j+1]] - D[b[j-1]][c2] - D[c2][b[j+1]]
+                        if delta1 + delta2 < -EPS and dists[r1] + delta1 <= maxRange and dists[r2] + delta2 <= maxRange:
+                            yield delta1 + delta2, r1, i, r2, j
+
+    def swapApply(self, routes, loads, dists, delta, r1, i, r2, j):
+        D = self.dist
+        a, b = routes[r1], routes[r2]
+        c1, c2 = a[i], b[j]
+        dists[r1] += D[a[i-1]][c2] + D[c2][a[i+1]] - D[a[i-1]][c1] - D[c1][a[i+1]]
+        dists[r2] += D[b[j-1]][c1] + D[c1][b[j+1]] - D[b[j-1]][c2] - D[c2][b[j+1]]
+        diff = self.demand[c2] - self.demand[c1]
+        a[i], b[j] = c2, c1
+        loads[r1] += diff
+        loads[r2] -= diff
@@ -1,9 +1,12 @@
-from math import sqrt
+from math import inf, sqrt
 
 class Location:
     """
     Class that represents either (i) a location where a customer should be delivered
-    (ii) the depot for the first-echelon vehicles (iii) satellites for the second-echelon vehicles
+    (ii) the depot for the first-echelon vehicles (iii) satellites for the second-echelon vehicles.
+    Locations are immutable and interned by the problem: there is exactly one Location
+    object per node, which is shared by all routes and solutions.
+
     Attributes
     ----------
     xLoc : int
@@ -13,21 +16,45 @@ class Location:
     demand : int
         demand quantity. For depot and satellites, demand is 0.
     servTime : int
-        service time. (Extra. Don't consider in the problem)
+        service time, only considered when the problem has time windows.
     typeLoc : int
         1 if satellites, -1 if customers, 0 if depot
     nodeID : int
         id of the node, used for the distance matrix
+    windowStart : int
+        earliest start of the service, 0 if the location has no time window.
+    windowEnd : int
+        latest start of the service, inf if the location has no time window.
     """
+    __slots__ = ("xLoc", "yLoc", "demand", "servTime", "typeLoc", "nodeID", "windowStart", "windowEnd")
+
+    def __init__(self, xLoc, yLoc, demand, servTime, typeLoc, nodeID, windowStart=0, windowEnd=inf):
+
+        object.__setattr__(self, "xLoc", xLoc)
+        object.__setattr__(self, "yLoc", yLoc)
+        object.__setattr__(self, "demand", demand)
+        object.__setattr__(self, "servTime", servTime)
+        object.__setattr__(self, "typeLoc", typeLoc)
+        object.__setattr__(self, "nodeID", nodeID)
+        object.__setattr__(self, "windowStart", windowStart)
+        object.__setattr__(self, "windowEnd", windowEnd)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Location is immutable, cannot set {name}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Location is immutable, cannot delete {name}")
 
-    def __init__(self, xLoc, yLoc, demand, servTime, typeLoc, nodeID):
+    def __copy__(self):
+        return self
 
-        self.xLoc = xLoc
-        self.yLoc = yLoc
-        self.demand = demand
-        self.servTime = servTime
-        self.typeLoc = typeLoc
-        self.nodeID = nodeID
+    def __deepcopy__(self, memo):
+        # interned: copies of routes and solutions share the same location objects
+        return self
+
+    def __reduce__(self):
+        return (Location, (self.xLoc, self.yLoc, self.demand, self.servTime, self.typeLoc, self.nodeID,
+                           self.windowStart, self.windowEnd))
 
     def __str__(self):
         """
@@ -35,10 +62,20 @@ class Location:
         """
         return f"({self.nodeID} ,{self.typeLoc})"
 
+    def withNodeID(self, nodeID: int) -> "Location":
+        """
+        Method that returns this location with another nodeID. Returns self if the nodeID
+        is unchanged, else a new location.
+        """
+        if nodeID == self.nodeID:
+            return self
+        return Location(self.xLoc, self.yLoc, self.demand, self.servTime, self.typeLoc, nodeID,
+                        self.windowStart, self.windowEnd)
+
     def getDistance(l1,l2):
         """
         Method that computes the rounded euclidian distance between two locations
         """
         dx = l1.xLoc-l2.xLoc
         dy = l1.yLoc-l2.yLoc
-        return sqrt(dx**2+dy**2)
\ No newline at end of file
+        return sqrt(dx**2+dy**2)
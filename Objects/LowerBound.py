@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Cheap lower bounds on the cost of the solutions of a 2E-CVRP
+"""
+import math
+import numpy as np
+
+
+def binPackingBound(sizes: list[int], capacity: int) -> int:
+    """
+    Function that returns the Martello-Toth L2 lower bound on the number of bins of the given capacity
+    that are needed to pack items of the given sizes. It is at least ceil(sum(sizes)/capacity).
+    """
+    sizes = [size for size in sizes if size > 0]
+    best = math.ceil(sum(sizes) / capacity)
+    for K in {size for size in sizes if size <= capacity/2} | {0}:
+        # items larger than capacity-K cannot share a bin with an item of size K or more
+        large = sum(1 for size in sizes if size > capacity - K)
+        medium = [size for size in sizes if capacity/2 < size <= capacity - K]
+        small = sum(size for size in sizes if K <= size <= capacity/2)
+        free = len(medium)*capacity - sum(medium)
+        best = max(best, large + len(medium) + max(0, math.ceil((small - free) / capacity)))
+    return best
+
+
+def spanningTreeLength(weights: np.ndarray) -> float:
+    """
+    Function that returns the length of a minimum spanning tree of a complete graph, given its
+    matrix of edge weights, with Prim's algorithm in O(n^2)
+    """
+    n = len(weights)
+    inTree = np.zeros(n, dtype=bool)
+    inTree[0] = True
+    nearest = weights[0].copy()
+    length = 0.0
+    for _ in range(n-1):
+        nearest[inTree] = np.inf
+        j = int(np.argmin(nearest))
+        length += nearest[j]
+        inTree[j] = True
+        nearest = np.minimum(nearest, weights[j])
+    return length
+
+
+class LowerBound:
+    """
+    Class that computes a lower bound on the cost of every feasible solution of a TWO_E_CVRP in
+    O(n^2), as the sum of
+    - the handling cost: every unit of demand is handled once at a satellite.
+    - the first echelon: at least vehicles_1 vehicles, since deliveries to a satellite may be split,
+      each driving at least the round trip to the nearest satellite of a depot.
+    - the second echelon: at least vehicles_2 vehicles (Martello-Toth bound on the customer demands)
+      and the larger of two distance bounds:
+      the degree bound: every customer is entered and left once, so half of its two shortest edges to
+      other customers or reaching satellites is driven for it.
+      the spanning-tree bound: without its last arc every route is a path from its satellite, so the
+      routes span the customers and the satellites (merged into one node) and the removed arcs are at
+      least the shortest satellite-customer edge each.
+    Time windows and the range are relaxed, so the bound is valid with them as well.
+
+    Attributes
+    ----------
+    problem : the problem instance.
+    handling : handling cost of the total demand.
+    vehicles_1, vehicles_2 : minimum number of vehicles per echelon.
+    distance_1, distance_2 : minimum distance per echelon.
+    degreeBound, treeBound : the two distance bounds of the second echelon.
+    value : the lower bound on the cost.
+    """
+    def __init__(self, problem):
+        self.problem = problem
+        demands = [loc.demand for loc in problem.customerLoc]
+        totalDemand = sum(demands)
+        self.handling = problem.cost_handling * totalDemand
+        self.vehicles_1 = math.ceil(totalDemand / problem.capacity_first)
+        self.vehicles_2 = binPackingBound(demands, problem.capacity_second)
+
+        D = problem.distMatrix
+        depotIDs = [d.nodeID for d in problem.depots]
+        satIDs = [s.nodeID for s in problem.satellites]
+        custIDs = [c.nodeID for c in problem.customerLoc]
+        self.distance_1 = self.vehicles_1 * 2 * D[np.ix_(depotIDs, satIDs)].min()
+
+        # shortest edge of each customer to a satellite that reaches it
+        satDist = D[np.ix_(satIDs, custIDs)]
+        reaches = np.array([[c in problem.satelliteReach[s] for c in custIDs] for s in satIDs], dtype=bool)
+        reaches[:, ~reaches.any(axis=0)] = True
+        satEdge = np.where(reaches, satDist, np.inf).min(axis=0)
+        custDist = D[np.ix_(custIDs, custIDs)].copy()
+        np.fill_diagonal(custDist, np.inf)
+
+        # the satellite edge may be used twice, by a route with a single customer
+        n = len(custIDs)
+        if n > 1:
+            twoShortest = np.partition(np.column_stack([custDist, satEdge, satEdge]), 1, axis=1)[:, :2]
+        else:
+            twoShortest = np.column_stack([satEdge, satEdge])
+        self.degreeBound = float(twoShortest.sum()) / 2
+        weights = np.full((n+1, n+1), np.inf)
+        weights[:n, :n] = custDist
+        weights[n, :n] = weights[:n, n] = satEdge
+        self.treeBound = spanningTreeLength(weights) + self.vehicles_2 * float(satEdge.min())
+        self.distance_2 = max(self.degreeBound, self.treeBound)
+
+        self.value = float(self.handling + self.distance_1 + self.distance_2 + problem.cost_first*self.vehicles_1
+                           + problem.cost_second*self.vehicles_2)
+
+    def gap(self, cost: float) -> float:
+        """
+        Method that returns the relative gap (cost - bound) / cost of the cost of a solution
+        """
+        return (cost - self.value) / cost if cost > 0 else 0.0
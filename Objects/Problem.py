@@ -3,12 +3,18 @@
 @author: Original template by Rolf van Lieshout and Krissada Tundulyasaree
 """
 
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import numpy as np
+import json
+import math
+import os
 import sys
 import time
-from Objects.ALNS import ALNS
+from Objects.ALNS import ALNS, Parameters
 from Objects.Customer import Customer
+from Objects.FirstEchelon import FirstEchelonSolver
 from Objects.Location import Location
+from Objects.Route import RouteCache, RANGE_TOLERANCE
 import matplotlib.pyplot as plt
         
 class TWO_E_CVRP: 
@@ -28,43 +34,53 @@ class TWO_E_CVRP:
     capacity_second : second-echelon vehicle capacity
     cost_second : second-echelon vehicle cost
     cost_handling : handling fee per transshiped unit at satellite     
+    routeCache : memoised route evaluations, shared by all solutions of this problem
+    distList : the distance matrix as nested lists, for fast scalar lookups
+    satelliteReach : dict that maps the nodeID of each satellite to the set of customer nodeIDs
+        that can be visited from it within range_second
+    firstEchelonSolver : exact first-echelon solver, built by getFirstEchelonSolver when first needed
+    neighbours : neighbour lists of the customers, built by getNeighbours when first needed
+    timeWindows : True if the second-echelon routes must respect the time windows of the customers.
+        A vehicle starts at its satellite at time 0, leaves after the service time of the satellite, drives one
+        distance unit per time unit, may wait for the start of a window and serves every customer
+        for its service time. The first echelon is not synchronised with these times.
+
+    A precomputed distMatrix (and distList) can be passed, e.g. a read-only view of shared memory
+    made by Objects.SharedProblem, so the matrix is neither recomputed nor copied.
     """         
-    def __init__(self,name: str, customers: list[Customer], customerLoc: list[Location], depots: list[Location], satellites: list[Location]):
+    def __init__(self,name: str, customers: list[Customer], customerLoc: list[Location], depots: list[Location], satellites: list[Location],
+                 distMatrix: np.ndarray = None, distList: list = None, timeWindows: bool = False):
         self.name = name
-        self.customerLoc = customerLoc
-        self.depots = depots
-        self.satellites = satellites
-        self.customers = customers
-        #construct the set for all location
-        self.locations = set()
-        count = 0
-        for d in self.depots:
-            d.nodeID = count
-            self.locations.add(d)
-            count+=1
-        for s in self.satellites:
-            s.nodeID = count
-            self.locations.add(s)
-            count+=1
-        for c in self.customerLoc:
-            c.nodeID = count
-            self.locations.add(c)
-            count+=1
+        # intern one location per node: depots, satellites and customers are numbered in this order
+        # and locations with another nodeID are replaced by a relabelled copy
+        nD = len(depots)
+        nS = len(satellites)
+        self.depots = [d.withNodeID(i) for i, d in enumerate(depots)]
+        self.satellites = [s.withNodeID(nD+i) for i, s in enumerate(satellites)]
+        self.customerLoc = [c.withNodeID(nD+nS+i) for i, c in enumerate(customerLoc)]
+        # customers are given in the same order as customerLoc and share its location
+        self.customers = []
+        for cust, loc in zip(customers, self.customerLoc):
+            if cust.deliveryLoc is not loc or cust.ID != loc.nodeID:
+                cust = Customer(loc, loc.nodeID)
+            self.customers.append(cust)
+        #construct the list of all locations, indexed by nodeID
+        self.locations = self.depots + self.satellites + self.customerLoc
         #compute the distance matrix 
-        nD = len(self.depots)
-        nS = len(self.satellites)
-        nC = len(self.customerLoc)
-        self.distMatrix = np.zeros((len(self.locations),len(self.locations))) #init as nxn matrix
-        for i in self.locations:
-            for j in self.locations:
-                # No connection between Depot and customers
-                case_1 = i.nodeID < nD and j.nodeID >= nD + nS
-                case_2 = i.nodeID > nD + nS and j.nodeID < nD
-                if case_1 or case_2 :
-                    distItoJ = sys.maxsize
-                else:
-                    distItoJ = Location.getDistance(i,j)
-                self.distMatrix[i.nodeID,j.nodeID] = distItoJ
+        if distMatrix is not None:
+            self.distMatrix = distMatrix
+        else:
+            self.distMatrix = np.zeros((len(self.locations),len(self.locations))) #init as nxn matrix
+            for i in self.locations:
+                for j in self.locations:
+                    # No connection between Depot and customers
+                    case_1 = i.nodeID < nD and j.nodeID >= nD + nS
+                    case_2 = i.nodeID > nD + nS and j.nodeID < nD
+                    if case_1 or case_2 :
+                        distItoJ = sys.maxsize
+                    else:
+                        distItoJ = Location.getDistance(i,j)
+                    self.distMatrix[i.nodeID,j.nodeID] = distItoJ
         # define problem instance attribute
         # note: These values are based on the Readme-Set8.txt except the cost_handling
         self.capacity_first = 200
@@ -73,11 +89,68 @@ class TWO_E_CVRP:
         self.cost_second = 25 
         self.cost_handling = 5 
         self.range_second = 200
+        self.routeCache = RouteCache()
+        self.firstEchelonSolver = None
+        self.neighbours = None
+        self.timeWindows = timeWindows
+        self.distList = self.distMatrix.tolist() if distList is None else distList
+        self.computeSatelliteReach()
+
+    def computeSatelliteReach(self):
+        """
+        Method that computes for each satellite which customers it can reach. By the triangle
+        inequality, every second-echelon route that visits customer c from satellite s is at
+        least as long as the round trip s-c-s, and with time windows it cannot arrive at c
+        earlier than by driving there directly.
+        """
+        self.satelliteReach = {}
+        for s in self.satellites:
+            self.satelliteReach[s.nodeID] = {c.nodeID for c in self.customerLoc
+                                             if self.distList[s.nodeID][c.nodeID] + self.distList[c.nodeID][s.nodeID] <= self.range_second + RANGE_TOLERANCE
+                                             and (not self.timeWindows or s.servTime + self.distList[s.nodeID][c.nodeID] <= c.windowEnd)}
+
+    def reachingSatellites(self, c: int) -> list[Location]:
+        """
+        Method that returns the satellites whose satelliteReach contains the customer with nodeID c,
+        in the order of satellites. All satellites are returned if none reaches it.
+        """
+        reaching = [s for s in self.satellites if c in self.satelliteReach[s.nodeID]]
+        return reaching if reaching else self.satellites
   
+    def getFirstEchelonSolver(self) -> FirstEchelonSolver:
+        """
+        Method that returns the exact first-echelon solver of this problem, its tours and cache are
+        shared by all solutions
+        """
+        if self.firstEchelonSolver is None:
+            self.firstEchelonSolver = FirstEchelonSolver(self)
+        return self.firstEchelonSolver
+
+    def getNeighbours(self) -> dict[int, list[int]]:
+        """
+        Method that returns for the nodeID of every customer the nodeIDs of the other customers by
+        increasing distance. The lists are shared by all solutions.
+        """
+        if self.neighbours is None:
+            custIDs = [c.nodeID for c in self.customerLoc]
+            order = np.argsort(self.distMatrix[np.ix_(custIDs, custIDs)], axis=1, kind="stable")
+            self.neighbours = {c: [custIDs[j] for j in row if j != i] for i, (c, row) in enumerate(zip(custIDs, order.tolist()))}
+        return self.neighbours
+
+    def __deepcopy__(self, memo):
+        # the problem is read-only data shared by all solutions, so it is never copied
+        return self
+
     def __str__(self):
         return f" 2E-CVRP problem {self.name} with {len(self.customerLoc)} customers "
 
-    def readInstance(fileName: str, dir: str = "Must") -> "TWO_E_CVRP":
+    def readInstance(fileName: str, dir: str = "Must", timeWindows: bool = None) -> "TWO_E_CVRP":
+        """
+        Method that reads an instance file. The time windows of the customers are always read, they
+        are only respected if timeWindows is True, which defaults to Parameters.timeWindows.
+        """
+        if timeWindows is None:
+            timeWindows = Parameters.timeWindows
         # Read filename
         instance_name = fileName[:-4]
         n_depots = int(instance_name[4])
@@ -87,8 +160,7 @@ class TWO_E_CVRP:
         f = open(f"Instances/{dir}/{fileName}")
 
         n_line = 0  # count number of line
-        nodeID = 0  # init at 0 for all locations, updated later
-        custID = n_depots + n_satellites  # init at n_depots + n_satellites for all customers, updated later
+        custID = n_depots + n_satellites  # customers are numbered after the depots and satellites
         customerLoc = []  # store customers-location object
         depots = []  # store the depot location object
         satellites = []  # store the satellite location object
@@ -99,60 +171,190 @@ class TWO_E_CVRP:
             for index in range(0, len(line), n):
                 asList.append(line[index: index + n].strip())
 
-            if line:
+            if line.strip():
                 x = int(asList[0])  # need to remove ".0" from the string
                 y = int(asList[1])
 
                 if n_line < n_customers:  # For customers
+                    windowStart = int(asList[2])
+                    windowEnd = int(asList[3])
                     demand = int(asList[4])
                     servTime = int(asList[5])
                     typeLoc = -1
-                    customerLoc.append(
-                        Location(x, y, demand, servTime, typeLoc, nodeID))
-                    cust = Customer(
-                        Location(x, y, demand, servTime, typeLoc, custID), custID)
-                    customers.append(cust)
+                    # one location per customer, shared by customerLoc and the customer
+                    loc = Location(x, y, demand, servTime, typeLoc, custID, windowStart, windowEnd)
+                    customerLoc.append(loc)
+                    customers.append(Customer(loc, custID))
                     custID += 1
                 elif n_line >= n_customers and n_line < n_customers + n_satellites:  # For satellites
                     demand = 0
                     servTime = int(asList[2])
                     typeLoc = 1
                     satellites.append(
-                        Location(x, y, demand, servTime, typeLoc, nodeID))
+                        Location(x, y, demand, servTime, typeLoc, n_depots + len(satellites)))
                 elif n_line >= n_customers + n_satellites:  # Multiple Depots
                     demand = 0
                     servTime = int(asList[2])
                     typeLoc = 0
                     depots.append(
-                        Location(x, y, demand, servTime, typeLoc, nodeID))
+                        Location(x, y, demand, servTime, typeLoc, len(depots)))
                 n_line += 1
-        return TWO_E_CVRP(fileName, customers, customerLoc, depots, satellites)
+        f.close()
+        return TWO_E_CVRP(fileName, customers, customerLoc, depots, satellites, timeWindows=timeWindows)
+
+    def fromDict(data: dict) -> "TWO_E_CVRP":
+        """
+        Method that builds a problem from a json payload
+
+        Parameters
+        ----------
+        data : dict with the name and lists of depots [x, y], satellites [x, y] and
+            customers [x, y, demand], [x, y, demand, servTime] or [x, y, demand, servTime, windowStart, windowEnd],
+            and optionally timeWindows to respect the time windows.
+        """
+        depots = [Location(d[0], d[1], 0, 0, 0, i) for i, d in enumerate(data["depots"])]
+        satellites = [Location(s[0], s[1], 0, 0, 1, len(depots)+i) for i, s in enumerate(data["satellites"])]
+        customerLoc = []
+        for i, c in enumerate(data["customers"]):
+            servTime = c[3] if len(c) > 3 else 0
+            window = c[4:6] if len(c) > 5 else (0, math.inf)
+            customerLoc.append(Location(c[0], c[1], c[2], servTime, -1, len(depots)+len(satellites)+i, *window))
+        customers = [Customer(loc, loc.nodeID) for loc in customerLoc]
+        return TWO_E_CVRP(data.get("name", "payload"), customers, customerLoc, depots, satellites,
+                          timeWindows=data.get("timeWindows", False))
+
+def solveInstance(instance: str, dir: str, nDestroyOps: int, nRepairOps: int) -> tuple[str, float, float, dict, dict]:
+    """
+    Function that reads an instance and solves it with the ALNS, used by the workers of ProblemSet.solve
+
+    Returns
+    -------
+    result : (instance, best cost, time, best solution serialised by Solution.toDict, run record for the ResultsStore)
+    """
+    from Objects.ResultsStore import runRecord
+    start_time = time.perf_counter()
+    problem = TWO_E_CVRP.readInstance(instance, dir)
+    alns = ALNS(problem, nDestroyOps, nRepairOps)
+    alns.execute(plotFinal=False)
+    runTime = time.perf_counter() - start_time
+    return instance, float(alns.bestSolution.cost), runTime, alns.bestSolution.toDict(), runRecord(alns, instance, dir, runTime)
 
 class ProblemSet:
     """
-    Class that represents a set of problems
+    Class that represents a set of problems. The instances are read when they are solved.
     Attributes
     ----------
-    problems : The set containing all problems.
+    instanceList : The instances in the set.
+    dir : directory of the instances.
+    problems : The problems solved by runALNS.
     """
     def __init__(self, instanceList: list[str], dir: str = "Must"):
+        self.instanceList = instanceList
+        self.dir = dir
         self.problems = list()
         self.alns = list()
         self.costSolution = list()
         self.tSolution = list()
-        for instance in instanceList:
-            self.problems.append(TWO_E_CVRP.readInstance(instance, dir))
     
-    def runALNS(self, nDestroyOps: int, nRepairOps: int, plotIntermediateSolutions: bool = False, verbose: bool = False):
+    def solve(self, nDestroyOps: int, nRepairOps: int, nWorkers: int = 1, resultsFile: str = None,
+              store: "ResultsStore" = None, label: str = ""):
+        """
+        Generator that solves the instances one by one and yields the result of each instance as
+        soon as it completes, in completion order if nWorkers > 1. Only the instances in progress are
+        kept in memory. Every result is appended to resultsFile (json lines) right away, and instances
+        that are already in resultsFile are skipped, so an interrupted batch continues where it stopped.
+        The runs are also recorded in the results store if given, in one bulk insert per 2*nWorkers runs.
+
+        Parameters
+        ----------
+        nDestroyOps : number of destroy operators.
+        nRepairOps : number of repair operators.
+        nWorkers : number of worker processes, 1 solves the instances in this process.
+        resultsFile : json lines file the results are appended to.
+        store : ResultsStore the runs are recorded in.
+        label : label of the runs in the store.
+
+        Yields
+        ------
+        result : (instance, best cost, time, best solution serialised by Solution.toDict)
+        """
+        todo = list(self.instanceList)
+        if resultsFile is not None and os.path.exists(resultsFile):
+            with open(resultsFile) as f:
+                done = {json.loads(line)["instance"] for line in f if line.strip()}
+            todo = [instance for instance in todo if instance not in done]
+        output = open(resultsFile, "a") if resultsFile is not None else None
+        stored = []
+
+        def record(result: tuple) -> tuple:
+            instance, cost, runTime, solution, run = result
+            if output is not None:
+                output.write(json.dumps({"instance": instance, "dir": self.dir, "cost": cost, "time": runTime,
+                                         "solution": solution}) + "\n")
+                output.flush()
+            if store is not None:
+                stored.append(run)
+                if len(stored) >= 2*nWorkers:
+                    store.addMany(stored, label)
+                    stored.clear()
+            return result[:4]
+
+        try:
+            if nWorkers == 1:
+                for instance in todo:
+                    yield record(solveInstance(instance, self.dir, nDestroyOps, nRepairOps))
+            else:
+                with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+                    pending = set()
+                    instances = iter(todo)
+                    while True:
+                        # keep at most two instances per worker in flight
+                        for instance in instances:
+                            pending.add(pool.submit(solveInstance, instance, self.dir, nDestroyOps, nRepairOps))
+                            if len(pending) >= 2*nWorkers:
+                                break
+                        if len(pending) == 0:
+                            break
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            yield record(future.result())
+        finally:
+            if output is not None:
+                output.close()
+            if store is not None and stored:
+                store.addMany(stored, label)
+
+    def runALNS(self, nDestroyOps: int, nRepairOps: int, plotIntermediateSolutions: bool = False, verbose: bool = False,
+                store: "ResultsStore" = None, label: str = "", reuse: bool = False):
         """
         Method that runs the ALNS algorithm for each problem in the set
+
+        Parameters
+        ----------
+        store : ResultsStore every run is recorded in.
+        label : label of the runs in the store.
+        reuse : take the cost and time of an instance from the latest run in the store with the same
+            label, code version, operators, parameters and seed instead of running it again. Reused
+            instances are not added to problems and alns.
         """
-        for problem in self.problems:
+        from Objects.ResultsStore import codeVersion, runParameters, runRecord
+        for instance in self.instanceList:
+            if reuse and store is not None:
+                runs = store.query(label=label, instance=instance, codeVersion=codeVersion(), nDestroyOps=nDestroyOps,
+                                   nRepairOps=nRepairOps, seed=Parameters.randomSeed, parameters=runParameters())
+                if runs:
+                    self.costSolution.append(runs[-1]["cost"])
+                    self.tSolution.append(runs[-1]["time"])
+                    continue
+            problem = TWO_E_CVRP.readInstance(instance, self.dir)
+            self.problems.append(problem)
             start_time = time.perf_counter()
             self.alns.append(ALNS(problem, nDestroyOps, nRepairOps, verbose))
             self.alns[-1].execute(plotIntermediateSolutions)
             self.costSolution.append(self.alns[-1].bestSolutionTrend[-1])
             self.tSolution.append(time.perf_counter() - start_time)
+            if store is not None:
+                store.add(runRecord(self.alns[-1], instance, self.dir, self.tSolution[-1]), label)
     
     def plotResults(self):
         """
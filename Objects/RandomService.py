@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible random number substreams for the ALNS and its operators
+"""
+from random import Random
+import numpy as np
+import zlib
+
+
+class NoiseBuffer:
+    """
+    Class that hands out the multiplicative noise u^e, u ~ U(0,1), e ~ U(-0.2, 0.2) that perturbs
+    insertion and removal costs. The noise is drawn in vectorised blocks from a numpy Generator.
+
+    Attributes
+    ----------
+    generator : the numpy random generator of the stream.
+    blockSize : number of values drawn at once.
+    values : the current block of noise values.
+    pos : index of the next value in the block.
+    fillState : state of the generator before the current block was drawn, used for checkpoints.
+    """
+    def __init__(self, generator: np.random.Generator, blockSize: int = 1024):
+        self.generator = generator
+        self.blockSize = blockSize
+        self.values = []
+        self.pos = 0
+        self.fillState = generator.bit_generator.state
+
+    def fill(self):
+        """
+        Method that draws the next block of noise values
+        """
+        self.fillState = self.generator.bit_generator.state
+        u = self.generator.random(self.blockSize)
+        e = self.generator.uniform(-0.2, 0.2, self.blockSize)
+        self.values = np.power(u, e).tolist()
+        self.pos = 0
+
+    def next(self) -> float:
+        """
+        Method that returns the next noise value
+        """
+        if self.pos >= len(self.values):
+            self.fill()
+        value = self.values[self.pos]
+        self.pos += 1
+        return value
+
+    def getstate(self) -> dict:
+        return {"fillState": self.fillState, "pos": self.pos, "filled": len(self.values) > 0}
+
+    def setstate(self, state: dict):
+        self.generator.bit_generator.state = state["fillState"]
+        if state["filled"]:
+            self.fill()
+        self.pos = state["pos"]
+
+
+class RandomService:
+    """
+    Class that provides independent, seeded random substreams by name, e.g. one per operator,
+    so the random numbers of one operator do not depend on how many numbers other operators
+    drew. Each name has a python Random for choices and a NoiseBuffer for cost perturbation.
+    Services of different workers with the same seed are independent as well.
+
+    Attributes
+    ----------
+    seed : the random seed.
+    workerID : id of the worker that uses the service.
+    randoms : the python Random of each stream that has been used.
+    noises : the NoiseBuffer of each stream that has been used.
+    """
+    def __init__(self, seed: int, workerID: int = 0):
+        self.seed = seed
+        self.workerID = workerID
+        self.randoms = {}
+        self.noises = {}
+
+    def seedSequence(self, name: str, kind: int) -> np.random.SeedSequence:
+        """
+        Method that returns the seed sequence of a stream, kind 0 for Random and 1 for noise
+        """
+        return np.random.SeedSequence(self.seed, spawn_key=(self.workerID, zlib.crc32(name.encode()), kind))
+
+    def random(self, name: str) -> Random:
+        """
+        Method that returns the python Random of a stream
+        """
+        if name not in self.randoms:
+            self.randoms[name] = Random(int.from_bytes(self.seedSequence(name, 0).generate_state(4).tobytes(), "little"))
+        return self.randoms[name]
+
+    def noise(self, name: str) -> NoiseBuffer:
+        """
+        Method that returns the noise buffer of a stream
+        """
+        if name not in self.noises:
+            self.noises[name] = NoiseBuffer(np.random.Generator(np.random.PCG64(self.seedSequence(name, 1))))
+        return self.noises[name]
+
+    def spawn(self, workerID: int) -> "RandomService":
+        """
+        Method that returns the service with the same seed for another worker
+        """
+        return RandomService(self.seed, workerID)
+
+    def getstate(self) -> dict:
+        """
+        Method that returns the state of all streams, as json-serialisable data
+        """
+        return {"seed": self.seed, "workerID": self.workerID,
+                "randoms": {name: r.getstate() for name, r in self.randoms.items()},
+                "noises": {name: n.getstate() for name, n in self.noises.items()}}
+
+    def setstate(self, state: dict):
+        """
+        Method that restores the state of all streams returned by getstate
+        """
+        self.seed = state["seed"]
+        self.workerID = state["workerID"]
+        self.randoms = {}
+        self.noises = {}
+        for name, (version, internalState, gaussNext) in state["randoms"].items():
+            self.random(name).setstate((version, tuple(internalState), gaussNext))
+        for name, noiseState in state["noises"].items():
+            self.noise(name).setstate(noiseState)
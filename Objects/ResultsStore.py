@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Local SQLite database with the results of ALNS runs, sweeps and baselines
+"""
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import time
+from Objects.ALNS import CHECKPOINT_PARAMETERS, Parameters
+from Objects.Sweep import instanceHash
+
+# default database of the analysis scripts
+RESULTS_DB = "Results/results.db"
+
+# columns of the runs table, in insertion order
+COLUMNS = ("label", "instance", "dir", "instanceHash", "nDestroyOps", "nRepairOps", "parameters", "seed",
+           "codeVersion", "cost", "time", "operatorStats", "solution", "created")
+JSON_COLUMNS = ("parameters", "operatorStats", "solution")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    label TEXT NOT NULL,
+    instance TEXT NOT NULL,
+    dir TEXT,
+    instanceHash TEXT,
+    nDestroyOps INTEGER,
+    nRepairOps INTEGER,
+    parameters TEXT,
+    seed INTEGER,
+    codeVersion TEXT,
+    cost REAL,
+    time REAL,
+    operatorStats TEXT,
+    solution TEXT,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS runsByLabel ON runs (label, instance);
+CREATE INDEX IF NOT EXISTS runsByHash ON runs (instanceHash, codeVersion);
+"""
+
+_codeVersion = None
+
+
+def codeVersion() -> str:
+    """
+    Function that returns the git commit of the code, with "-dirty" if there are uncommitted changes,
+    or "unknown" outside a git repository. It is determined once per process.
+    """
+    global _codeVersion
+    if _codeVersion is None:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+            status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip()
+            _codeVersion = commit + ("-dirty" if status else "")
+        except (OSError, subprocess.CalledProcessError):
+            _codeVersion = "unknown"
+    return _codeVersion
+
+
+def runParameters() -> dict:
+    """
+    Function that returns the Parameters that determine an ALNS run, without the seed
+    """
+    params = {name: getattr(Parameters, name) for name in CHECKPOINT_PARAMETERS if name != "randomSeed"}
+    params["T"] = Parameters.T
+    return params
+
+
+def operatorStats(alns) -> dict:
+    """
+    Function that returns the final weights, mean run times and number of uses of the operators of an ALNS
+    """
+    return {"destroy": {"weights": alns.wDestroyOps, "times": alns.tDestroyOps, "uses": alns.nUsedDestroyOps},
+            "repair": {"weights": alns.wRepairOps, "times": alns.tRepairOps, "uses": alns.nUsedRepairOps}}
+
+
+def runRecord(alns, instance: str, dir: str, runTime: float, label: str = "") -> dict:
+    """
+    Function that returns the record of a finished ALNS run, as stored by ResultsStore.add
+    """
+    return {"label": label, "instance": instance, "dir": dir, "instanceHash": instanceHash(instance, dir),
+            "nDestroyOps": alns.nDestroyOps, "nRepairOps": alns.nRepairOps, "parameters": runParameters(),
+            "seed": Parameters.randomSeed, "codeVersion": codeVersion(), "cost": float(alns.bestSolution.cost),
+            "time": runTime, "operatorStats": operatorStats(alns), "solution": alns.bestSolution.toDict()}
+
+
+class ResultsStore:
+    """
+    Class that stores the results of ALNS runs in a SQLite database: one row per run with the label of
+    the experiment, the instance and the sha256 hash of its file, the operators, parameters and seed,
+    the code version, the best cost, the run time, the operator statistics and the best solution.
+
+    The database is in WAL mode, so several processes can read and write it at the same time. Workers
+    should return their records to the parent process, which inserts them in bulk with addMany: one
+    transaction per batch instead of one per run.
+
+    Use it as a context manager, the connection is closed when the context is left:
+
+        with ResultsStore() as store:
+            costs, times = store.means("baseline", instanceList)
+
+    Attributes
+    ----------
+    path : file of the database.
+    connection : the sqlite3 connection.
+    """
+    def __init__(self, path: str = RESULTS_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def add(self, record: dict, label: str = None):
+        """
+        Method that stores the record of one run, see addMany
+        """
+        self.addMany([record], label)
+
+    def addMany(self, records: list[dict], label: str = None):
+        """
+        Method that stores the records of many runs in a single transaction
+
+        Parameters
+        ----------
+        records : dicts with the COLUMNS of a run, e.g. made by runRecord. Missing columns are stored
+            as NULL, a record of a sweep may give its parameters as params.
+        label : label of the experiment, overrides the label of the records if given.
+        """
+        rows = []
+        now = time.time()
+        for record in records:
+            values = dict(record)
+            if "parameters" not in values and "params" in values:
+                values["parameters"] = values["params"]
+            if label is not None:
+                values["label"] = label
+            values.setdefault("label", "")
+            values.setdefault("created", now)
+            for name in JSON_COLUMNS:
+                if values.get(name) is not None:
+                    values[name] = json.dumps(values[name], sort_keys=True, separators=(",", ":"))
+            rows.append(tuple(values.get(name) for name in COLUMNS))
+        with self.connection:
+            self.connection.executemany(f"INSERT INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?'*len(COLUMNS))})", rows)
+
+    def query(self, label: str = None, instance: str = None, seed: int = None, codeVersion: str = None,
+              parameters: dict = None, nDestroyOps: int = None, nRepairOps: int = None,
+              withSolution: bool = False) -> list[dict]:
+        """
+        Method that returns the stored runs that match all given arguments, oldest first
+
+        Parameters
+        ----------
+        label, instance, seed, codeVersion, nDestroyOps, nRepairOps : values the runs must have.
+        parameters : dict of parameter values the runs must have, other parameters may differ.
+        withSolution : also load the best solutions, which are the bulk of the data.
+
+        Returns
+        -------
+        runs : one dict per run with the COLUMNS and the id, with the json columns decoded.
+        """
+        conditions = []
+        arguments = []
+        for name, value in (("label", label), ("instance", instance), ("seed", seed), ("codeVersion", codeVersion),
+                            ("nDestroyOps", nDestroyOps), ("nRepairOps", nRepairOps)):
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                arguments.append(value)
+        for name, value in (parameters or {}).items():
+            conditions.append("json_extract(parameters, ?) = json_extract(?, '$')")
+            arguments.extend([f"$.{name}", json.dumps(value)])
+        columns = ["id"] + [name for name in COLUMNS if withSolution or name != "solution"]
+        sql = f"SELECT {', '.join(columns)} FROM runs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        runs = []
+        for row in self.connection.execute(sql + " ORDER BY id", arguments):
+            run = dict(row)
+            for name in JSON_COLUMNS:
+                if run.get(name) is not None:
+                    run[name] = json.loads(run[name])
+            runs.append(run)
+        return runs
+
+    def means(self, label: str, instanceList: list[str], **conditions) -> tuple[list[float], list[float]]:
+        """
+        Method that returns the mean best cost and the mean run time of the runs of each instance
+        with the given label, in the order of instanceList. Further conditions are passed to query.
+        Raises a KeyError if an instance has no runs.
+        """
+        values = {}
+        for run in self.query(label=label, **conditions):
+            values.setdefault(run["instance"], []).append((run["cost"], run["time"]))
+        missing = [instance for instance in instanceList if instance not in values]
+        if missing:
+            raise KeyError(f"No runs with label {label} for {missing}")
+        costs = [statistics.mean(cost for cost, _ in values[instance]) for instance in instanceList]
+        times = [statistics.mean(runTime for _, runTime in values[instance]) for instance in instanceList]
+        return costs, times
+
+    def addBaseline(self, label: str, instanceList: list[str], costs: list[float], times: list[float], dir: str = "Must"):
+        """
+        Method that stores measured costs and times of instances under a label, once: nothing is
+        stored if the label already has runs. Used to move baselines that were measured before the
+        store existed into it.
+        """
+        if self.query(label=label):
+            return
+        self.addMany([{"instance": instance, "dir": dir, "instanceHash": instanceHash(instance, dir), "cost": cost,
+                       "time": runTime, "codeVersion": "baseline"}
+                      for instance, cost, runTime in zip(instanceList, costs, times)], label)
@@ -2,10 +2,65 @@
 """
 @author: Original template by Rolf van Lieshout and Krissada Tundulyasaree
 """
-from copy import deepcopy
+from collections import OrderedDict
 import sys
 from Objects.Location import Location
 
+# slack on range_second and the latest service starts for the insertion bounds, so rounding never skips a feasible insertion
+RANGE_TOLERANCE = 1e-6
+
+class RouteCache:
+    """
+    Class that memoises route evaluations. It maps (isFirstEchelonRoute, nodeID sequence, load sequence)
+    to (feasible, distance, cost) and evicts the least recently used entry when it is full.
+
+    Attributes
+    ----------
+    maxSize : maximum number of stored evaluations.
+    hits : number of lookups that were found.
+    misses : number of lookups that were not found.
+    """
+    def __init__(self, maxSize: int = 100000):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __reduce__(self):
+        # the cache is not sent along when the problem is pickled
+        return (RouteCache, (self.maxSize,))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: tuple):
+        """
+        Method that returns the stored (feasible, distance, cost) of a route, or None
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: tuple):
+        """
+        Method that stores the (feasible, distance, cost) of a route
+        """
+        self.entries[key] = value
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def hitRate(self) -> float:
+        """
+        Method that returns the fraction of lookups that were found
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+
 class Route:
     """
     Class used to represent a route for both the first or second echelon
@@ -29,7 +84,12 @@ class Route:
         for exmaple: locations: [1,2,3,1], servedLoad:[10,20]
         this means that the load of location 2 is 10 and load of location 3 is 20.
     isFirstEchelonRoute: true if the route belongs to the first echelon.
+    earliest, latest: with time windows, the earliest and the latest start of the service at each
+        position of a second-echelon route that keep all time windows feasible (forward and backward
+        time slack). Computed by computeSchedule when first needed, None before.
     """
+    __slots__ = ("locations", "customers", "problem", "isFirstEchelonRoute", "servedLoad",
+                 "feasible", "distance", "cost", "earliest", "latest")
 
     def __init__(self, locations: list[Location], problem, isFirstEchelonRoute: bool, load: list[int]):
         self.locations = locations
@@ -38,6 +98,14 @@ class Route:
         # track the demand for each satellite for the first echelon route
         self.isFirstEchelonRoute = isFirstEchelonRoute
         self.servedLoad = load
+        self.earliest = None
+        self.latest = None
+        # look up the evaluation of this node sequence and load
+        key = (isFirstEchelonRoute, tuple([loc.nodeID for loc in locations]), tuple(load))
+        cached = problem.routeCache.get(key)
+        if cached is not None:
+            self.feasible, self.distance, self.cost = cached
+            return
         # check the feasibility and compute the distance
         self.feasible = self.isFeasible()
         if self.feasible:
@@ -47,6 +115,7 @@ class Route:
         else:
             self.distance = sys.maxsize  # extremely large number
             self.cost = sys.maxsize  # extremely large number
+        problem.routeCache.put(key, (self.feasible, self.distance, self.cost))
 
     def computeDistance(self) -> float:
         """
@@ -121,6 +190,34 @@ class Route:
             if curLoad > capacity:
                 return False
 
+        if self.isFirstEchelonRoute is False and self.problem.timeWindows:
+            return self.computeSchedule()
+
+        return True
+
+    def computeSchedule(self) -> bool:
+        """
+        Method that computes the earliest and latest start of the service at every position of a
+        second-echelon route. The earliest start follows the route forward, waiting for the start of
+        a window; the latest start follows it backward from the end of the windows. Returns True if
+        every service starts within its window.
+        """
+        D = self.problem.distList
+        locs = self.locations
+        n = len(locs)
+        earliest = [0.0]*n
+        for i in range(1, n):
+            prev, cur = locs[i-1], locs[i]
+            earliest[i] = max(cur.windowStart, earliest[i-1] + prev.servTime + D[prev.nodeID][cur.nodeID])
+            if earliest[i] > cur.windowEnd:
+                return False
+        latest = [0.0]*n
+        latest[-1] = locs[-1].windowEnd
+        for i in range(n-2, -1, -1):
+            cur, nxt = locs[i], locs[i+1]
+            latest[i] = min(cur.windowEnd, latest[i+1] - D[cur.nodeID][nxt.nodeID] - cur.servTime)
+        self.earliest = earliest
+        self.latest = latest
         return True
 
     def removeLocation(self, location: Location) -> tuple[int, int]:
@@ -145,6 +242,8 @@ class Route:
         load = self.servedLoad[location_index - 1]
         # update the route location
         self.locations.remove(location)
+        self.earliest = None
+        self.latest = None
         # the route changes, so update
         self.cost = self.computeCost()
         # remove the servedLoad
@@ -158,6 +257,26 @@ class Route:
 
         return location_index, load
 
+    def removeSegment(self, start: int, end: int) -> list[Location]:
+        """
+        Method that removes the locations at the positions start up to end (exclusive) of a
+        second-echelon route at once, with their loads and customers.
+
+        Returns
+        -------
+        removed : the removed locations.
+        """
+        removed = self.locations[start:end]
+        self.locations = self.locations[:start] + self.locations[end:]
+        del self.servedLoad[start-1:end-1]
+        removedIDs = {loc.nodeID for loc in removed}
+        self.customers = [cust for cust in self.customers if cust.ID not in removedIDs]
+        self.earliest = None
+        self.latest = None
+        # the route changes, so update
+        self.cost = self.computeCost()
+        return removed
+
     def insertLocation(self, location: Location, load: int, location_index: int):
         """
         Method that inserts a location to the route.
@@ -168,23 +287,98 @@ class Route:
         load : load for delivery.
         location_index :  the index of the location from the list of locations of this vehicle routes.
         """
-        routeCopy = deepcopy(self)
-        # update the route location
-        routeCopy.locations.insert(location_index, location)
-        # the route changes, so update
-        routeCopy.cost = self.computeCost()
-        # insert the servedLoad
-        routeCopy.servedLoad.insert(location_index - 1, load)
+        locations = self.locations.copy()
+        servedLoad = self.servedLoad.copy()
+        # update the route location and insert the servedLoad
+        locations.insert(location_index, location)
+        servedLoad.insert(location_index - 1, load)
+        # evaluate the new route, so its distance and cost are up to date
+        routeCopy = Route(locations, self.problem, self.isFirstEchelonRoute, servedLoad)
+        routeCopy.customers = self.customers.copy()
 
-        if routeCopy.isFeasible():
+        if routeCopy.feasible:
             return routeCopy
         else:
             return None
 
+    def canInsert(self, location: Location, load: int) -> bool:
+        """
+        Method that checks in O(1) whether inserting the location and load can be feasible at all,
+        before any insertion position is evaluated: the capacity must not be exceeded and a customer
+        must be within reach of the satellite of a second-echelon route.
+        """
+        if self.isFirstEchelonRoute is True:
+            return sum(self.servedLoad) + load <= self.problem.capacity_first
+        if sum(self.servedLoad) + load > self.problem.capacity_second:
+            return False
+        return location.nodeID in self.problem.satelliteReach[self.locations[0].nodeID]
+
+    def insertionDeltas(self, location: Location, load: int) -> list[tuple[int, float]]:
+        """
+        Method that returns the insertion positions of a location that keep the route feasible, with
+        the extra distance of each, in O(1) per position and without building a route. For a
+        second-echelon route, positions whose extra distance exceeds the range that is left are
+        skipped. With time windows, positions where the location cannot be served in its window, or
+        where the service of the next location would start after its latest start, are skipped as
+        well, from the forward and backward time slack of computeSchedule.
+
+        Returns
+        -------
+        deltas : (position, extra distance) of every feasible position, empty if the location and
+            load cannot be inserted at all.
+        """
+        if load <= 0 or not self.feasible or not self.canInsert(location, load):
+            return []
+        D = self.problem.distList
+        c = location.nodeID
+        nodes = [loc.nodeID for loc in self.locations]
+        deltas = [(i, D[nodes[i-1]][c] + D[c][nodes[i]] - D[nodes[i-1]][nodes[i]]) for i in range(1, len(nodes))]
+        if self.isFirstEchelonRoute is True:
+            return deltas
+        maxDetour = self.problem.range_second + RANGE_TOLERANCE - self.distance
+        deltas = [(i, delta) for i, delta in deltas if delta <= maxDetour]
+        if not self.problem.timeWindows:
+            return deltas
+        if self.earliest is None and not self.computeSchedule():
+            return []
+        fits = []
+        for i, delta in deltas:
+            prev = self.locations[i-1]
+            start = max(location.windowStart, self.earliest[i-1] + prev.servTime + D[prev.nodeID][c])
+            if start <= location.windowEnd and start + location.servTime + D[c][nodes[i]] <= self.latest[i] + RANGE_TOLERANCE:
+                fits.append((i, delta))
+        return fits
+
+    def buildInsertion(self, location: Location, load: int, candidates: list[tuple[float, int]]):
+        """
+        Method that builds the route with the location inserted at the first candidate position
+        whose route is feasible. Only the tolerance of the O(1) range and time checks of
+        insertionDeltas can make a candidate infeasible, so this is nearly always the first one.
+
+        Parameters
+        ----------
+        candidates : (cost, position) of the insertions, best first.
+
+        Returns
+        -------
+        route : the route after the insertion, None if no candidate is feasible.
+        k : index of the candidate that was built.
+        """
+        for k, (_, i) in enumerate(candidates):
+            locationsCopy = self.locations.copy()
+            demandCopy = self.servedLoad.copy()
+            demandCopy.insert(i-1, load)
+            locationsCopy.insert(i, location)
+            afterInsertion = Route(locationsCopy, self.problem, self.isFirstEchelonRoute, demandCopy)
+            if afterInsertion.feasible:
+                return afterInsertion, k
+        return None, len(candidates)
+
     def greedyInsert(self, location: Location, load: int):
         """
         Method that inserts the location and corresponding load to a route
-        that give the shortest total distance. Returns best route. 
+        that give the shortest total distance. Returns best route. The positions are
+        compared in O(1) each by insertionDeltas, only the best one is built.
 
         Parameters
         ----------
@@ -196,30 +390,16 @@ class Route:
         bestInsert : Route
             Route after insertion.
         """
-        minDist = sys.maxsize  # initialize as extremely large number
-        bestInsert = None
-        # return None if empty is sent.
-        if load <= 0:
-            return bestInsert
-        # iterate over all possible insertion positions
-        for i in range(1, len(self.locations)):
-            locationsCopy = self.locations.copy()
-            demandCopy = self.servedLoad.copy()
-            # update demand
-            demandCopy.insert(i-1, load)
-            locationsCopy.insert(i, location)
-            afterInsertion = Route(locationsCopy, self.problem, self.isFirstEchelonRoute, demandCopy)
-            # check if insertion is feasible
-            if afterInsertion.isFeasible():
-                # check if cheapest
-                if afterInsertion.distance < minDist:
-                    bestInsert = afterInsertion
-                    minDist = afterInsertion.distance
+        # the earliest of equally short positions is taken
+        candidates = sorted((delta, i) for i, delta in self.insertionDeltas(location, load))
+        bestInsert, _ = self.buildInsertion(location, load, candidates)
         return bestInsert
     
     def findRegret(self, location: Location, load: int) -> tuple[float, float]:
         """
-        Method that find the regret value for the location and corresponding load to a route
+        Method that find the regret value for the location and corresponding load to a route.
+        The insertion costs follow in O(1) per position from insertionDeltas, only the best
+        insertion is built.
 
         Parameters
         ----------
@@ -235,26 +415,17 @@ class Route:
         bestCost = sys.maxsize
         secondbestCost = sys.maxsize
         bestRoute = None
-        # return None if empty is sent.
-        if load <= 0:
-            return bestCost-curCost, secondbestCost-curCost, bestRoute
-        # iterate over all possible insertion positions
-        for i in range(1, len(self.locations)):
-            locationsCopy = self.locations.copy()
-            demandCopy = self.servedLoad.copy()
-            # update demand
-            demandCopy.insert(i-1, load)
-            locationsCopy.insert(i, location)
-            afterInsertion = Route(locationsCopy, self.problem, self.isFirstEchelonRoute, demandCopy)
-            # check if insertion is feasible
-            if afterInsertion.isFeasible():
-                # check if cheapest
-                if afterInsertion.cost < bestCost:
-                    secondbestCost = bestCost
-                    bestCost = afterInsertion.cost
-                    bestRoute = afterInsertion
-                elif afterInsertion.cost < secondbestCost:
-                    secondbestCost = afterInsertion.cost
+        # an insertion adds its distance, one more location to the vehicle cost and, in the first echelon, the handling
+        if self.isFirstEchelonRoute is True:
+            extra = self.problem.cost_first + self.problem.cost_handling*load
+        else:
+            extra = self.problem.cost_second
+        candidates = sorted((curCost + delta + extra, i) for i, delta in self.insertionDeltas(location, load))
+        bestRoute, k = self.buildInsertion(location, load, candidates)
+        if bestRoute is not None:
+            bestCost = bestRoute.cost
+            if k+1 < len(candidates):
+                secondbestCost = candidates[k+1][0]
         return bestCost-curCost, secondbestCost-curCost, bestRoute
 
 
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of second-echelon routes and their recombination by set partitioning
+"""
+from collections import OrderedDict
+from random import Random
+import numpy as np
+from Objects.Route import Route
+from Objects.Solution import Solution
+
+
+class RoutePool:
+    """
+    Class that keeps a bounded pool of the feasible second-echelon routes seen during the search and
+    recombines them into a solution by set partitioning: the cheapest set of pooled routes that
+    serves every customer exactly once. Routes are deduplicated by their satellite and set of
+    customers, keeping the shortest order, and the least recently seen route is evicted when the
+    pool is full. The pool is stored in checkpoints with getstate, so a resumed run recombines the
+    same routes.
+
+    Attributes
+    ----------
+    problem : the problem instance.
+    maxSize : maximum number of routes in the pool.
+    routes : (satellite nodeID, frozenset of customer nodeIDs) -> (distance, nodeIDs, loads) of every
+        pooled route, least recently seen first.
+    byCustomer : dict that maps the nodeID of every customer to the keys of the pooled routes that serve it.
+    nRecombinations : number of calls of recombine.
+    nImprovements : number of recombinations that improved the second echelon.
+    """
+    def __init__(self, problem, maxSize: int = 5000):
+        self.problem = problem
+        self.maxSize = maxSize
+        self.routes = OrderedDict()
+        self.byCustomer = {}
+        self.nRecombinations = 0
+        self.nImprovements = 0
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+    def add(self, route: Route):
+        """
+        Method that adds a feasible second-echelon route to the pool, or marks it as recently seen
+        """
+        if not route.feasible or len(route.locations) <= 2:
+            return
+        nodes = tuple(loc.nodeID for loc in route.locations)
+        key = (nodes[0], frozenset(nodes[1:-1]))
+        entry = self.routes.get(key)
+        if entry is None:
+            self.routes[key] = (route.distance, nodes, tuple(route.servedLoad))
+            for c in key[1]:
+                self.byCustomer.setdefault(c, set()).add(key)
+            if len(self.routes) > self.maxSize:
+                oldKey, _ = self.routes.popitem(last=False)
+                for c in oldKey[1]:
+                    self.byCustomer[c].discard(oldKey)
+        else:
+            if route.distance < entry[0]:
+                self.routes[key] = (route.distance, nodes, tuple(route.servedLoad))
+            self.routes.move_to_end(key)
+
+    def getstate(self) -> dict:
+        return {"routes": [[distance, list(nodes), list(loads)] for distance, nodes, loads in self.routes.values()],
+                "nRecombinations": self.nRecombinations, "nImprovements": self.nImprovements}
+
+    def setstate(self, state: dict):
+        self.routes = OrderedDict()
+        self.byCustomer = {}
+        for distance, nodes, loads in state["routes"]:
+            key = (nodes[0], frozenset(nodes[1:-1]))
+            self.routes[key] = (distance, tuple(nodes), tuple(loads))
+            for c in key[1]:
+                self.byCustomer.setdefault(c, set()).add(key)
+        self.nRecombinations = state["nRecombinations"]
+        self.nImprovements = state["nImprovements"]
+
+    def addSolution(self, solution: Solution):
+        """
+        Method that adds the second-echelon routes of a solution to the pool
+        """
+        for route in solution.routes_2:
+            self.add(route)
+
+    def recombine(self, solution: Solution, timeLimit: float, randomGen: Random, exactFirst: bool = False) -> Solution | None:
+        """
+        Method that solves the set-partitioning problem over the pooled routes with the SciPy MILP
+        solver and builds the first echelon for the chosen routes. The routes of the given solution
+        are added first, so they are always a feasible partition.
+
+        Parameters
+        ----------
+        solution : a solution that serves all customers, usually the best solution.
+        timeLimit : time limit of the MILP solver in seconds, the best partition found is used.
+        randomGen : random generator for the greedy first-echelon insertion.
+        exactFirst : build the optimal first echelon instead of the greedy one.
+
+        Returns
+        -------
+        recombined : the recombined solution, or None if its second echelon is not cheaper than
+            that of the given solution.
+        """
+        # imported here, so SciPy is only needed when routes are recombined
+        from scipy.optimize import Bounds, LinearConstraint, milp
+        from scipy.sparse import csc_matrix
+        self.nRecombinations += 1
+        self.addSolution(solution)
+        problem = self.problem
+        keys = list(self.routes)
+        column = {key: j for j, key in enumerate(keys)}
+        nD = len(problem.depots) + len(problem.satellites)
+        # one row per customer with the pooled routes that serve it
+        rows = [c - nD for c, serving in self.byCustomer.items() for _ in serving]
+        cols = [column[key] for serving in self.byCustomer.values() for key in serving]
+        A = csc_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(problem.customers), len(keys)))
+        costs = np.array([self.routes[key][0] for key in keys]) + problem.cost_second
+        result = milp(costs, constraints=LinearConstraint(A, 1, 1), integrality=np.ones(len(keys)),
+                      bounds=Bounds(0, 1), options={"time_limit": timeLimit})
+        if result.x is None:
+            return None
+        current = sum(route.distance for route in solution.routes_2) + problem.cost_second*len(solution.routes_2)
+        if result.fun >= current - 1e-6:
+            return None
+
+        routes_2 = []
+        for j in np.flatnonzero(result.x > 0.5):
+            _, nodes, loads = self.routes[keys[j]]
+            route = Route([problem.locations[n] for n in nodes], problem, False, list(loads))
+            route.customers = [problem.customers[n - nD] for n in nodes[1:-1]]
+            routes_2.append(route)
+        served = [cust for route in routes_2 for cust in route.customers]
+        recombined = Solution(problem, routes_2, served, [])
+        if exactFirst:
+            recombined.executeExactInsertionFirst()
+        else:
+            recombined.executeGreedyInsertionFirst(randomGen, False)
+        recombined.computeCost()
+        self.nImprovements += 1
+        return recombined
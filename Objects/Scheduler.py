@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable operator schedulers for the ALNS
+"""
+from abc import ABC, abstractmethod
+from collections import deque
+from random import Random
+
+
+class OperatorScheduler(ABC):
+    """
+    Abstract base class of an operator scheduler. The ALNS asks select for the next operator and reports
+    the result of every use to update, which every scheduler must implement. Operators are numbered
+    1..nOps as in the ALNS.
+
+    Attributes
+    ----------
+    nOps : number of operators.
+    """
+    def __init__(self, nOps: int):
+        self.nOps = nOps
+
+    @abstractmethod
+    def select(self, randomGen: Random) -> int:
+        """
+        Method that returns the number of the operator to apply next
+        """
+
+    @abstractmethod
+    def update(self, opNr: int, improvement: float, runTime: float):
+        """
+        Method that reports a use of an operator
+
+        Parameters
+        ----------
+        opNr : number of the operator.
+        improvement : decrease of the cost compared to the current solution, 0 if it got worse.
+        runTime : run time of the operator in seconds.
+        """
+
+    def getstate(self) -> dict:
+        return {}
+
+    def setstate(self, state: dict):
+        pass
+
+
+class SlidingWindowBandit(OperatorScheduler):
+    """
+    Sliding-window bandit scheduler that rewards cost improvement per second of operator run time.
+    Operators are drawn with probability proportional to their rate, normalised by the best rate so
+    it adapts to the instance size, plus an exploration weight. Only the last window uses count, so
+    the scheduler keeps adapting during the whole run, and expensive operators are chosen only
+    when their improvements pay for their time.
+
+    Attributes
+    ----------
+    nOps : number of operators.
+    window : number of most recent operator uses that are taken into account.
+    exploration : weight that is added to every operator, so operators without recent improvements are still tried.
+    history : the last window uses as (opNr, improvement, runTime).
+    nSelections : total number of selections.
+    """
+    def __init__(self, nOps: int, window: int = 50, exploration: float = 0.3):
+        super().__init__(nOps)
+        self.window = window
+        self.exploration = exploration
+        self.history = deque(maxlen=window)
+        self.nSelections = 0
+
+    def rates(self) -> tuple[list[int], list[float]]:
+        """
+        Method that returns the number of uses and the improvement per second of each operator in the window
+        """
+        counts = [0]*self.nOps
+        improvement = [0.0]*self.nOps
+        runTime = [0.0]*self.nOps
+        for opNr, impr, t in self.history:
+            counts[opNr-1] += 1
+            improvement[opNr-1] += impr
+            runTime[opNr-1] += t
+        rates = [improvement[i]/runTime[i] if runTime[i] > 0 else 0.0 for i in range(self.nOps)]
+        return counts, rates
+
+    def select(self, randomGen: Random) -> int:
+        self.nSelections += 1
+        counts, rates = self.rates()
+        # operators that are not in the window are tried first
+        unused = [i+1 for i in range(self.nOps) if counts[i] == 0]
+        if len(unused) > 0:
+            return randomGen.choice(unused)
+        maxRate = max(rates)
+        weights = [(rates[i]/maxRate if maxRate > 0 else 0.0) + self.exploration for i in range(self.nOps)]
+        return randomGen.choices(range(1, self.nOps+1), weights=weights, k=1)[0]
+
+    def update(self, opNr: int, improvement: float, runTime: float):
+        self.history.append((opNr, max(0.0, improvement), runTime))
+
+    def getstate(self) -> dict:
+        return {"history": list(self.history), "nSelections": self.nSelections}
+
+    def setstate(self, state: dict):
+        self.history = deque((tuple(use) for use in state["history"]), maxlen=self.window)
+        self.nSelections = state["nSelections"]
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Local asyncio HTTP/JSON service that solves 2E-CVRP instances with the ALNS in a process pool
+
+Endpoints
+---------
+POST /jobs                 submit {"instance": "Ca1-2,3,15.txt", "dir": "Must"} or {"problem": payload},
+                           optional "params", "seed", "nDestroyOps" and "nRepairOps". Returns the job id.
+GET /jobs                  list all jobs.
+GET /jobs/<id>             status, best cost so far and, when finished, the best solution.
+DELETE /jobs/<id>          cancel a queued or running job.
+GET /jobs/<id>/progress    stream of json lines with the best cost so far, until the job finishes.
+GET /metrics               throughput, queue depth and latency in plain text.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from Objects.ALNS import ALNS
+from Objects.Problem import TWO_E_CVRP
+from Objects.Sweep import setParameters
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import statistics
+import time
+
+MAX_CACHED_PROBLEMS = 16  # problems kept warm per worker process
+
+# problems loaded by this worker process, kept warm (including their route cache) across jobs
+_problemCache = {}
+
+
+def loadProblem(spec: dict) -> TWO_E_CVRP:
+    """
+    Function that returns the problem of a job, from the cache of this process if possible
+    """
+    if "problem" in spec:
+        key = ("payload", hashlib.sha256(json.dumps(spec["problem"], sort_keys=True).encode()).hexdigest())
+    else:
+        key = ("file", spec.get("dir", "Must"), spec["instance"])
+    if key not in _problemCache:
+        if len(_problemCache) >= MAX_CACHED_PROBLEMS:
+            del _problemCache[next(iter(_problemCache))]
+        if key[0] == "payload":
+            _problemCache[key] = TWO_E_CVRP.fromDict(spec["problem"])
+        else:
+            _problemCache[key] = TWO_E_CVRP.readInstance(spec["instance"], spec.get("dir", "Must"))
+    return _problemCache[key]
+
+
+def runServiceJob(jobID: str, spec: dict, progress, cancelled) -> dict:
+    """
+    Function that runs the ALNS for a job in a worker process
+
+    Parameters
+    ----------
+    jobID : id of the job.
+    spec : the submitted job.
+    progress : queue on which (jobID, event, bestCost, iteration) messages are put.
+    cancelled : shared dict with the ids of the jobs that must stop.
+
+    Returns
+    -------
+    result : the best cost, number of iterations, run time and best solution of the job.
+    """
+    start_time = time.perf_counter()
+    problem = loadProblem(spec)
+    params = spec.get("params", {})
+    setParameters(params, spec.get("seed", 1))
+    alns = ALNS(problem, spec.get("nDestroyOps", 3), spec.get("nRepairOps", 3))
+    if "wLambda" in params:
+        alns.wLambda = params["wLambda"]
+    progress.put((jobID, "running", None, 0))
+    lastBest = [None]
+
+    def callback(alns: ALNS) -> bool:
+        if alns.bestCost != lastBest[0]:
+            lastBest[0] = alns.bestCost
+            progress.put((jobID, "progress", alns.bestCost, alns.iteration))
+        return jobID in cancelled
+
+    alns.execute(plotFinal=False, callback=callback)
+    return {"bestCost": alns.bestSolution.cost, "iterations": alns.iteration, "time": time.perf_counter() - start_time,
+            "cancelled": jobID in cancelled, "solution": alns.bestSolution.toDict()}
+
+
+class Job:
+    """
+    Class that represents a job of the service
+
+    Attributes
+    ----------
+    id : id of the job.
+    spec : the submitted job.
+    status : "queued", "running", "done", "cancelled" or "failed".
+    submitted, started, finished : time stamps of the job.
+    bestCost : best cost found so far.
+    iteration : iteration of the best cost.
+    result : result of runServiceJob when the job is done.
+    error : error message if the job failed.
+    future : future of the job in the process pool.
+    subscribers : queues of the clients that stream the progress.
+    """
+    def __init__(self, jobID: str, spec: dict):
+        self.id = jobID
+        self.spec = spec
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.bestCost = None
+        self.iteration = 0
+        self.result = None
+        self.error = None
+        self.future = None
+        self.subscribers = []
+
+    def isFinished(self) -> bool:
+        return self.status in ("done", "cancelled", "failed")
+
+    def summary(self, withSolution: bool = False) -> dict:
+        """
+        Method that returns the json-serialisable state of the job
+        """
+        summary = {"id": self.id, "status": self.status, "bestCost": self.bestCost, "iteration": self.iteration,
+                   "submitted": self.submitted, "started": self.started, "finished": self.finished}
+        if self.error is not None:
+            summary["error"] = self.error
+        if withSolution and self.result is not None:
+            summary["result"] = self.result
+        return summary
+
+
+class SolveService:
+    """
+    Class that serves the ALNS over HTTP/JSON. Jobs are queued to a process pool whose workers
+    stay alive between jobs, so their problem cache stays warm.
+
+    Attributes
+    ----------
+    host : host to listen on.
+    port : port to listen on.
+    nWorkers : number of worker processes, None for the number of cpus.
+    jobs : all jobs by id.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 8080, nWorkers: int = None):
+        self.host = host
+        self.port = port
+        self.nWorkers = nWorkers
+        self.jobs = {}
+        self.nextID = 1
+        self.startTime = time.time()
+
+    async def serve(self):
+        """
+        Method that runs the service until it is interrupted
+        """
+        self.loop = asyncio.get_running_loop()
+        self.manager = multiprocessing.Manager()
+        self.progress = self.manager.Queue()
+        self.cancelled = self.manager.dict()
+        self.pool = ProcessPoolExecutor(max_workers=self.nWorkers)
+        progressTask = self.loop.create_task(self.readProgress())
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Solve service listening on http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.progress.put(None)
+            await progressTask
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.manager.shutdown()
+
+    def submit(self, spec: dict) -> Job:
+        """
+        Method that queues a job in the process pool
+        """
+        if "problem" not in spec and "instance" not in spec:
+            raise ValueError("A job needs an instance or a problem payload")
+        job = Job(str(self.nextID), spec)
+        self.nextID += 1
+        self.jobs[job.id] = job
+        job.future = self.pool.submit(runServiceJob, job.id, spec, self.progress, self.cancelled)
+        job.future.add_done_callback(lambda future: self.loop.call_soon_threadsafe(self.finish, job, future))
+        return job
+
+    def cancel(self, job: Job):
+        """
+        Method that cancels a job: a queued job is removed from the queue, a running job stops
+        after its current iteration and keeps its best solution.
+        """
+        if job.isFinished():
+            return
+        if not job.future.cancel():
+            self.cancelled[job.id] = True
+
+    def finish(self, job: Job, future):
+        """
+        Method that stores the result of a job and notifies the subscribers
+        """
+        job.finished = time.time()
+        if future.cancelled():
+            job.status = "cancelled"
+        elif future.exception() is not None:
+            job.status = "failed"
+            job.error = repr(future.exception())
+        else:
+            job.result = future.result()
+            job.bestCost = job.result["bestCost"]
+            job.iteration = job.result["iterations"]
+            job.status = "cancelled" if job.result["cancelled"] else "done"
+        self.cancelled.pop(job.id, None)
+        self.notify(job)
+
+    def notify(self, job: Job):
+        """
+        Method that sends the state of a job to all clients that stream its progress
+        """
+        for queue in job.subscribers:
+            queue.put_nowait(job.summary())
+
+    async def readProgress(self):
+        """
+        Method that forwards the progress messages of the workers to the jobs
+        """
+        while True:
+            message = await self.loop.run_in_executor(None, self.progress.get)
+            if message is None:
+                break
+            jobID, event, bestCost, iteration = message
+            job = self.jobs.get(jobID)
+            if job is None or job.isFinished():
+                continue
+            if event == "running":
+                job.status = "running"
+                job.started = time.time()
+            else:
+                job.bestCost = bestCost
+                job.iteration = iteration
+            self.notify(job)
+
+    def metrics(self) -> str:
+        """
+        Method that returns the throughput, queue depth and latency metrics in plain text
+        """
+        jobs = list(self.jobs.values())
+        finished = [job for job in jobs if job.isFinished()]
+        latencies = sorted(job.finished - job.submitted for job in finished)
+        uptime = time.time() - self.startTime
+        lines = [f"solver_uptime_seconds {uptime:.3f}",
+                 f"solver_jobs_submitted_total {len(jobs)}",
+                 f"solver_jobs_completed_total {sum(job.status == 'done' for job in jobs)}",
+                 f"solver_jobs_cancelled_total {sum(job.status == 'cancelled' for job in jobs)}",
+                 f"solver_jobs_failed_total {sum(job.status == 'failed' for job in jobs)}",
+                 f"solver_queue_depth {sum(job.status == 'queued' for job in jobs)}",
+                 f"solver_jobs_running {sum(job.status == 'running' for job in jobs)}",
+                 f"solver_throughput_jobs_per_second {len(finished)/uptime:.6f}"]
+        if latencies:
+            lines += [f"solver_job_latency_seconds_mean {statistics.mean(latencies):.6f}",
+                      f'solver_job_latency_seconds{{quantile="0.5"}} {latencies[len(latencies)//2]:.6f}',
+                      f'solver_job_latency_seconds{{quantile="0.95"}} {latencies[min(len(latencies)-1, int(0.95*len(latencies)))]:.6f}',
+                      f"solver_job_latency_seconds_max {latencies[-1]:.6f}"]
+        return "\n".join(lines) + "\n"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Method that handles a single HTTP request
+        """
+        try:
+            requestLine = (await reader.readline()).decode()
+            if not requestLine:
+                return
+            method, path, _ = requestLine.split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, value = line.decode().split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            await self.route(method, path.rstrip("/"), body, writer)
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            self.respond(writer, 400, {"error": str(e)})
+        except ConnectionError:
+            pass
+        finally:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        """
+        Method that dispatches a request to its endpoint
+        """
+        parts = path.strip("/").split("/")
+        if method == "GET" and path == "/metrics":
+            self.respond(writer, 200, self.metrics(), "text/plain; version=0.0.4")
+        elif method == "POST" and path == "/jobs":
+            job = self.submit(json.loads(body or b"{}"))
+            self.respond(writer, 202, job.summary())
+        elif method == "GET" and path == "/jobs":
+            self.respond(writer, 200, [job.summary() for job in self.jobs.values()])
+        elif len(parts) >= 2 and parts[0] == "jobs" and parts[1] in self.jobs:
+            job = self.jobs[parts[1]]
+            if len(parts) == 2 and method == "GET":
+                self.respond(writer, 200, job.summary(withSolution=True))
+            elif len(parts) == 2 and method == "DELETE":
+                self.cancel(job)
+                self.respond(writer, 202, job.summary())
+            elif len(parts) == 3 and parts[2] == "progress" and method == "GET":
+                await self.streamProgress(job, writer)
+            else:
+                self.respond(writer, 404, {"error": f"Unknown endpoint {method} {path}"})
+        else:
+            self.respond(writer, 404, {"error": f"Unknown endpoint {method} {path}"})
+
+    def respond(self, writer: asyncio.StreamWriter, status: int, content, contentType: str = "application/json"):
+        """
+        Method that writes a complete HTTP response
+        """
+        body = (content if isinstance(content, str) else json.dumps(content)).encode()
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {contentType}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+
+    async def streamProgress(self, job: Job, writer: asyncio.StreamWriter):
+        """
+        Method that streams the state of a job as chunked json lines until it finishes
+        """
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        queue = asyncio.Queue()
+        job.subscribers.append(queue)
+        try:
+            summary = job.summary()
+            while True:
+                line = (json.dumps(summary) + "\n").encode()
+                writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                await writer.drain()
+                if summary["status"] in ("done", "cancelled", "failed"):
+                    break
+                summary = await queue.get()
+            writer.write(b"0\r\n\r\n")
+        finally:
+            job.subscribers.remove(queue)
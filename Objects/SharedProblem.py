@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Problem data in shared memory for multi-process workers
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import time
+from Objects.ALNS import ALNS, Parameters, applyOperators
+from Objects.Customer import Customer
+from Objects.Location import Location
+from Objects.Problem import TWO_E_CVRP
+from Objects.RandomService import RandomService
+from Objects.Solution import Solution
+
+# columns of the node array
+NODE_COLUMNS = ("xLoc", "yLoc", "demand", "servTime", "typeLoc", "windowStart", "windowEnd")
+
+# problems attached by this process, by the name of their shared memory block
+_attached = {}
+
+
+def toNumber(value: float):
+    """
+    Function that returns an integral float as int, so attached locations equal the original ones
+    """
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class SharedProblem:
+    """
+    Class that puts the distance matrix and the node data of a problem in one shared memory block,
+    so worker processes attach a read-only view of the problem instead of receiving a pickled copy
+    or recomputing the O(n^2) distance matrix. Only the small handle is sent to the workers.
+
+    Use it as a context manager, the block is released when the context is left:
+
+        with SharedProblem(problem) as shared:
+            results = shared.solveSeeds([1, 2, 3, 4], 2, 2, nWorkers=4)
+
+    Attributes
+    ----------
+    problem : the problem that is shared.
+    shm : the shared memory block, with the distance matrix followed by the node array.
+    handle : picklable dict with everything a worker needs to attach the problem.
+    """
+    def __init__(self, problem: TWO_E_CVRP):
+        self.problem = problem
+        n = len(problem.locations)
+        distBytes = n*n*8
+        self.shm = shared_memory.SharedMemory(create=True, size=distBytes + n*len(NODE_COLUMNS)*8)
+        dist = np.ndarray((n, n), dtype=np.float64, buffer=self.shm.buf)
+        dist[:] = problem.distMatrix
+        nodes = np.ndarray((n, len(NODE_COLUMNS)), dtype=np.float64, buffer=self.shm.buf, offset=distBytes)
+        nodes[:] = [[getattr(loc, col) for col in NODE_COLUMNS] for loc in problem.locations]
+        del dist, nodes  # the block can only be closed when no array refers to it
+        self.handle = {"shmName": self.shm.name, "name": problem.name, "nLocations": n,
+                       "nDepots": len(problem.depots), "nSatellites": len(problem.satellites),
+                       "constants": {key: getattr(problem, key) for key in ("capacity_first", "cost_first",
+                                     "capacity_second", "cost_second", "cost_handling", "range_second", "timeWindows")}}
+
+    def __enter__(self) -> "SharedProblem":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Method that releases the shared memory block. Workers that are still attached keep their view.
+        """
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def solveSeeds(self, seeds: list[int], nDestroyOps: int, nRepairOps: int, nWorkers: int = 1) -> list[tuple]:
+        """
+        Method that solves the shared problem once per seed, in parallel worker processes
+
+        Returns
+        -------
+        results : list of (seed, best cost, time, best solution serialised by Solution.toDict), in the order of seeds
+        """
+        with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+            futures = [pool.submit(solveShared, self.handle, seed, nDestroyOps, nRepairOps) for seed in seeds]
+            return [future.result() for future in futures]
+
+
+def attachProblem(handle: dict) -> TWO_E_CVRP:
+    """
+    Function that returns the read-only problem view of a SharedProblem handle. The distance matrix
+    is not copied: distMatrix is a read-only numpy array on the shared block and distList has one
+    read-only memoryview per row, which supports the same D[i][j] lookups as nested lists. The view
+    is built once per process and reused by later tasks with the same handle.
+    """
+    name = handle["shmName"]
+    if name in _attached:
+        return _attached[name][1]
+    shm = shared_memory.SharedMemory(name=name)
+    n = handle["nLocations"]
+    distBytes = n*n*8
+    distMatrix = np.ndarray((n, n), dtype=np.float64, buffer=shm.buf)
+    distMatrix.flags.writeable = False
+    flat = shm.buf[:distBytes].cast("d").toreadonly()
+    distList = [flat[i*n:(i+1)*n] for i in range(n)]
+    nodes = np.ndarray((n, len(NODE_COLUMNS)), dtype=np.float64, buffer=shm.buf, offset=distBytes)
+    locations = [Location(nodeID=nodeID, **{col: toNumber(v) for col, v in zip(NODE_COLUMNS, row)})
+                 for nodeID, row in enumerate(nodes.tolist())]
+    nD, nS = handle["nDepots"], handle["nSatellites"]
+    customerLoc = locations[nD+nS:]
+    problem = TWO_E_CVRP(handle["name"], [Customer(loc, loc.nodeID) for loc in customerLoc], customerLoc,
+                         locations[:nD], locations[nD:nD+nS], distMatrix, distList)
+    for key, value in handle["constants"].items():
+        setattr(problem, key, value)
+    problem.computeSatelliteReach()
+    # keep the block open as long as this process uses the view
+    _attached[name] = (shm, problem)
+    return problem
+
+
+def solveShared(handle: dict, seed: int, nDestroyOps: int, nRepairOps: int) -> tuple[int, float, float, dict]:
+    """
+    Function that solves an attached problem with the ALNS and the given seed, used by SharedProblem.solveSeeds
+
+    Returns
+    -------
+    result : (seed, best cost, time, best solution serialised by Solution.toDict)
+    """
+    start_time = time.perf_counter()
+    problem = attachProblem(handle)
+    Parameters.randomSeed = seed
+    alns = ALNS(problem, nDestroyOps, nRepairOps)
+    alns.execute(plotFinal=False)
+    return seed, float(alns.bestSolution.cost), time.perf_counter() - start_time, alns.bestSolution.toDict()
+
+
+def evaluateCandidate(handle: dict, solutionData: dict, destroyOpNr: int, repairOpNr: int, sizeNBH: int,
+                      seed: int) -> tuple[dict, float, float, float]:
+    """
+    Function that destroys and repairs a copy of a solution of an attached problem, used by the
+    workers of a batch of candidates in ALNS.evaluateBatch
+
+    Parameters
+    ----------
+    handle : the handle of the SharedProblem.
+    solutionData : the solution serialised by Solution.toDict.
+    destroyOpNr, repairOpNr : the operators to apply.
+    sizeNBH : size of the neighborhood.
+    seed : seed of the random streams of the candidate.
+
+    Returns
+    -------
+    result : (candidate serialised by Solution.toDict, its cost, destroy time, repair time)
+    """
+    problem = attachProblem(handle)
+    solution = Solution.fromDict(problem, solutionData)
+    tDestroy, tRepair = applyOperators(solution, destroyOpNr, repairOpNr, sizeNBH, RandomService(seed))
+    solution.updateCost()
+    return solution.toDict(), solution.cost, tDestroy, tRepair
@@ -7,11 +7,25 @@ from copy import deepcopy
 from Objects.Route import Route
 from Objects.Location import Location
 from Objects.Customer import Customer
+from Objects.Fingerprint import MASK, routeFingerprint
+from Objects.RandomService import NoiseBuffer
+from Objects.Split import giantTours, insertInTours, splitTour
 from random import Random
+import json
 import numpy as np
 import sys
 
 
+def noiseFactor(randomGen: Random, noise: NoiseBuffer = None) -> float:
+    """
+    Function that returns the multiplicative noise u^e, u ~ U(0,1), e ~ U(-0.2, 0.2) used to perturb
+    costs. It is taken from the pre-drawn noise buffer if given, else drawn from randomGen.
+    """
+    if noise is not None:
+        return noise.next()
+    return pow(randomGen.random(), randomGen.uniform(-0.2, 0.2))
+
+
 class Solution:
     """
     Method that represents a solution to the 2E-CVRP
@@ -28,39 +42,117 @@ class Solution:
     handling:  total handling cost of loads at satellites
     satDemandServed : Load served in the first echelon vehicle current solution
     satDemandNotServed : Load not served in the first echelon vehicle current solution
+    distance_1, distance_2 : running totals of the distance of the feasible first and second-echelon routes
+    nInfeasibleRoutes : running number of routes with the distance sys.maxsize of an infeasible route
+    fingerprint : order-independent hash of the routes, the sum of their Fingerprint.routeFingerprint
+
+    The removal and insertion methods keep distance_1, distance_2, nInfeasibleRoutes, handling and the
+    fingerprint up to date, so updateCost gives the cost in O(1). computeCost recomputes everything from the routes.
     """
 
     def __init__(self, problem, routes_2: list[Route], served: list[Customer], notServed: list[Customer]):
 
         self.problem = problem
+        self.routes_1 = []
         self.routes_2 = routes_2
         self.served = served
         self.notServed = notServed
+        self.distance_1 = 0
+        self.distance_2 = 0
+        self.nInfeasibleRoutes = 0
+        self.handling = 0
+        self.fingerprint = 0
+        for route in routes_2:
+            self.trackRoute(route, False)
+
+    def trackRoute(self, route: Route, firstEchelon: bool, sign: int = 1):
+        """
+        Method that adds (sign 1) or subtracts (sign -1) the distance and fingerprint of a route to the
+        running totals. Infeasible routes are counted instead, since adding and subtracting sys.maxsize
+        would ruin the precision of the totals.
+        """
+        self.fingerprint = (self.fingerprint + sign*routeFingerprint(route)) & MASK
+        if route.distance >= sys.maxsize:
+            self.nInfeasibleRoutes += sign
+        elif firstEchelon:
+            self.distance_1 += sign*route.distance
+        else:
+            self.distance_2 += sign*route.distance
 
     def computeDistance(self):
         """
-        Method that computes the distance of the solution
+        Method that computes the distance of the solution from all routes
         """
-        self.distance = 0
+        self.distance_1 = 0
+        self.distance_2 = 0
+        self.nInfeasibleRoutes = 0
+        self.fingerprint = 0
         # Calculate the cost for the first echelon
         for routes_1 in self.routes_1:
-            self.distance += routes_1.distance
+            self.trackRoute(routes_1, True)
         # Calculate the cost for the second echelon
         for routes_2 in self.routes_2:
-            self.distance += routes_2.distance
+            self.trackRoute(routes_2, False)
+        self.distance = self.distance_1 + self.distance_2 + self.nInfeasibleRoutes*sys.maxsize
 
     def computeCost(self):    
         """
         Method that computes total cost = load handling cost + vehicle cost + transportation cost
+        from all routes, and resets the running totals
 
         """
         self.computeDistance()
         # Calculate the handling cost
-        handling = self.problem.cost_handling * sum(self.satDemandServed)
+        self.handling = self.problem.cost_handling * sum(self.satDemandServed)
+        self.updateCost()
+
+    def updateCost(self):
+        """
+        Method that computes the total cost in O(1) from the running totals
+        """
+        self.distance = self.distance_1 + self.distance_2 + self.nInfeasibleRoutes*sys.maxsize
         # Calculate the vehicle cost
         vehicle_cost = self.problem.cost_first * len(self.routes_1) + self.problem.cost_second * len(self.routes_2)
         # Calculate the total cost
-        self.cost = handling + self.distance + vehicle_cost
+        self.cost = self.handling + self.distance + vehicle_cost
+
+    def checkCost(self, tolerance: float = 1e-6):
+        """
+        Method that cross-checks the running totals against a full recomputation, and the loads that the
+        first echelon delivers at each satellite against the demand of its second-echelon routes.
+        Raises a RuntimeError on a mismatch. The solution is left unchanged.
+        """
+        tracked = (self.distance_1, self.distance_2, self.nInfeasibleRoutes, self.handling, self.distance, self.cost, self.fingerprint)
+        self.computeCost()
+        recomputed = (self.distance_1, self.distance_2, self.nInfeasibleRoutes, self.handling, self.distance, self.cost, self.fingerprint)
+        self.distance_1, self.distance_2, self.nInfeasibleRoutes, self.handling, self.distance, self.cost, self.fingerprint = tracked
+        names = ("distance_1", "distance_2", "nInfeasibleRoutes", "handling", "distance", "cost", "fingerprint")
+        for name, t, r in zip(names, tracked, recomputed):
+            if (t != r) if name in ("nInfeasibleRoutes", "fingerprint") else abs(t - r) > tolerance*max(1, abs(r)):
+                raise RuntimeError(f"Tracked {name} {t} differs from the recomputed {r}")
+        nD = len(self.problem.depots)
+        delivered = [0]*len(self.problem.satellites)
+        for route in self.routes_1:
+            for loc, load in zip(route.locations[1:-1], route.servedLoad):
+                delivered[loc.nodeID - nD] += load
+        demand = [0]*len(self.problem.satellites)
+        for route in self.routes_2:
+            demand[route.locations[0].nodeID - nD] += sum(route.servedLoad)
+        if delivered != demand or delivered != list(self.satDemandServed):
+            raise RuntimeError(f"First echelon delivers {delivered} with satDemandServed {self.satDemandServed}, "
+                               f"the second echelon needs {demand}")
+
+    def clearFirstEchelon(self):
+        """
+        Method that removes all first-echelon routes and derives the demand of the satellites from
+        the second-echelon routes, before the first echelon is rebuilt
+        """
+        for route in self.routes_1:
+            self.trackRoute(route, True, -1)
+        self.routes_1 = []
+        self.computeDemandSatellites()
+        self.satDemandServed = [0]*len(self.satDemandNotServed)
+        self.handling = 0
                    
     def __str__(self)-> str: 
         """
@@ -81,6 +173,188 @@ class Solution:
         
         return s
     
+    def toDict(self) -> dict:
+        """
+        Method that serialises the solution as nodeID sequences. The stored route distances
+        and costs are kept as they are, so fromDict restores exactly the same state.
+        """
+        def routeToDict(route: Route) -> dict:
+            return {"nodes": [loc.nodeID for loc in route.locations], "load": list(route.servedLoad),
+                    "distance": route.distance, "cost": route.cost}
+        return {"routes_1": [routeToDict(route) for route in self.routes_1],
+                "routes_2": [routeToDict(route) for route in self.routes_2],
+                "served": [cust.ID for cust in self.served],
+                "notServed": [cust.ID for cust in self.notServed],
+                "satDemandServed": list(self.satDemandServed),
+                "satDemandNotServed": list(self.satDemandNotServed),
+                "distance": self.distance,
+                "cost": self.cost,
+                "totals": [self.distance_1, self.distance_2, self.nInfeasibleRoutes, self.handling],
+                "fingerprint": self.fingerprint}
+
+    def fromDict(problem, data: dict) -> "Solution":
+        """
+        Method that restores a solution serialised by toDict
+
+        Parameters
+        ----------
+        problem : the problem that corresponds to the solution.
+        data : the serialised solution.
+        """
+        customers = {cust.ID: cust for cust in problem.customers}
+        def routeFromDict(route: dict, isFirstEchelonRoute: bool) -> Route:
+            locations = [problem.locations[nodeID] for nodeID in route["nodes"]]
+            restored = Route(locations, problem, isFirstEchelonRoute, list(route["load"]))
+            restored.distance = route["distance"]
+            restored.cost = route["cost"]
+            if not isFirstEchelonRoute:
+                restored.customers = [customers[nodeID] for nodeID in route["nodes"][1:-1]]
+            return restored
+        solution = Solution(problem, [routeFromDict(route, False) for route in data["routes_2"]],
+                            [customers[ID] for ID in data["served"]], [customers[ID] for ID in data["notServed"]])
+        solution.routes_1 = [routeFromDict(route, True) for route in data["routes_1"]]
+        solution.satDemandServed = list(data["satDemandServed"])
+        solution.satDemandNotServed = list(data["satDemandNotServed"])
+        if "fingerprint" in data:
+            solution.distance_1, solution.distance_2, solution.nInfeasibleRoutes, solution.handling = data["totals"]
+            solution.fingerprint = data["fingerprint"]
+        else:
+            solution.computeCost()
+        solution.distance = data["distance"]
+        solution.cost = data["cost"]
+        return solution
+
+    def toArrays(self) -> dict[str, np.ndarray]:
+        """
+        Method that returns the compact array form of the routes, per echelon e (1 or 2):
+        nodes_e, the nodeIDs of all routes concatenated; offsets_e, the start of every route in
+        nodes_e followed by its length; loads_e, the loads of the visited nodes of all routes
+        concatenated. Objects.Validator checks solutions in this form.
+        """
+        arrays = {}
+        for e, routes in ((1, self.routes_1), (2, self.routes_2)):
+            arrays[f"nodes_{e}"] = np.array([loc.nodeID for route in routes for loc in route.locations], dtype=np.int32)
+            arrays[f"offsets_{e}"] = np.cumsum([0] + [len(route.locations) for route in routes], dtype=np.int32)
+            arrays[f"loads_{e}"] = np.array([load for route in routes for load in route.servedLoad], dtype=np.int32)
+        return arrays
+
+    def fromArrays(problem, arrays: dict) -> "Solution":
+        """
+        Method that builds a solution from the array form of toArrays, lists work as well. The
+        customers that are not visited are not served and the cost is recomputed.
+        """
+        nD = len(problem.depots)
+        nC = nD + len(problem.satellites)
+        routes = {}
+        for e in (1, 2):
+            nodes = [int(n) for n in arrays[f"nodes_{e}"]]
+            offsets = [int(k) for k in arrays[f"offsets_{e}"]]
+            loads = [int(load) for load in arrays[f"loads_{e}"]]
+            routes[e] = []
+            for r in range(len(offsets) - 1):
+                start, end = offsets[r], offsets[r+1]
+                route = Route([problem.locations[n] for n in nodes[start:end]], problem, e == 1,
+                              loads[start-2*r:end-2*(r+1)])
+                if e == 2:
+                    route.customers = [problem.customers[n - nC] for n in nodes[start+1:end-1]]
+                routes[e].append(route)
+        served = [cust for route in routes[2] for cust in route.customers]
+        servedIDs = {cust.ID for cust in served}
+        solution = Solution(problem, routes[2], served, [cust for cust in problem.customers if cust.ID not in servedIDs])
+        solution.clearFirstEchelon()
+        solution.routes_1 = routes[1]
+        for route in routes[1]:
+            for loc, load in zip(route.locations[1:-1], route.servedLoad):
+                solution.satDemandServed[loc.nodeID - nD] += load
+                solution.satDemandNotServed[loc.nodeID - nD] -= load
+        solution.computeCost()
+        return solution
+
+    def save(self, fileName: str):
+        """
+        Method that saves the routes of both echelons with the problem name and the cost. A name
+        ending with .npz gives the compressed binary array form, else compact json.
+        """
+        arrays = self.toArrays()
+        if fileName.endswith(".npz"):
+            np.savez_compressed(fileName, problem=np.array(self.problem.name), cost=np.array(self.cost), **arrays)
+        else:
+            data = {"problem": self.problem.name, "cost": self.cost}
+            data.update({name: values.tolist() for name, values in arrays.items()})
+            with open(fileName, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+
+    def readSaved(fileName: str) -> dict:
+        """
+        Method that reads a file written by save, as a dict with the problem name, the cost and the arrays
+        """
+        if fileName.endswith(".npz"):
+            with np.load(fileName, allow_pickle=False) as data:
+                saved = {name: data[name] for name in data.files}
+            saved["problem"] = str(saved["problem"])
+            saved["cost"] = float(saved["cost"])
+            return saved
+        with open(fileName) as f:
+            return json.load(f)
+
+    def load(problem, fileName: str) -> "Solution":
+        """
+        Method that loads a solution of the problem that was written by save
+        """
+        return Solution.fromArrays(problem, Solution.readSaved(fileName))
+
+    def adaptTo(self, problem) -> "Solution":
+        """
+        Method that transfers the second-echelon routes of this solution to an updated problem,
+        e.g. the customer set of the next day. Satellites and customers are matched by their
+        coordinates. Customers that vanished are dropped from their routes, routes that became
+        infeasible are dissolved and all unmatched customers of the new problem are left unserved.
+        The first-echelon routes have to be rebuilt by one of the insertion methods.
+
+        Parameters
+        ----------
+        problem : the updated problem.
+
+        Returns
+        -------
+        solution : the partial solution for the updated problem.
+        """
+        satellites = {(sat.xLoc, sat.yLoc): sat for sat in problem.satellites}
+        customers = {}
+        for cust in problem.customers:
+            customers.setdefault((cust.deliveryLoc.xLoc, cust.deliveryLoc.yLoc), []).append(cust)
+        routes_2 = []
+        served = []
+        for route in self.routes_2:
+            sat = satellites.get((route.locations[0].xLoc, route.locations[0].yLoc))
+            if sat is None:
+                continue
+            routeCustomers = []
+            for loc in route.locations[1:-1]:
+                matches = customers.get((loc.xLoc, loc.yLoc))
+                if matches:
+                    routeCustomers.append(matches.pop(0))
+            if len(routeCustomers) == 0:
+                continue
+            locList = [sat] + [cust.deliveryLoc for cust in routeCustomers] + [sat]
+            newRoute = Route(locList, problem, False, [cust.deliveryLoc.demand for cust in routeCustomers])
+            if newRoute.feasible:
+                newRoute.customers = routeCustomers
+                routes_2.append(newRoute)
+                served.extend(routeCustomers)
+            else:
+                # put the customers back, so they are inserted again
+                for cust in routeCustomers:
+                    customers[(cust.deliveryLoc.xLoc, cust.deliveryLoc.yLoc)].append(cust)
+        servedIDs = {cust.ID for cust in served}
+        notServed = [cust for cust in problem.customers if cust.ID not in servedIDs]
+        solution = Solution(problem, routes_2, served, notServed)
+        # the first echelon is empty until it is rebuilt
+        solution.routes_1 = []
+        solution.satDemandServed = [0]*len(problem.satellites)
+        solution.satDemandNotServed = [0]*len(problem.satellites)
+        return solution
+
     def executeRandomRemoval(self,nRemove: int, random: Random, firstEchelon: bool):
         """
         Method that executes a random removal of locations
@@ -109,6 +383,7 @@ class Solution:
                 if len(route.locations) > 2:
                     break
                 else:
+                    self.trackRoute(route, firstEchelon, -1)
                     routes.remove(route)
                 len_route = [len(i.locations) for i in routes]
                 # All routes are empty: no served loads or customers
@@ -163,7 +438,7 @@ class Solution:
                     continue
             self.removeLocation(k, firstEchelon, route)
 
-    def executeWorstRemoval(self, nRemove:int, random: Random, firstEchelon: bool, pertubation: bool):
+    def executeWorstRemoval(self, nRemove:int, random: Random, firstEchelon: bool, pertubation: bool, noise: NoiseBuffer = None):
         """
         Method that executes the worst removal of locations
 
@@ -175,6 +450,8 @@ class Solution:
         randomGen :  Used to generate random numbers        
         firstEchelon: True if choose to remove location from the first-echelon routes
             False otherwise
+        pertubation : True to perturb the removal costs with noise
+        noise : pre-drawn noise for the perturbation, drawn from randomGen if None
         """
         if firstEchelon is True:
             routes = self.routes_1
@@ -201,7 +478,7 @@ class Solution:
             if avg_cost != 0:
                 cost = (cost_with-cost_without)/avg_cost
             if pertubation:
-                cost += cost*pow(random.random(),random.uniform(-0.2, 0.2))
+                cost += cost*noiseFactor(random, noise)
             if cost < removing_max:
                 removing.append((cost, i, route))
                 if len(removing) > nRemove:
@@ -213,6 +490,110 @@ class Solution:
             self.removeLocation(i[1].deliveryLoc, firstEchelon, i[2])
 
     
+    def executeStringRemoval(self, nRemove: int, random: Random, maxStringLength: int = 10):
+        """
+        Method that executes the adjacent string removal of SISR (Christiaens and Vanden Berghe, 2020)
+        on the second-echelon routes. The neighbour list of a random customer is followed and from the
+        route of every customer that is met, a string of consecutive customers that contains it is
+        removed, one string per route, until nRemove customers are removed. Only the routes that are
+        met are changed.
+
+        This is destroy method number 5 in the ALNS
+
+        Parameters
+        ----------
+        nRemove : number of customers that is removed.
+        random : Used to generate random numbers
+        maxStringLength : maximum number of customers of a string, strings are also at most as long
+            as the average route.
+        """
+        if len(self.served) == 0:
+            return
+        neighbours = self.problem.getNeighbours()
+        routeOf = self.routeOfCustomer()
+        maxLength = max(1, min(maxStringLength, round(len(self.served) / len(self.routes_2))))
+        seed = random.choice(self.served).ID
+        removed = []
+        ruined = set()
+        for c in [seed] + neighbours[seed]:
+            if len(removed) >= nRemove:
+                break
+            route = routeOf.get(c)
+            if route is None or id(route) in ruined:
+                continue
+            ruined.add(id(route))
+            nCust = len(route.locations) - 2
+            length = random.randint(1, min(nCust, maxLength, nRemove - len(removed)))
+            pos = next(k for k, loc in enumerate(route.locations) if loc.nodeID == c)
+            # the string starts at a random position such that it contains c
+            start = random.randint(max(1, pos - length + 1), min(pos, nCust - length + 1))
+            self.removeSegment(route, start, start + length, removed)
+        self.markRemoved(removed)
+
+    def executeRouteRemoval(self, nRemove: int, random: Random, determinism: float = 3):
+        """
+        Method that removes whole second-echelon routes with little load, so the repair can merge
+        their customers into fewer vehicles. The first route is drawn from the routes ranked by load,
+        biased towards the least loaded ones by random()**determinism. Then the neighbour list of one
+        of its customers is followed and every route with at most the average load that is met is
+        removed as well, until at least nRemove customers are removed.
+
+        This is destroy method number 6 in the ALNS
+
+        Parameters
+        ----------
+        nRemove : number of customers that is removed, at least one route is removed.
+        random : Used to generate random numbers
+        determinism : larger values pick the least loaded route more often.
+        """
+        loads = {id(route): sum(route.servedLoad) for route in self.routes_2 if len(route.locations) > 2}
+        if len(loads) == 0:
+            return
+        ranked = sorted((route for route in self.routes_2 if id(route) in loads), key=lambda route: loads[id(route)])
+        meanLoad = sum(loads.values()) / len(loads)
+        first = ranked[int(random.random()**determinism * len(ranked))]
+        seed = random.choice(first.locations[1:-1]).nodeID
+        routeOf = self.routeOfCustomer()
+        removed = []
+        self.removeSegment(first, 1, len(first.locations) - 1, removed)
+        for c in self.problem.getNeighbours()[seed]:
+            if len(removed) >= nRemove:
+                break
+            route = routeOf.get(c)
+            # the routes that are removed already have no customers left
+            if route is not None and len(route.locations) > 2 and loads[id(route)] <= meanLoad:
+                self.removeSegment(route, 1, len(route.locations) - 1, removed)
+        self.markRemoved(removed)
+
+    def routeOfCustomer(self) -> dict[int, Route]:
+        """
+        Method that returns the second-echelon route of every served customer, by nodeID
+        """
+        return {loc.nodeID: route for route in self.routes_2 for loc in route.locations[1:-1]}
+
+    def removeSegment(self, route: Route, start: int, end: int, removed: list[Customer]):
+        """
+        Method that removes the locations at the positions start up to end (exclusive) of a
+        second-echelon route at once and updates the running totals. The customers are appended to
+        removed, markRemoved moves them to notServed. A route without customers is dropped.
+        """
+        nD = len(self.problem.depots) + len(self.problem.satellites)
+        self.trackRoute(route, False, -1)
+        locations = route.removeSegment(start, end)
+        if len(route.locations) > 2:
+            self.trackRoute(route, False)
+        else:
+            self.routes_2.remove(route)
+        removed.extend(self.problem.customers[loc.nodeID - nD] for loc in locations)
+
+    def markRemoved(self, removed: list[Customer]):
+        """
+        Method that moves removed customers from served to notServed
+        """
+        removedIDs = {cust.ID for cust in removed}
+        self.served = [cust for cust in self.served if cust.ID not in removedIDs]
+        self.notServed.extend(removed)
+
     def removeLocation(self,location: Location, firstEchelon: bool, route: Route):
         """
         Method that removes a location from the indicated level of echelon vehicles
@@ -227,11 +608,15 @@ class Solution:
         """
         
         # Remove the location from the route
+        self.trackRoute(route, firstEchelon, -1)
         _ , load = route.removeLocation(location)
+        self.trackRoute(route, firstEchelon)
         if firstEchelon is True:
             # update lists with served and unserved load
-            self.satDemandServed[location.nodeID - 1] -= load
-            self.satDemandNotServed[location.nodeID - 1] += load
+            nD = len(self.problem.depots)
+            self.satDemandServed[location.nodeID - nD] -= load
+            self.satDemandNotServed[location.nodeID - nD] += load
+            self.handling -= self.problem.cost_handling*load
         else:
             # update lists with served and unserved customers
             customer = 0
@@ -257,7 +642,7 @@ class Solution:
             totalDemand = sum(j.demand for j in i.locations)
             self.satDemandNotServed[sat.nodeID - nD] += totalDemand
 
-    def executeRandomInsertion(self, randomGen: Random):
+    def executeRandomInsertion(self, randomGen: Random, exactFirst: bool = False):
         """
         Method that contruct randomly the routes for the first and second echelon vehicles by 
         1. randomly insert the customers to create the second echelon routes.
@@ -269,12 +654,16 @@ class Solution:
         Parameters
         ----------
         randomGen : Used to generate random numbers
+        exactFirst : True to build the optimal first echelon with executeExactInsertionFirst instead
 
         """
         
         self.executeRandomInsertionSecond(randomGen)
         # Based on the second echelon routes, generate the first echelon routes
-        self.executeRandomInsertionFirst(randomGen)
+        if exactFirst:
+            self.executeExactInsertionFirst()
+        else:
+            self.executeRandomInsertionFirst(randomGen)
 
     def executeRandomInsertionFirst(self,randomGen: Random):
         """
@@ -288,12 +677,9 @@ class Solution:
 
         """
         # Determine the first echelon from the given-second echelon routes
-        # This is used to reset the existing first-echelon route.
-        self.routes_1 = []
-        # Derive demands for satellites
-        self.computeDemandSatellites()
+        # This is used to reset the existing first-echelon route and derive demands for satellites.
+        self.clearFirstEchelon()
         # iterate over the list with unserved customers
-        self.satDemandServed = [0]*len(self.satDemandNotServed)
         while sum(self.satDemandNotServed) > 0:
             #pick a satellite with some loads for the first echelon vehicle to deliver
             load_max = 0
@@ -320,6 +706,8 @@ class Solution:
                 else:
                     # insertion feasible, update routes and break from while loop
                     inserted = True                   
+                    self.trackRoute(randomRoute, True, -1)
+                    self.trackRoute(afterInsertion, True)
                     self.routes_1.remove(randomRoute)
                     self.routes_1.append(afterInsertion)
                     break
@@ -337,9 +725,31 @@ class Solution:
                 newRoute = Route(locList, self.problem, True, [load])
                 # update the demand
                 self.routes_1.append(newRoute)
+                self.trackRoute(newRoute, True)
             # update the lists with served and notServed customers
             self.satDemandNotServed[iSat] -= load
             self.satDemandServed[iSat] += load
+            self.handling += self.problem.cost_handling*load
+
+    def executeExactInsertionFirst(self):
+        """
+        Method that constructs the cheapest first-echelon routes for the demand of the satellites,
+        with the exact solver of the problem (see FirstEchelon.FirstEchelonSolver). It does not
+        depend on random numbers, and the same satellite demands give the same routes.
+        """
+        # Derive demands for satellites
+        self.clearFirstEchelon()
+        for iDepot, satellites, loads in self.problem.getFirstEchelonSolver().solve(self.satDemandNotServed):
+            depot = self.problem.depots[iDepot]
+            locList = [depot] + [self.problem.satellites[iSat] for iSat in satellites] + [depot]
+            newRoute = Route(locList, self.problem, True, list(loads))
+            self.routes_1.append(newRoute)
+            self.trackRoute(newRoute, True)
+            # update the demand
+            for iSat, load in zip(satellites, loads):
+                self.satDemandNotServed[iSat] -= load
+                self.satDemandServed[iSat] += load
+                self.handling += self.problem.cost_handling*load
 
     def executeRandomInsertionSecond(self, randomGen: Random):
         """
@@ -370,6 +780,8 @@ class Solution:
                     inserted = True
                     afterInsertion.customers = randomRoute.customers
                     afterInsertion.customers.append(cust)
+                    self.trackRoute(randomRoute, False, -1)
+                    self.trackRoute(afterInsertion, False)
                     self.routes_2.remove(randomRoute)
                     self.routes_2.append(afterInsertion)
                     break
@@ -377,25 +789,31 @@ class Solution:
             # if we were not able to insert, create a new route
             if not inserted:
                 # create a new route with the customer
-                sat = randomGen.choice(self.problem.satellites)
+                sat = randomGen.choice(self.problem.reachingSatellites(cust.deliveryLoc.nodeID))
                 locList = [sat, cust.deliveryLoc, sat]
                 newRoute = Route(locList, self.problem, False, [cust.deliveryLoc.demand])
                 newRoute.customers = [cust]
                 self.routes_2.append(newRoute)
+                self.trackRoute(newRoute, False)
             # update the lists with served and notServed customers
             self.served.append(cust)
             self.notServed.remove(cust)
 
-    def executeGreedyInsertion(self, randomGen: Random, pertubation: bool):
+    def executeGreedyInsertion(self, randomGen: Random, pertubation: bool, noise: NoiseBuffer = None, exactFirst: bool = False):
         """
         Method that contruct the routes for the first and second echelon vehicles by
         1. Greedy insertion to create the second echelon routes.
         2. depending on the constructed second echelon routes, insert demand at the
-        satellites to construct the first echelon routes.
+        satellites to construct the first echelon routes, optimally if exactFirst is True.
+        The insertion costs are perturbed with noise if pertubation is True, the noise is
+        taken from the noise buffer if given.
         """	
-        self.executeGreedyInsertionSecond(randomGen, pertubation)
+        self.executeGreedyInsertionSecond(randomGen, pertubation, noise)
         # Based on the second echelon routes, generate the first echelon routes
-        self.executeGreedyInsertionFirst(randomGen, pertubation)
+        if exactFirst:
+            self.executeExactInsertionFirst()
+        else:
+            self.executeGreedyInsertionFirst(randomGen, pertubation)
 
     def executeGreedyInsertionFirst(self, randomGen: Random, perturbation: bool):
         """
@@ -403,10 +821,9 @@ class Solution:
         """
         # Determine the first echelon from the given-second echelon routes
         # This is used to reset the existing first-echelon route.
-        self.routes_1 = []
         nD = len(self.problem.depots)
         # Derive demands for satellites
-        self.computeDemandSatellites()
+        self.clearFirstEchelon()
         # Create list of unserved satellites
         unservedSatID = [i+nD for i in range(len(self.satDemandNotServed)) if self.satDemandNotServed[i] > 0]
         # Initialize iterative process, find depot nearest to a satellite
@@ -432,9 +849,11 @@ class Solution:
                     full = False
                 curRoute = Route(locList, self.problem, True, [load])
                 self.routes_1.append(curRoute)
+                self.trackRoute(curRoute, True)
                 # update the demand
                 self.satDemandNotServed[curLoc-nD] -= load
                 self.satDemandServed[curLoc-nD] += load
+                self.handling += self.problem.cost_handling*load
             else:
                 # add the satellite to the current route
                 curRoute = self.routes_1[-1]
@@ -445,19 +864,23 @@ class Solution:
                     full = True
                 else:
                     unservedSatID.remove(curLoc)
-                    self.routes_1.append(afterInsertion)
+                    self.trackRoute(curRoute, True, -1)
+                    self.trackRoute(afterInsertion, True)
+                    self.routes_1[-1] = afterInsertion
                     # update the demand
                     self.satDemandNotServed[curLoc-nD] -= load
-                    self.satDemandServed[curLoc-nD] += load 
+                    self.satDemandServed[curLoc-nD] += load
+                    self.handling += self.problem.cost_handling*load
 
-    def executeGreedyInsertionSecond(self, randomGen: Random, pertubation: bool):
+    def executeGreedyInsertionSecond(self, randomGen: Random, pertubation: bool, noise: NoiseBuffer = None):
         """
         Method that performs Greedy insertion to construct the second-level routes
         """
 
-        nSat = len(self.problem.satellites)
-        nD = len(self.problem.depots)
         # Remove the empty routes from routes_2
+        for route in self.routes_2:
+            if len(route.locations) <= 2:
+                self.trackRoute(route, False, -1)
         self.routes_2 = [route for route in self.routes_2 if len(route.locations) > 2]
 
         while len(self.notServed) > 0:
@@ -473,7 +896,7 @@ class Solution:
                 if afterInsertion is not None:
                     cost = afterInsertion.cost-route.cost
                     if pertubation:
-                        cost += cost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
+                        cost += cost*noiseFactor(randomGen, noise)
                 else:
                     cost = sys.maxsize
                 costInsert.append(cost)
@@ -488,13 +911,14 @@ class Solution:
             # If the cost is higher than the cost of opening a new rout, consider a new route
             if minCost > self.problem.cost_second:   
                 # create a new route with the customer
-                iSat = self.problem.distMatrix[cust.ID][nD:nD+nSat].argmin()
-                sat = self.problem.satellites[iSat]
+                # nearest satellite that reaches the customer
+                sat = min(self.problem.reachingSatellites(cust.deliveryLoc.nodeID), key=lambda s: self.problem.distList[cust.ID][s.nodeID])
                 locList = [sat, cust.deliveryLoc, sat]
                 newRoute = Route(locList, self.problem, False, [cust.deliveryLoc.demand])
                 newRoute.customers = [cust]	
                 if newRoute.cost < minCost:
                     self.routes_2.append(newRoute)
+                    self.trackRoute(newRoute, False)
                     inserted = True
 
             if not inserted:
@@ -503,34 +927,38 @@ class Solution:
                     cust.deliveryLoc, cust.deliveryLoc.demand)
                 afterInsertion.customers = self.routes_2[iInsert].customers
                 afterInsertion.customers.append(cust)      
+                self.trackRoute(self.routes_2[iInsert], False, -1)
+                self.trackRoute(afterInsertion, False)
                 self.routes_2[iInsert] = afterInsertion              
             # update the lists with served and notServed customers
             self.served.append(cust)
             self.notServed.remove(cust) 
 
-    def executeRegretInsertion(self, randomGen: Random, pertubation: bool):
+    def executeRegretInsertion(self, randomGen: Random, pertubation: bool, noise: NoiseBuffer = None, exactFirst: bool = False):
         """
         Method that contruct the routes for the first and second echelon vehicles by regret-2 insertion. 
         First, we insert the customers to create the second echelon routes.
         Second, depending on the constructed second echelon routes, insert demand at the
-        satellites to construct the first echelon routes.
+        satellites to construct the first echelon routes, optimally if exactFirst is True.
         
-        This is repair method number 3 in the ALNS
+        This is repair method number 3 in the ALNS. The regret costs are perturbed with noise
+        if pertubation is True, the noise is taken from the noise buffer if given.
         """
-        self.executeRegretInsertionSecond(randomGen, pertubation)
+        self.executeRegretInsertionSecond(randomGen, pertubation, noise)
         # Based on the second echelon routes, generate the first echelon routes
-        self.executeRegretInsertionFirst(randomGen, pertubation)
+        if exactFirst:
+            self.executeExactInsertionFirst()
+        else:
+            self.executeRegretInsertionFirst(randomGen, pertubation, noise)
 
-    def executeRegretInsertionFirst(self, randomGen: Random, pertubation: bool):
+    def executeRegretInsertionFirst(self, randomGen: Random, pertubation: bool, noise: NoiseBuffer = None):
         """
         Method that performs regret-2 insertion to construct the first-level routes.
 
         """
         # Determine the first echelon from the given-second echelon routes
-        # This is used to reset the existing first-echelon route.
-        self.routes_1 = []
-        # Derive demands for satellites
-        self.computeDemandSatellites()
+        # This is used to reset the existing first-echelon route and derive demands for satellites.
+        self.clearFirstEchelon()
         # Create list of unserved satellites
         nD = len(self.problem.depots)
         unservedSatID = [i+nD for i in range(len(self.satDemandNotServed)) if self.satDemandNotServed[i] > 0]
@@ -560,15 +988,28 @@ class Solution:
                 newRoute = Route(locList, self.problem, True, [load])
                 if newRoute.cost < bestRegret[0][0]:
                     self.routes_1.append(newRoute)
+                    self.trackRoute(newRoute, True)
                     inserted = True
                     bestRegret[0] = (newRoute.cost, len(self.routes_1)-1)
             
             if not inserted:
-                # insert the satellite in the best route
+                # insert the satellite in the best route, with all its remaining demand
+                load = self.satDemandNotServed[satID-nD]
+                self.trackRoute(self.routes_1[bestRegret[0][1]], True, -1)
+                self.trackRoute(bestRegret[2], True)
                 self.routes_1[bestRegret[0][1]] = bestRegret[2]
-            
-            # remove the satellite from the list of unserved satellites
-            unservedSatID.remove(satID)
+
+            # update the demand
+            self.satDemandNotServed[satID-nD] -= load
+            self.satDemandServed[satID-nD] += load
+            self.handling += self.problem.cost_handling*load
+
+            if self.satDemandNotServed[satID-nD] > 0:
+                # a full vehicle was sent, the satellite stays unserved and is reevaluated on all routes
+                satRegret.insert(idxBestRegret, [(sys.maxsize, bestRegret[0][1]), (sys.maxsize, bestRegret[0][1]), None])
+            else:
+                # remove the satellite from the list of unserved satellites
+                unservedSatID.remove(satID)
 
             # update the list with regret values for the new routes
             for i, satID in enumerate(unservedSatID):
@@ -581,8 +1022,8 @@ class Solution:
                     for iRoute, route in enumerate(self.routes_1):
                         routeBestCost, routeSecondCost, routeBest = route.findRegret(self.problem.satellites[satID-nD], self.satDemandNotServed[satID-nD])
                         if pertubation:
-                            routeBestCost += routeBestCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
-                            routeSecondCost += routeSecondCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
+                            routeBestCost += routeBestCost*noiseFactor(randomGen, noise)
+                            routeSecondCost += routeSecondCost*noiseFactor(randomGen, noise)
                         if routeBestCost < best[0]:
                             secondBest = best
                             best = (routeBestCost, iRoute)
@@ -594,8 +1035,8 @@ class Solution:
                 # Otherwise, only the inserted route must be reevaluated 
                     routeBestCost, routeSecondCost, routeBest = self.routes_1[bestRegret[0][1]].findRegret(self.problem.satellites[satID-nD], self.satDemandNotServed[satID-nD])
                     if pertubation:
-                        routeBestCost += routeBestCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
-                        routeSecondCost += routeSecondCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
+                        routeBestCost += routeBestCost*noiseFactor(randomGen, noise)
+                        routeSecondCost += routeSecondCost*noiseFactor(randomGen, noise)
                     if routeBestCost < satRegret[i][0][1]:
                         satRegret[i][1] = satRegret[i][0]
                         satRegret[i][0] = (routeBestCost, bestRegret[0][1])
@@ -603,7 +1044,7 @@ class Solution:
                     if routeSecondCost < satRegret[i][1][1]:
                         satRegret[i][1] = (routeSecondCost, bestRegret[0][1])
             
-    def executeRegretInsertionSecond(self, randomGen: Random, pertubation: bool):
+    def executeRegretInsertionSecond(self, randomGen: Random, pertubation: bool, noise: NoiseBuffer = None):
         """
         Method that performs regret-2 insertion to construct the second-level routes
         based on the first-level routes.
@@ -611,10 +1052,11 @@ class Solution:
         """
         # determine regret values for all unserved customers
         custRegret = []
-        nSat = len(self.problem.satellites)
-        nD = len(self.problem.depots)
 
         # remove the empty routes from routes_2
+        for route in self.routes_2:
+            if len(route.locations) <= 2:
+                self.trackRoute(route, False, -1)
         self.routes_2 = [route for route in self.routes_2 if len(route.locations) > 2]
 
         for cust in self.notServed:
@@ -624,8 +1066,8 @@ class Solution:
             for iRoute, route in enumerate(self.routes_2):
                 routeBestCost, routeSecondCost, routeBest = route.findRegret(cust.deliveryLoc, cust.deliveryLoc.demand)
                 if pertubation:
-                    routeBestCost += routeBestCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
-                    routeSecondCost += routeSecondCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
+                    routeBestCost += routeBestCost*noiseFactor(randomGen, noise)
+                    routeSecondCost += routeSecondCost*noiseFactor(randomGen, noise)
                 if routeBestCost < best[0]:
                     secondBest = best
                     best = (routeBestCost, iRoute)
@@ -645,8 +1087,8 @@ class Solution:
 
             if bestRegret[0][0] > self.problem.cost_second:
                 # Consider a new route with the customer
-                iSat = self.problem.distMatrix[cust.ID][nD:nSat+nD].argmin()
-                sat = self.problem.satellites[iSat]
+                # nearest satellite that reaches the customer
+                sat = min(self.problem.reachingSatellites(cust.deliveryLoc.nodeID), key=lambda s: self.problem.distList[cust.ID][s.nodeID])
                 locList = [sat, cust.deliveryLoc, sat]
                 newRoute = Route(locList, self.problem, False, [cust.deliveryLoc.demand])
                 if newRoute.feasible == False:
@@ -654,6 +1096,7 @@ class Solution:
                 newRoute.customers = [cust]	
                 if newRoute.cost < bestRegret[0][0]:
                     self.routes_2.append(newRoute)
+                    self.trackRoute(newRoute, False)
                     inserted = True
                     bestRegret[0] = (newRoute.cost, len(self.routes_2)-1)
             
@@ -661,6 +1104,8 @@ class Solution:
                 # insert the customer in the best route
                 bestRegret[2].customers = self.routes_2[bestRegret[0][1]].customers
                 bestRegret[2].customers.append(cust)
+                self.trackRoute(self.routes_2[bestRegret[0][1]], False, -1)
+                self.trackRoute(bestRegret[2], False)
                 self.routes_2[bestRegret[0][1]] = bestRegret[2]
             
             # remove the customer from the list of unserved customers
@@ -678,8 +1123,8 @@ class Solution:
                     for iRoute, route in enumerate(self.routes_2):
                         routeBestCost, routeSecondCost, routeBest = route.findRegret(cust.deliveryLoc, cust.deliveryLoc.demand)
                         if pertubation:
-                            routeBestCost += routeBestCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
-                            routeSecondCost += routeSecondCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
+                            routeBestCost += routeBestCost*noiseFactor(randomGen, noise)
+                            routeSecondCost += routeSecondCost*noiseFactor(randomGen, noise)
                         if routeBestCost < best[0]:
                             secondBest = best
                             best = (routeBestCost, iRoute)
@@ -691,8 +1136,8 @@ class Solution:
                     # Otherwise, only the inserted route must be reevaluated 
                     routeBestCost, routeSecondCost, routeBest = self.routes_2[bestRegret[0][1]].findRegret(cust.deliveryLoc, cust.deliveryLoc.demand)
                     if pertubation:
-                        routeBestCost += routeBestCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
-                        routeSecondCost += routeSecondCost*pow(randomGen.random(),randomGen.uniform(-0.2, 0.2))
+                        routeBestCost += routeBestCost*noiseFactor(randomGen, noise)
+                        routeSecondCost += routeSecondCost*noiseFactor(randomGen, noise)
                     if routeBestCost < custRegret[iCust][0][0]:
                         custRegret[iCust][1] = custRegret[iCust][0]
                         custRegret[iCust][0] = (routeBestCost, bestRegret[0][1])
@@ -700,6 +1145,54 @@ class Solution:
                     if routeSecondCost < custRegret[iCust][1][0]:
                         custRegret[iCust][1] = (routeSecondCost, bestRegret[0][1])
 
+    def executeSplitInsertion(self, randomGen: Random, exactFirst: bool = False):
+        """
+        Method that repairs the second echelon on giant tours instead of routes: the routes of every
+        satellite are concatenated into a giant tour, the unserved customers are inserted in random
+        order at the cheapest position of the tours, and every tour is cut optimally into feasible
+        routes by splitTour. An insertion costs O(n) and a split O(n) per satellite, so this is much
+        cheaper than the route-based insertions on large instances. The first echelon is built greedily,
+        or optimally if exactFirst is True.
+
+        This is repair method number 6 in the ALNS
+
+        Parameters
+        ----------
+        randomGen : Used to generate random numbers
+        exactFirst : True to build the optimal first echelon with executeExactInsertionFirst instead
+        """
+        self.executeSplitInsertionSecond(randomGen)
+        if exactFirst:
+            self.executeExactInsertionFirst()
+        else:
+            self.executeGreedyInsertionFirst(randomGen, False)
+
+    def executeSplitInsertionSecond(self, randomGen: Random):
+        """
+        Method that inserts the unserved customers in the giant tours of the satellites and rebuilds
+        the second-echelon routes by splitting the tours
+        """
+        problem = self.problem
+        nC = len(problem.depots) + len(problem.satellites)
+        tours = giantTours(self)
+        order = [cust.deliveryLoc.nodeID for cust in self.notServed]
+        randomGen.shuffle(order)
+        for c in order:
+            insertInTours(problem, tours, c)
+
+        for route in self.routes_2:
+            self.trackRoute(route, False, -1)
+        self.routes_2 = []
+        for s, tour in tours.items():
+            sat = problem.locations[s]
+            for nodes in splitTour(problem, s, tour):
+                route = Route([sat] + [problem.locations[c] for c in nodes] + [sat], problem, False,
+                              [problem.locations[c].demand for c in nodes])
+                route.customers = [problem.customers[c - nC] for c in nodes]
+                self.routes_2.append(route)
+                self.trackRoute(route, False)
+        self.served.extend(self.notServed)
+        self.notServed = []
 
     def plotRoutes(self, name: str):
         """
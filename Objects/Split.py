@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Giant tours of the customers per satellite and their optimal split into second-echelon routes
+"""
+from collections import deque
+from math import atan2
+from Objects.Route import RANGE_TOLERANCE
+
+
+def giantTours(solution) -> dict[int, list[int]]:
+    """
+    Function that concatenates the second-echelon routes of every satellite into a giant tour of
+    customer nodeIDs. The routes are ordered by the angle of their centroid around the satellite, so
+    neighbouring routes are adjacent in the tour. Every route is a segment of the tour, so splitting
+    the tour optimally never gives worse routes than the current ones.
+
+    Returns
+    -------
+    tours : dict that maps the nodeID of every satellite to its giant tour.
+    """
+    routesOf = {s.nodeID: [] for s in solution.problem.satellites}
+    for route in solution.routes_2:
+        customers = route.locations[1:-1]
+        if customers:
+            sat = route.locations[0]
+            angle = atan2(sum(loc.yLoc for loc in customers)/len(customers) - sat.yLoc,
+                          sum(loc.xLoc for loc in customers)/len(customers) - sat.xLoc)
+            routesOf[sat.nodeID].append((angle, [loc.nodeID for loc in customers]))
+    return {s: [c for _, nodes in sorted(routes, key=lambda r: r[0]) for c in nodes] for s, routes in routesOf.items()}
+
+
+def insertInTours(problem, tours: dict[int, list[int]], c: int):
+    """
+    Function that inserts the customer with nodeID c at the cheapest position of the giant tours of
+    the satellites that reach it, the nearest satellite if none does. Capacity, range and time windows
+    are left to splitTour.
+    """
+    D = problem.distList
+    satellites = [s for s in tours if c in problem.satelliteReach[s]]
+    if not satellites:
+        satellites = [min(tours, key=lambda s: D[s][c])]
+    bestDelta, bestSat, bestPos = None, None, None
+    for s in satellites:
+        tour = tours[s]
+        prev = s
+        for pos, nxt in enumerate(tour + [s]):
+            delta = D[prev][c] + D[c][nxt] - D[prev][nxt]
+            if bestDelta is None or delta < bestDelta:
+                bestDelta, bestSat, bestPos = delta, s, pos
+            prev = nxt
+    tours[bestSat].insert(bestPos, c)
+
+
+def splitTour(problem, s: int, tour: list[int]) -> list[list[int]]:
+    """
+    Function that cuts the giant tour of satellite s into consecutive routes with the least distance
+    plus cost_second per route, with the linear Split of Vidal (2016). With the triangle inequality, a
+    route that is infeasible by capacity, range_second or time windows stays infeasible when it is
+    extended, so the feasible predecessors of every position form a sliding window and the best of
+    them is kept at the front of a monotone deque. Without time windows this is O(n); the time windows
+    are checked by simulating the route of the front predecessor, which is only restarted when that
+    predecessor changes. A customer that fits in no route is served alone.
+
+    Parameters
+    ----------
+    problem : the problem instance.
+    s : nodeID of the satellite.
+    tour : the giant tour, customer nodeIDs.
+
+    Returns
+    -------
+    routes : the customer nodeIDs of every route, in the order of the tour.
+    """
+    n = len(tour)
+    if n == 0:
+        return []
+    D = problem.distList
+    locations = problem.locations
+    nodes = [s] + tour
+    # cum[k] is the distance from the first customer to customer k along the tour, load[k] the demand up to k
+    cum = [0.0]*(n+1)
+    load = [0]*(n+1)
+    for k in range(1, n+1):
+        cum[k] = cum[k-1] + D[nodes[k-1]][nodes[k]] if k > 1 else 0.0
+        load[k] = load[k-1] + locations[nodes[k]].demand
+    capacity = problem.capacity_second
+    # conservative, so Route never finds a split route infeasible through rounding
+    maxDistance = problem.range_second - RANGE_TOLERANCE
+    timeWindows = problem.timeWindows
+    schedule = [None, 0, 0.0] # predecessor, last customer and start of its service of the simulated route
+
+    def windowsKept(i: int, j: int) -> bool:
+        # start of the service at customer j on the route i+1..j, from the simulation if it can be extended
+        if schedule[0] != i or schedule[1] >= j:
+            schedule[0], schedule[1], schedule[2] = i, i, 0.0
+        time = schedule[2]
+        for k in range(schedule[1] + 1, j + 1):
+            prev, cur = locations[nodes[k-1] if k > i+1 else s], locations[nodes[k]]
+            time = max(cur.windowStart, time + prev.servTime + D[prev.nodeID][cur.nodeID])
+            if time > cur.windowEnd:
+                schedule[0] = None
+                return False
+        schedule[1], schedule[2] = j, time
+        last, sat = locations[nodes[j]], locations[s]
+        return time + last.servTime + D[last.nodeID][s] <= sat.windowEnd
+
+    def feasible(i: int, j: int) -> bool:
+        if load[j] - load[i] > capacity:
+            return False
+        if D[s][nodes[i+1]] + cum[j] - cum[i+1] + D[nodes[j]][s] > maxDistance:
+            return False
+        return not timeWindows or windowsKept(i, j)
+
+    # p[j] is the cost of the best split of the first j customers, pred[j] the end of its previous route
+    p = [0.0]*(n+1)
+    pred = [0]*(n+1)
+    # predecessor i contributes p[i] + D[s][first customer] - cum[first customer] to the cost of its route
+    head = [0.0]*(n+1)
+    head[0] = D[s][nodes[1]]
+    window = deque([0])
+    for j in range(1, n+1):
+        while window and not feasible(window[0], j):
+            window.popleft()
+        i = window[0] if window else j-1
+        p[j] = (p[i] + D[s][nodes[i+1]] + cum[j] - cum[i+1] + D[nodes[j]][s]) + problem.cost_second
+        pred[j] = i
+        if j < n:
+            head[j] = p[j] + D[s][nodes[j+1]] - cum[j+1]
+            while window and head[window[-1]] >= head[j]:
+                window.pop()
+            window.append(j)
+
+    routes = []
+    j = n
+    while j > 0:
+        routes.append(tour[pred[j]:j])
+        j = pred[j]
+    routes.reverse()
+    return routes
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel, resumable hyper-parameter sweeps of the ALNS
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from Objects.ALNS import ALNS, Parameters
+from Objects.Problem import TWO_E_CVRP
+import csv
+import hashlib
+import json
+import os
+import statistics
+import time
+
+# parameters that can be swept: the class attributes of Parameters and the ALNS weight sensitivity
+SWEEP_PARAMETERS = ("nIterations", "minSizeNBH", "T", "Cool", "localSearchOnBest", "localSearchInterval",
+                    "localSearchFirstImprovement", "scheduler", "schedulerWindow", "schedulerExploration", "wLambda")
+# defaults of Parameters, restored before every run since a job only sets the parameters of its grid point
+PARAMETER_DEFAULTS = {name: getattr(Parameters, name) for name in SWEEP_PARAMETERS + ("randomSeed",) if name != "wLambda"}
+
+# problems read by this (worker) process, keyed by (instance, dir)
+_problemCache = {}
+
+
+def instanceHash(instance: str, dir: str = "Must") -> str:
+    """
+    Function that returns the sha256 hash of an instance file
+    """
+    with open(f"Instances/{dir}/{instance}", "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def sourceHash() -> str:
+    """
+    Function that returns the sha256 hash of the sources of the solver, the files Objects/*.py. Unlike
+    the git commit it tells apart uncommitted changes, and edits of the sweep scripts leave it unchanged.
+    """
+    sha = hashlib.sha256()
+    objectsDir = os.path.dirname(os.path.abspath(__file__))
+    for fileName in sorted(f for f in os.listdir(objectsDir) if f.endswith(".py")):
+        with open(os.path.join(objectsDir, fileName), "rb") as f:
+            sha.update(fileName.encode() + b"\0" + f.read() + b"\0")
+    return sha.hexdigest()
+
+
+def setParameters(params: dict, seed: int):
+    """
+    Function that resets the ALNS Parameters to their defaults and applies the given parameters
+    and seed. wLambda is not a class parameter and has to be set on the ALNS itself.
+    """
+    for name, value in PARAMETER_DEFAULTS.items():
+        setattr(Parameters, name, value)
+    for name, value in params.items():
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError(f"Unknown parameter {name}, choose from {SWEEP_PARAMETERS}")
+        if name != "wLambda":
+            setattr(Parameters, name, value)
+    Parameters.randomSeed = seed
+
+
+def runSweepJob(job: dict) -> dict:
+    """
+    Function that runs the ALNS for a single sweep job in the current process
+
+    Parameters
+    ----------
+    job : dict with the instance, dir, nDestroyOps, nRepairOps, params and seed of the run.
+
+    Returns
+    -------
+    record : the job extended with the best cost, the run time, and the fields of a run record of the
+        ResultsStore: all parameters, the code version, the operator statistics and the best solution.
+    """
+    from Objects.ResultsStore import runRecord
+    key = (job["instance"], job["dir"])
+    if key not in _problemCache:
+        _problemCache[key] = TWO_E_CVRP.readInstance(job["instance"], job["dir"])
+    problem = _problemCache[key]
+    setParameters(job["params"], job["seed"])
+
+    start_time = time.perf_counter()
+    alns = ALNS(problem, job["nDestroyOps"], job["nRepairOps"])
+    if "wLambda" in job["params"]:
+        alns.wLambda = job["params"]["wLambda"]
+    alns.execute(plotFinal=False)
+    runTime = time.perf_counter() - start_time
+    record = runRecord(alns, job["instance"], job["dir"], runTime)
+    record.update(job)
+    record["parameters"].update(job["params"])
+    record["cost"] = alns.bestSolution.cost
+    record["time"] = runTime
+    return record
+
+
+class Sweep:
+    """
+    Class that runs the ALNS for every combination of a parameter grid, instance and seed
+    in a process pool. Each result is cached on disk under the hash of (instance hash, operators,
+    params, seed, sourceHash), so an interrupted sweep resumes where it stopped, and a change of the
+    solver code, committed or not, never reuses results of the old code.
+
+    Attributes
+    ----------
+    instanceList : the instances to solve.
+    grid : dict that maps a parameter name in SWEEP_PARAMETERS to the list of values to try.
+    seeds : the random seeds, every combination is run once per seed.
+    nDestroyOps : number of destroy operators.
+    nRepairOps :  number of repair operators.
+    dir : directory of the instances.
+    cacheDir : directory where the result of each run is stored.
+    nWorkers : number of worker processes, None for the number of cpus.
+    results : records of all finished runs.
+    """
+    def __init__(self, instanceList: list[str], grid: dict[str, list], seeds: list[int], nDestroyOps: int, nRepairOps: int,
+                 dir: str = "Must", cacheDir: str = "Results/sweep", nWorkers: int = None):
+        for name in grid:
+            if name not in SWEEP_PARAMETERS:
+                raise ValueError(f"Unknown sweep parameter {name}, choose from {SWEEP_PARAMETERS}")
+        self.instanceList = instanceList
+        self.grid = grid
+        self.seeds = seeds
+        self.nDestroyOps = nDestroyOps
+        self.nRepairOps = nRepairOps
+        self.dir = dir
+        self.cacheDir = cacheDir
+        self.nWorkers = nWorkers
+        self.results = list()
+
+    def jobs(self) -> list[dict]:
+        """
+        Method that returns all jobs of the sweep
+        """
+        version = sourceHash()
+        names = sorted(self.grid)
+        jobs = []
+        for instance in self.instanceList:
+            hashInstance = instanceHash(instance, self.dir)
+            for values in product(*(self.grid[name] for name in names)):
+                for seed in self.seeds:
+                    jobs.append({"instance": instance, "dir": self.dir, "instanceHash": hashInstance,
+                                 "nDestroyOps": self.nDestroyOps, "nRepairOps": self.nRepairOps,
+                                 "params": dict(zip(names, values)), "seed": seed, "sourceHash": version})
+        return jobs
+
+    def cachePath(self, job: dict) -> str:
+        """
+        Method that returns the cache file of a job
+        """
+        key = json.dumps([job["instanceHash"], job["nDestroyOps"], job["nRepairOps"], job["params"], job["seed"],
+                          job["sourceHash"]], sort_keys=True)
+        return os.path.join(self.cacheDir, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def run(self, verbose: bool = False, store: "ResultsStore" = None, label: str = "sweep") -> list[dict]:
+        """
+        Method that runs all jobs that are not cached yet and collects the results of the sweep.
+        The new runs are also recorded in the results store if given, in one bulk insert per
+        nWorkers runs.
+        """
+        os.makedirs(self.cacheDir, exist_ok=True)
+        self.results = list()
+        todo = []
+        for job in self.jobs():
+            path = self.cachePath(job)
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.results.append(json.load(f))
+            else:
+                todo.append(job)
+        if verbose:
+            print(f"Sweep: {len(self.results)} cached runs, {len(todo)} runs to go")
+
+        stored = []
+        with ProcessPoolExecutor(max_workers=self.nWorkers) as pool:
+            futures = {pool.submit(runSweepJob, job): job for job in todo}
+            for future in as_completed(futures):
+                record = future.result()
+                # write to a temporary file first, so an interrupt never leaves a partial result
+                path = self.cachePath(futures[future])
+                with open(path + ".tmp", "w") as f:
+                    json.dump(record, f)
+                os.replace(path + ".tmp", path)
+                self.results.append(record)
+                if store is not None:
+                    stored.append(record)
+                    if len(stored) >= (self.nWorkers or os.cpu_count()):
+                        store.addMany(stored, label)
+                        stored.clear()
+                if verbose:
+                    print(f"Sweep: {record['instance']} {record['params']} seed {record['seed']}: "
+                          f"cost {record['cost']:.2f}, time {record['time']:.2f} s")
+        if store is not None and stored:
+            store.addMany(stored, label)
+        return self.results
+
+    def aggregate(self, field: str) -> dict[tuple, tuple[float, float, float]]:
+        """
+        Method that aggregates a field of the results over the seeds
+
+        Parameters
+        ----------
+        field : "cost" or "time".
+
+        Returns
+        -------
+        table : dict that maps (instance, params) to the (mean, min, max) of the field, where params
+            is a tuple of (name, value) pairs.
+        """
+        values = {}
+        for record in self.results:
+            key = (record["instance"], tuple(sorted(record["params"].items())))
+            values.setdefault(key, []).append(record[field])
+        return {key: (statistics.mean(v), min(v), max(v)) for key, v in sorted(values.items())}
+
+    def printTables(self):
+        """
+        Method that prints the aggregated cost and time tables
+        """
+        for field in ("cost", "time"):
+            print(f"Mean {field} over {len(self.seeds)} seeds (min - max)")
+            for (instance, params), (mean, lo, hi) in self.aggregate(field).items():
+                paramStr = ", ".join(f"{name}={value}" for name, value in params)
+                print(f"  {instance[:-4]:<12} {paramStr:<40} {mean:>12.2f} ({lo:.2f} - {hi:.2f})")
+
+    def writeTables(self, fileName: str):
+        """
+        Method that writes the aggregated cost and time tables to a csv file
+        """
+        names = sorted(self.grid)
+        cost = self.aggregate("cost")
+        runTime = self.aggregate("time")
+        os.makedirs(os.path.dirname(fileName) or ".", exist_ok=True)
+        with open(fileName, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["instance"] + names + ["meanCost", "minCost", "maxCost", "meanTime", "minTime", "maxTime"])
+            for key, costStats in cost.items():
+                writer.writerow([key[0]] + [value for _, value in key[1]] + list(costStats + runTime[key]))
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Recording of ALNS iterations and their deterministic replay
+"""
+from array import array
+import base64
+import gzip
+import json
+import time
+from Objects.ALNS import CHECKPOINT_PARAMETERS, Parameters, applyOperators
+from Objects.RandomService import RandomService
+from Objects.Solution import Solution
+
+
+def openTrace(fileName: str, mode: str):
+    """
+    Function that opens a trace file as text, gzip-compressed if the name ends with .gz
+    """
+    return gzip.open(fileName, mode + "t") if fileName.endswith(".gz") else open(fileName, mode)
+
+
+def packRandomState(state: tuple) -> list:
+    """
+    Function that packs the state of a python Random compactly: the 625 words as base64
+    """
+    version, internalState, gaussNext = state
+    return [version, base64.b64encode(array("I", internalState).tobytes()).decode(), gaussNext]
+
+
+def unpackRandomState(packed: list) -> tuple:
+    """
+    Function that restores the state of a python Random packed by packRandomState
+    """
+    version, words, gaussNext = packed
+    return version, tuple(array("I", base64.b64decode(words))), gaussNext
+
+
+class TraceWriter:
+    """
+    Class that records the iterations of an ALNS run to a json lines file, so any iteration can be
+    replayed in isolation by replayIteration. The first line describes the run; every further line
+    is one iteration with the operator pair, the neighbourhood size, the states of the random streams
+    of the two operators before they ran, the cost, fingerprint and operator run times of the
+    candidate, and the input solution (Solution.toDict) if it differs from that of the previous
+    iteration.
+
+    Attributes
+    ----------
+    file : the open trace file.
+    record : the iteration that is being recorded.
+    lastInput : the current solution of the last recorded iteration.
+    """
+    def __init__(self, fileName: str, alns):
+        self.file = openTrace(fileName, "w")
+        self.record = None
+        self.lastInput = None
+        header = {"problem": alns.problem.name, "timeWindows": alns.problem.timeWindows,
+                  "nDestroyOps": alns.nDestroyOps, "nRepairOps": alns.nRepairOps,
+                  "parameters": {name: getattr(Parameters, name) for name in CHECKPOINT_PARAMETERS},
+                  "seed": alns.rng.seed, "workerID": alns.rng.workerID}
+        self.file.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+    def begin(self, iteration: int, alns, destroyOpNr: int, repairOpNr: int, sizeNBH: int):
+        """
+        Method that records the input of an iteration, before the destroy and repair
+        """
+        names = (f"destroy{destroyOpNr}", f"repair{repairOpNr}")
+        self.record = {"iteration": iteration, "destroyOpNr": destroyOpNr, "repairOpNr": repairOpNr, "sizeNBH": sizeNBH,
+                       "random": {name: packRandomState(alns.rng.random(name).getstate()) for name in names},
+                       "noise": {name: alns.rng.noise(name).getstate() for name in names}}
+        if alns.currentSolution is not self.lastInput:
+            self.record["solution"] = alns.currentSolution.toDict()
+            self.lastInput = alns.currentSolution
+
+    def end(self, solution: Solution, tDestroy: float, tRepair: float):
+        """
+        Method that records the result of the iteration and writes it
+        """
+        self.record.update({"cost": solution.cost, "fingerprint": solution.fingerprint, "tDestroy": tDestroy, "tRepair": tRepair})
+        self.file.write(json.dumps(self.record, separators=(",", ":")) + "\n")
+        self.record = None
+
+    def close(self):
+        self.file.close()
+
+
+def loadTrace(fileName: str) -> tuple[dict, list[dict]]:
+    """
+    Function that reads a trace. Every iteration gets the input solution it refers to.
+
+    Returns
+    -------
+    header : the description of the run.
+    records : the recorded iterations, in order.
+    """
+    with openTrace(fileName, "r") as f:
+        header = json.loads(f.readline())
+        records = []
+        solution = None
+        for line in f:
+            record = json.loads(line)
+            solution = record.setdefault("solution", solution)
+            records.append(record)
+    return header, records
+
+
+def applyTraceParameters(header: dict):
+    """
+    Function that sets the Parameters of the traced run
+    """
+    for name, value in header["parameters"].items():
+        setattr(Parameters, name, value)
+
+
+def replayIteration(problem, header: dict, record: dict) -> tuple[Solution, float, float]:
+    """
+    Function that re-executes the destroy and repair of a recorded iteration with the recorded
+    random states and input solution. The candidate equals the recorded one bit for bit, as
+    long as the code and the Parameters (see applyTraceParameters) are those of the traced run.
+
+    Parameters
+    ----------
+    problem : the problem of the traced run.
+    header : the header of the trace.
+    record : the recorded iteration.
+
+    Returns
+    -------
+    solution : the candidate solution.
+    tDestroy, tRepair : run times of the destroy and the repair operator.
+    """
+    rng = RandomService(header["seed"], header["workerID"])
+    for name, packed in record["random"].items():
+        rng.random(name).setstate(unpackRandomState(packed))
+    for name, state in record["noise"].items():
+        rng.noise(name).setstate(state)
+    solution = Solution.fromDict(problem, record["solution"])
+    tDestroy, tRepair = applyOperators(solution, record["destroyOpNr"], record["repairOpNr"], record["sizeNBH"], rng)
+    solution.updateCost()
+    return solution, tDestroy, tRepair
+
+
+def replayIterations(problem, header: dict, records: list[dict], repeat: int = 1) -> list[dict]:
+    """
+    Function that replays a stretch of recorded iterations, each from its own recorded input, and
+    checks that they reproduce the recorded candidates
+
+    Parameters
+    ----------
+    repeat : number of replays per iteration, the minimum and mean run times are reported.
+
+    Returns
+    -------
+    results : per iteration the iteration number, the operators, sizeNBH, whether the candidate
+        matches the record, and the recorded and the minimum and mean replayed run time in seconds.
+    """
+    results = []
+    for record in records:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            solution, _, _ = replayIteration(problem, header, record)
+            times.append(time.perf_counter() - start)
+        results.append({"iteration": record["iteration"], "destroyOpNr": record["destroyOpNr"],
+                        "repairOpNr": record["repairOpNr"], "sizeNBH": record["sizeNBH"],
+                        "identical": solution.cost == record["cost"] and solution.fingerprint == record["fingerprint"],
+                        "recordedTime": record["tDestroy"] + record["tRepair"],
+                        "minTime": min(times), "meanTime": sum(times) / len(times)})
+    return results
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Independent feasibility and cost check of solutions in the array form of Solution.toArrays
+"""
+import numpy as np
+
+
+def validateArrays(problem, arrays: dict, cost: float = None, tolerance: float = 1e-6) -> list[str]:
+    """
+    Function that checks a solution given as arrays (see Solution.toArrays) against the problem data
+    only, with vectorised numpy operations: the start and end of the routes, the node types, the
+    coverage of every customer exactly once with its demand, the vehicle capacities, range_second,
+    the satellite flow balance (every satellite receives the load of its second-echelon routes) and
+    the cost. The time windows are checked as well if the problem has them.
+
+    Parameters
+    ----------
+    problem : the problem instance.
+    arrays : nodes_e, offsets_e and loads_e for both echelons e, as arrays or lists.
+    cost : the claimed cost of the solution, not checked if None.
+    tolerance : relative tolerance on distances and the cost.
+
+    Returns
+    -------
+    errors : description of every violation, empty if the solution is feasible.
+    """
+    errors = []
+    nD = len(problem.depots)
+    nS = len(problem.satellites)
+    n = len(problem.locations)
+    D = problem.distMatrix
+    demand = np.array([loc.demand for loc in problem.locations])
+    # node ranges of the route ends and the visited nodes per echelon
+    ends = {1: (0, nD), 2: (nD, nD+nS)}
+    visits = {1: (nD, nD+nS), 2: (nD+nS, n)}
+    capacity = {1: problem.capacity_first, 2: problem.capacity_second}
+    echelon = {}
+    for e in (1, 2):
+        nodes = np.asarray(arrays[f"nodes_{e}"], dtype=np.int64)
+        offsets = np.asarray(arrays[f"offsets_{e}"], dtype=np.int64)
+        loads = np.asarray(arrays[f"loads_{e}"], dtype=np.int64)
+        nRoutes = len(offsets) - 1
+        lengths = np.diff(offsets)
+        if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(nodes) or (lengths < 2).any():
+            return errors + [f"Echelon {e}: the offsets do not split the nodes into routes"]
+        if len(loads) != len(nodes) - 2*nRoutes:
+            return errors + [f"Echelon {e}: {len(loads)} loads for {len(nodes) - 2*nRoutes} visits"]
+        if ((nodes < 0) | (nodes >= n)).any():
+            return errors + [f"Echelon {e}: unknown nodeIDs"]
+        routeIndex = np.repeat(np.arange(nRoutes), lengths)
+        isEnd = np.zeros(len(nodes), dtype=bool)
+        isEnd[offsets[:-1]] = True
+        isEnd[offsets[1:]-1] = True
+        starts = nodes[offsets[:-1]]
+        visited = nodes[~isEnd]
+        visitedRoute = routeIndex[~isEnd]
+
+        low, high = ends[e]
+        wrong = np.flatnonzero((starts < low) | (starts >= high) | (starts != nodes[offsets[1:]-1]))
+        if len(wrong) > 0:
+            errors.append(f"Echelon {e}: routes {wrong.tolist()} do not start and end at the same "
+                          f"{'depot' if e == 1 else 'satellite'}")
+        low, high = visits[e]
+        wrong = np.unique(visitedRoute[(visited < low) | (visited >= high)])
+        if len(wrong) > 0:
+            errors.append(f"Echelon {e}: routes {wrong.tolist()} visit a node that is not a "
+                          f"{'satellite' if e == 1 else 'customer'}")
+        if (loads < 0).any():
+            errors.append(f"Echelon {e}: negative loads")
+
+        routeLoad = np.bincount(visitedRoute, weights=loads, minlength=nRoutes)
+        wrong = np.flatnonzero(routeLoad > capacity[e])
+        if len(wrong) > 0:
+            errors.append(f"Echelon {e}: routes {wrong.tolist()} exceed the capacity {capacity[e]}")
+        sameRoute = routeIndex[:-1] == routeIndex[1:]
+        arcs = D[nodes[:-1][sameRoute], nodes[1:][sameRoute]]
+        routeDistance = np.bincount(routeIndex[:-1][sameRoute], weights=arcs, minlength=nRoutes)
+        echelon[e] = (nodes, offsets, loads, starts, visited, routeLoad, routeDistance)
+
+    # second echelon: coverage, demands and range
+    nodes, offsets, loads, starts, visited, routeLoad, routeDistance = echelon[2]
+    _, offsets_1, loads_1, _, visited_1, _, routeDistance_1 = echelon[1]
+    counts = np.bincount(visited, minlength=n)[nD+nS:]
+    if (counts == 0).any():
+        errors.append(f"Customers {(np.flatnonzero(counts == 0) + nD+nS).tolist()} are not served")
+    if (counts > 1).any():
+        errors.append(f"Customers {(np.flatnonzero(counts > 1) + nD+nS).tolist()} are served more than once")
+    wrong = np.flatnonzero(loads != demand[visited])
+    if len(wrong) > 0:
+        errors.append(f"Customers {visited[wrong].tolist()} do not receive their demand")
+    wrong = np.flatnonzero(routeDistance > problem.range_second + tolerance)
+    if len(wrong) > 0:
+        errors.append(f"Second-echelon routes {wrong.tolist()} exceed the range {problem.range_second}")
+    if problem.timeWindows:
+        late = [r for r in range(len(offsets) - 1) if not windowsKept(problem, nodes[offsets[r]:offsets[r+1]].tolist())]
+        if late:
+            errors.append(f"Second-echelon routes {late} violate time windows")
+
+    # satellite flow balance
+    delivered = np.bincount(visited_1 - nD, weights=loads_1, minlength=nS)
+    needed = np.bincount(starts - nD, weights=routeLoad, minlength=nS)
+    wrong = np.flatnonzero(delivered != needed)
+    if len(wrong) > 0:
+        errors.append(f"Satellites {(wrong + nD).tolist()} receive {delivered[wrong].tolist()} instead of {needed[wrong].tolist()}")
+
+    if cost is not None:
+        recomputed = (problem.cost_handling*loads_1.sum() + routeDistance_1.sum() + routeDistance.sum()
+                      + problem.cost_first*(len(offsets_1) - 1) + problem.cost_second*(len(offsets) - 1))
+        if abs(recomputed - cost) > tolerance*max(1, abs(recomputed)):
+            errors.append(f"The cost {cost} differs from the recomputed cost {recomputed}")
+    return errors
+
+
+def windowsKept(problem, nodes: list[int]) -> bool:
+    """
+    Function that returns True if every service of a second-echelon route starts within its time window
+    """
+    D = problem.distList
+    locations = problem.locations
+    time = 0.0
+    for k in range(1, len(nodes)):
+        prev, cur = locations[nodes[k-1]], locations[nodes[k]]
+        time = max(cur.windowStart, time + prev.servTime + D[prev.nodeID][cur.nodeID])
+        if time > cur.windowEnd:
+            return False
+    return True
+
+
+def validateSolution(solution, tolerance: float = 1e-6) -> list[str]:
+    """
+    Function that checks a Solution and its cost with validateArrays
+    """
+    return validateArrays(solution.problem, solution.toArrays(), solution.cost, tolerance)
+
+
+def arraysFromDict(data: dict) -> dict[str, np.ndarray]:
+    """
+    Function that converts a solution serialised by Solution.toDict, e.g. stored by ResultsStore,
+    to the array form of Solution.toArrays
+    """
+    arrays = {}
+    for e in (1, 2):
+        routes = data[f"routes_{e}"]
+        arrays[f"nodes_{e}"] = np.array([n for route in routes for n in route["nodes"]], dtype=np.int32)
+        arrays[f"offsets_{e}"] = np.cumsum([0] + [len(route["nodes"]) for route in routes], dtype=np.int32)
+        arrays[f"loads_{e}"] = np.array([load for route in routes for load in route["load"]], dtype=np.int32)
+    return arrays
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Replays ALNS iterations recorded with ALNS.execute(traceFile=...), e.g. to profile a slow destroy and repair:
+
+    python Replay.py trace.jsonl.gz --slowest 5
+    python Replay.py trace.jsonl.gz --start 137 --profile
+    python Replay.py trace.jsonl.gz --start 100 --end 200 --repeat 5
+"""
+import argparse
+import cProfile
+import pstats
+from Objects.Problem import TWO_E_CVRP
+from Objects.Trace import applyTraceParameters, loadTrace, replayIteration, replayIterations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded ALNS iterations")
+    parser.add_argument("trace", help="trace file written by ALNS.execute")
+    parser.add_argument("--dir", default="Must", help="directory of the instance")
+    parser.add_argument("--start", type=int, help="first iteration to replay")
+    parser.add_argument("--end", type=int, help="iteration after the last one to replay, default start+1")
+    parser.add_argument("--repeat", type=int, default=1, help="number of replays per iteration")
+    parser.add_argument("--profile", action="store_true", help="run the replay under cProfile")
+    parser.add_argument("--slowest", type=int, default=0, help="list the slowest recorded iterations")
+    args = parser.parse_args()
+
+    header, records = loadTrace(args.trace)
+    applyTraceParameters(header)
+    problem = TWO_E_CVRP.readInstance(header["problem"], args.dir, header["timeWindows"])
+    if args.slowest > 0:
+        for record in sorted(records, key=lambda r: r["tDestroy"] + r["tRepair"], reverse=True)[:args.slowest]:
+            print(f"Iteration {record['iteration']}: destroy {record['destroyOpNr']}, repair {record['repairOpNr']}, "
+                  f"sizeNBH {record['sizeNBH']}, {1000*(record['tDestroy'] + record['tRepair']):.1f} ms")
+    if args.start is not None:
+        end = args.end if args.end is not None else args.start + 1
+        selected = [record for record in records if args.start <= record["iteration"] < end]
+        if args.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            for record in selected:
+                replayIteration(problem, header, record)
+            profiler.disable()
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(30)
+        for result in replayIterations(problem, header, selected, args.repeat):
+            print(f"Iteration {result['iteration']}: destroy {result['destroyOpNr']}, repair {result['repairOpNr']}, "
+                  f"sizeNBH {result['sizeNBH']}, identical {result['identical']}, recorded {1000*result['recordedTime']:.1f} ms, "
+                  f"replayed min {1000*result['minTime']:.1f} ms, mean {1000*result['meanTime']:.1f} ms")
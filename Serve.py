@@ -0,0 +1,9 @@
+import asyncio
+from Objects.Service import SolveService
+
+if __name__ == "__main__":
+    host = "127.0.0.1"
+    port = 8080
+    nWorkers = 2
+    service = SolveService(host, port, nWorkers)
+    asyncio.run(service.serve())
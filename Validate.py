@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Checks the feasibility and the cost of stored solutions, without the ALNS code that produced them:
+
+    python Validate.py Results/best.npz Results/other.json --dir Must
+    python Validate.py --db Results/results.db --label sweep
+
+or checks that a short ALNS run only accepts valid solutions, e.g. with time windows:
+
+    python Validate.py --run Ca1-6,4,50.txt --timeWindows --iterations 100
+"""
+import argparse
+import sys
+import time
+from Objects.ALNS import ALNS, Parameters
+from Objects.Problem import TWO_E_CVRP
+from Objects.ResultsStore import ResultsStore
+from Objects.Solution import Solution
+from Objects.Validator import arraysFromDict, validateArrays, validateSolution
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate stored solutions")
+    parser.add_argument("files", nargs="*", help="solutions written by Solution.save, as .json or .npz")
+    parser.add_argument("--dir", default="Must", help="directory of the instances of the files")
+    parser.add_argument("--timeWindows", action="store_true", help="read the instances with time windows")
+    parser.add_argument("--db", help="also validate the runs of this results database")
+    parser.add_argument("--label", help="only validate the runs with this label")
+    parser.add_argument("--instance", help="only validate the runs of this instance")
+    parser.add_argument("--run", help="instance in --dir to solve with every accepted solution validated")
+    parser.add_argument("--iterations", type=int, default=100, help="number of iterations of the --run check")
+    args = parser.parse_args()
+
+    if args.run:
+        Parameters.nIterations = args.iterations
+        Parameters.timeWindows = args.timeWindows
+        # raises a RuntimeError as soon as an invalid solution is accepted
+        Parameters.debugCostTracking = True
+        alns = ALNS(TWO_E_CVRP.readInstance(args.run, args.dir), 6, 6)
+        alns.execute(plotFinal=False)
+        errors = validateSolution(alns.bestSolution)
+        print(f"{args.run}: best solution {'valid' if not errors else errors}, cost {alns.bestSolution.cost}")
+        if errors:
+            sys.exit(1)
+        if not args.files and not args.db:
+            sys.exit(0)
+
+    # (name, instance, dir, arrays, cost) of every solution
+    solutions = []
+    for fileName in args.files:
+        saved = Solution.readSaved(fileName)
+        solutions.append((fileName, saved["problem"], args.dir, saved, saved["cost"]))
+    if args.db:
+        with ResultsStore(args.db) as store:
+            for run in store.query(label=args.label, instance=args.instance, withSolution=True):
+                solutions.append((f"run {run['id']} ({run['label']})", run["instance"], run["dir"] or args.dir,
+                                  arraysFromDict(run["solution"]), run["cost"]))
+
+    problems = {}
+    nInvalid = 0
+    start = time.perf_counter()
+    for name, instance, dir, arrays, cost in solutions:
+        if (instance, dir) not in problems:
+            problems[instance, dir] = TWO_E_CVRP.readInstance(instance, dir, args.timeWindows)
+        errors = validateArrays(problems[instance, dir], arrays, cost)
+        if errors:
+            nInvalid += 1
+            print(f"{name}: {instance}, cost {cost}")
+            for error in errors:
+                print(f"    {error}")
+    print(f"{len(solutions) - nInvalid} of {len(solutions)} solutions valid, "
+          f"{time.perf_counter() - start:.2f} s including reading {len(problems)} instances")
+    if nInvalid > 0:
+        sys.exit(1)
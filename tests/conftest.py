@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the tests, run with python -m pytest from the repository root
+"""
+import os
+import matplotlib
+matplotlib.use("Agg")
+import pytest
+from Objects.ALNS import Parameters
+from Objects.Problem import TWO_E_CVRP
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repositoryRoot(monkeypatch):
+    """
+    Fixture that runs every test from the repository root, where the instances are read, and
+    restores the ALNS Parameters afterwards
+    """
+    monkeypatch.chdir(ROOT)
+    saved = {name: value for name, value in vars(Parameters).items() if not name.startswith("__")}
+    # operator run times in route evaluations, so the seeded runs are reproducible
+    Parameters.operatorTime = "evaluations"
+    yield
+    for name, value in saved.items():
+        setattr(Parameters, name, value)
+
+
+@pytest.fixture
+def smallProblem() -> TWO_E_CVRP:
+    """
+    Fixture with the smallest instance, 2 depots, 3 satellites and 15 customers
+    """
+    return TWO_E_CVRP.readInstance("Ca1-2,3,15.txt")
+
+
+@pytest.fixture
+def windowProblem() -> TWO_E_CVRP:
+    """
+    Fixture with a small instance whose time windows are respected
+    """
+    return TWO_E_CVRP.readInstance("Cc1-2,3,15.txt", "Optional", timeWindows=True)
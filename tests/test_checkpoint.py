@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of checkpointing and resuming ALNS runs
+"""
+import pytest
+from Objects.ALNS import ALNS, Parameters
+from Objects.Problem import TWO_E_CVRP
+
+
+@pytest.mark.parametrize("scheduler", ["roulette", "bandit"])
+def testResumeRepeatsRun(tmp_path, scheduler):
+    Parameters.scheduler = scheduler
+    Parameters.nIterations = 80
+    full = ALNS(TWO_E_CVRP.readInstance("Ca2-6,4,50.txt"), 6, 6)
+    full.execute(plotFinal=False)
+
+    checkpointFile = str(tmp_path / "checkpoint.json")
+    Parameters.nIterations = 40
+    problem = TWO_E_CVRP.readInstance("Ca2-6,4,50.txt")
+    interrupted = ALNS(problem, 6, 6)
+    interrupted.execute(plotFinal=False, checkpointFile=checkpointFile, checkpointInterval=40)
+    resumed = ALNS.loadCheckpoint(problem, checkpointFile)
+    assert resumed.iteration == 40
+    Parameters.nIterations = 80
+    resumed.execute(plotFinal=False)
+
+    assert resumed.currentSolutionTrend == full.currentSolutionTrend
+    assert resumed.bestSolution.cost == full.bestSolution.cost
+    assert resumed.bestSolution.fingerprint == full.bestSolution.fingerprint
+    assert resumed.nUsedDestroyOps == full.nUsedDestroyOps
+    assert resumed.nUsedRepairOps == full.nUsedRepairOps
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the boundary refinement of the decomposition
+"""
+from Objects.ALNS import Parameters
+from Objects.Decomposition import Decomposition, secondEchelonCost, solveCluster, subProblem
+from Objects.Problem import TWO_E_CVRP
+from Objects.Sweep import SWEEP_PARAMETERS
+
+
+class FarthestSatellite(Decomposition):
+    """
+    Decomposition with a deliberately bad split: every customer joins the cluster of its farthest satellite
+    """
+    def clusterCustomers(self):
+        satIDs = [sat.nodeID for sat in self.problem.satellites]
+        members = {s: [] for s in satIDs}
+        for loc in self.problem.customerLoc:
+            members[max(satIDs, key=lambda s: self.problem.distMatrix[s, loc.nodeID])].append(loc.nodeID)
+        self.clusters = [(s, custIDs) for s, custIDs in members.items() if custIDs]
+        return self.clusters
+
+
+def routesCost(decomposition: Decomposition) -> float:
+    return secondEchelonCost(decomposition.problem, [decomposition.toRoute(nodes, loads)
+                                                     for iCluster, nodes, loads in decomposition.routes])
+
+
+def testRefinementImprovesBadSplit(smallProblem):
+    Parameters.nIterations = 100
+    decomposition = FarthestSatellite(smallProblem, 3, 3)
+    decomposition.solve()
+    before = routesCost(decomposition)
+    assert decomposition.refine(set()) > 0
+    assert routesCost(decomposition) < before - 1e-6
+    served = sorted(n for iCluster, nodes, loads in decomposition.routes for n in nodes[1:-1])
+    assert served == sorted(loc.nodeID for loc in smallProblem.customerLoc)
+
+
+def testRefinementNeverIncreasesCost(smallProblem):
+    Parameters.nIterations = 30
+    decomposition = Decomposition(smallProblem, 3, 3, maxClusterSize=5)
+    decomposition.solve()
+    refined = set()
+    before = routesCost(decomposition)
+    while decomposition.refine(refined) > 0:
+        after = routesCost(decomposition)
+        assert after <= before + 1e-9
+        before = after
+
+
+def testWarmStartedClusterNeverWorse():
+    # the sub-ALNS minimises the total cost, its best solution can have a more expensive second echelon
+    problem = TWO_E_CVRP.readInstance("Ca3-2,3,15.txt")
+    Parameters.nIterations = 50
+    decomposition = Decomposition(problem, 3, 3, maxClusterSize=10)
+    decomposition.solve()
+    satIDs = sorted({nodes[0] for iCluster, nodes, loads in decomposition.routes})
+    custIDs = [n for iCluster, nodes, loads in decomposition.routes for n in nodes[1:-1]]
+    sub, nodeMap = subProblem(problem, satIDs, custIDs, "all clusters")
+    subID = {n: i for i, n in enumerate(nodeMap)}
+    prior = [([subID[n] for n in nodes], loads) for iCluster, nodes, loads in decomposition.routes]
+    params = {name: getattr(Parameters, name) for name in SWEEP_PARAMETERS if name != "wLambda"}
+    for seed in range(1, 6):
+        result = solveCluster({"problem": sub, "nodeMap": nodeMap, "priorRoutes": prior, "workerID": 0, "params": params,
+                               "seed": seed, "nDestroyOps": 3, "nRepairOps": 3})
+        assert result["cost"] <= routesCost(decomposition) + 1e-9
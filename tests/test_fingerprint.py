@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the solution fingerprints and the duplicate cache
+"""
+import copy
+import random
+from Objects.ALNS import ALNS, Parameters
+from Objects.Fingerprint import SolutionCache, routeFingerprint
+from Objects.Route import Route
+
+
+def solvedSolution(problem):
+    Parameters.nIterations = 50
+    alns = ALNS(problem, 6, 6)
+    alns.execute(plotFinal=False)
+    return alns.bestSolution
+
+
+def reversedRoute(route: Route) -> Route:
+    return Route(route.locations[::-1], route.problem, route.isFirstEchelonRoute, route.servedLoad[::-1])
+
+
+def testInvariantToRouteOrderAndDirection(smallProblem):
+    solution = solvedSolution(smallProblem)
+    fingerprint = solution.fingerprint
+    shuffled = copy.deepcopy(solution)
+    rng = random.Random(1)
+    rng.shuffle(shuffled.routes_1)
+    rng.shuffle(shuffled.routes_2)
+    shuffled.routes_2 = [reversedRoute(route) for route in shuffled.routes_2]
+    shuffled.computeCost()
+    assert shuffled.fingerprint == fingerprint
+    for route in solution.routes_1 + solution.routes_2:
+        assert routeFingerprint(reversedRoute(route)) == routeFingerprint(route)
+
+
+def testDistinguishesSolutions(smallProblem):
+    solution = solvedSolution(smallProblem)
+    # the arc of a single-customer route is driven twice, it must not cancel out
+    sat, cust = smallProblem.satellites[0], smallProblem.customerLoc[0]
+    assert routeFingerprint(Route([sat, cust, sat], smallProblem, False, [cust.demand])) != 0
+    # the same arcs in the other echelon give another fingerprint
+    route = solution.routes_2[0]
+    assert routeFingerprint(Route(route.locations, smallProblem, True, route.servedLoad)) != routeFingerprint(route)
+    # moving a customer to another route changes the fingerprint
+    moved = copy.deepcopy(solution)
+    source = next(route for route in moved.routes_2 if len(route.locations) > 3)
+    target = next(route for route in moved.routes_2 if route is not source)
+    location = source.locations[1]
+    source.locations = source.locations[:1] + source.locations[2:]
+    target.locations = target.locations[:1] + [location] + target.locations[1:]
+    moved.computeDistance()
+    assert moved.fingerprint != solution.fingerprint
+
+
+def testTrackedFingerprintMatchesRecomputation(smallProblem):
+    # checkCost raises if the incrementally tracked fingerprint differs from a full recomputation
+    Parameters.debugCostTracking = True
+    solvedSolution(smallProblem)
+
+
+def testSolutionCache():
+    cache = SolutionCache(maxSize=2)
+    assert not cache.check(1, 10.0)
+    assert cache.check(1, 10.0)
+    assert not cache.check(2, 20.0)
+    # 1 was seen more recently than 2, so 2 is evicted
+    cache.check(1, 10.0)
+    assert not cache.check(3, 30.0)
+    assert cache.get(2) is None
+    assert cache.get(1) == 10.0 and len(cache) == 2
+    assert cache.duplicateRate() == 2/5
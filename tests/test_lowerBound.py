@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the lower bounds on the solution cost
+"""
+import itertools
+import random
+import numpy as np
+import pytest
+from Objects.ALNS import ALNS, Parameters
+from Objects.LowerBound import LowerBound, binPackingBound, spanningTreeLength
+from Objects.Problem import TWO_E_CVRP
+
+
+def optimalBins(sizes: list[int], capacity: int) -> int:
+    # smallest number of bins over all assignments of the items
+    for nBins in range(1, len(sizes)+1):
+        for assignment in itertools.product(range(nBins), repeat=len(sizes)):
+            loads = [0]*nBins
+            for size, b in zip(sizes, assignment):
+                loads[b] += size
+            if max(loads) <= capacity:
+                return nBins
+    return len(sizes)
+
+
+def testBinPackingBound():
+    rng = random.Random(1)
+    for _ in range(50):
+        sizes = [rng.randint(1, 10) for _ in range(rng.randint(1, 6))]
+        bound = binPackingBound(sizes, 10)
+        assert -(-sum(sizes) // 10) <= bound <= optimalBins(sizes, 10)
+
+
+def testSpanningTreeLength():
+    # points on a line: the tree connects neighbours
+    points = np.array([0.0, 1.0, 3.0, 7.0])
+    assert spanningTreeLength(np.abs(points[:, None] - points[None, :])) == pytest.approx(7.0)
+
+
+@pytest.mark.parametrize("instance, dir, timeWindows", [("Ca1-2,3,15.txt", "Must", False),
+                                                         ("Ca2-6,4,50.txt", "Must", False),
+                                                         ("Cc1-2,3,15.txt", "Optional", True)])
+def testBoundBelowSolutions(instance, dir, timeWindows):
+    Parameters.nIterations = 100
+    problem = TWO_E_CVRP.readInstance(instance, dir, timeWindows=timeWindows)
+    bound = LowerBound(problem)
+    assert bound.value > 0
+    alns = ALNS(problem, 6, 6)
+    alns.execute(plotFinal=False)
+    for cost in alns.currentSolutionTrend + [alns.bestSolution.cost]:
+        assert bound.value <= cost + 1e-6
+    assert 0 <= bound.gap(alns.bestSolution.cost) < 1
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the O(1) insertion checks of routes
+"""
+import random
+import pytest
+from Objects.Route import Route
+
+
+def randomRoutes(problem, rng: random.Random, nRoutes: int):
+    """
+    Function that yields feasible second-echelon routes of 1 to 4 random customers
+    """
+    found = 0
+    while found < nRoutes:
+        sat = rng.choice(problem.satellites)
+        customers = rng.sample(problem.customerLoc, rng.randint(1, 4))
+        route = Route([sat] + customers + [sat], problem, False, [loc.demand for loc in customers])
+        if route.feasible:
+            found += 1
+            yield route
+
+
+@pytest.mark.parametrize("problemName", ["smallProblem", "windowProblem"])
+def testInsertionDeltasMatchRebuiltRoutes(problemName, request):
+    problem = request.getfixturevalue(problemName)
+    rng = random.Random(1)
+    nChecked = [0, 0]
+    for route in randomRoutes(problem, rng, 100):
+        for location in problem.customerLoc:
+            if location in route.locations:
+                continue
+            deltas = dict(route.insertionDeltas(location, location.demand))
+            for i in range(1, len(route.locations)):
+                locations = route.locations[:i] + [location] + route.locations[i:]
+                loads = route.servedLoad[:i-1] + [location.demand] + route.servedLoad[i-1:]
+                rebuilt = Route(locations, problem, False, loads)
+                # a full re-simulation of the schedule decides the time windows
+                assert (i in deltas) == rebuilt.feasible
+                nChecked[rebuilt.feasible] += 1
+                if rebuilt.feasible:
+                    assert deltas[i] == pytest.approx(rebuilt.distance - route.distance, abs=1e-9)
+    assert nChecked[0] > 0 and nChecked[1] > 0
+
+
+def testInsertionDeltasRejectWindowSlack(windowProblem):
+    # positions where the location is served in its window, but a later service starts too late
+    rng = random.Random(2)
+    nDelayed = 0
+    for route in randomRoutes(windowProblem, rng, 100):
+        route.computeSchedule()
+        for location in windowProblem.customerLoc:
+            if location in route.locations or not route.canInsert(location, location.demand):
+                continue
+            deltas = dict(route.insertionDeltas(location, location.demand))
+            for i in range(1, len(route.locations)):
+                locations = route.locations[:i] + [location] + route.locations[i:]
+                rebuilt = Route(locations, windowProblem, False, route.servedLoad[:i-1] + [location.demand] + route.servedLoad[i-1:])
+                prev = route.locations[i-1]
+                start = max(location.windowStart, route.earliest[i-1] + prev.servTime
+                            + windowProblem.distList[prev.nodeID][location.nodeID])
+                if start <= location.windowEnd and rebuilt.computeDistance() <= windowProblem.range_second and not rebuilt.feasible:
+                    assert i not in deltas
+                    nDelayed += 1
+    assert nDelayed > 0
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the split of giant tours into second-echelon routes
+"""
+import random
+import pytest
+from Objects.Problem import TWO_E_CVRP
+from Objects.Route import RANGE_TOLERANCE, Route
+from Objects.Split import splitTour
+
+
+def secondEchelonRoute(problem, s: int, nodes: list[int]) -> Route:
+    locations = [problem.locations[s]] + [problem.locations[c] for c in nodes] + [problem.locations[s]]
+    return Route(locations, problem, False, [loc.demand for loc in locations[1:-1]])
+
+
+def bellmanSplit(problem, s: int, tour: list[int]) -> float:
+    """
+    Function that returns the cost of the optimal split of a giant tour with the quadratic Bellman
+    recursion, building every route that can be cut from the tour
+    """
+    best = [0.0] + [float("inf")]*len(tour)
+    for j in range(1, len(tour)+1):
+        for i in range(j):
+            route = secondEchelonRoute(problem, s, tour[i:j])
+            if route.feasible and route.distance <= problem.range_second - RANGE_TOLERANCE:
+                best[j] = min(best[j], best[i] + route.distance + problem.cost_second)
+    return best[-1]
+
+
+@pytest.mark.parametrize("instance, dir, timeWindows", [("Ca2-6,4,50.txt", "Must", False),
+                                                         ("Cc1-3,5,50.txt", "Optional", True),
+                                                         ("Cd1-3,5,50.txt", "Optional", True)])
+def testSplitIsOptimalAndFeasible(instance, dir, timeWindows):
+    problem = TWO_E_CVRP.readInstance(instance, dir, timeWindows=timeWindows)
+    rng = random.Random(1)
+    for _ in range(15):
+        s = rng.choice(problem.satellites).nodeID
+        reach = sorted(problem.satelliteReach[s])
+        tour = rng.sample(reach, min(20, len(reach)))
+        routes = splitTour(problem, s, tour)
+        assert [c for nodes in routes for c in nodes] == tour
+        cost = 0.0
+        for nodes in routes:
+            route = secondEchelonRoute(problem, s, nodes)
+            assert route.feasible
+            cost += route.distance + problem.cost_second
+        assert cost == pytest.approx(bellmanSplit(problem, s, tour), abs=1e-6)
+
+
+def testEmptyTour(smallProblem):
+    assert splitTour(smallProblem, smallProblem.satellites[0].nodeID, []) == []
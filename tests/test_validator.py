@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the compact solution export and the feasibility validator
+"""
+import random
+import numpy as np
+from Objects.ALNS import ALNS, Parameters
+from Objects.Route import Route
+from Objects.Solution import Solution
+from Objects.Validator import arraysFromDict, validateArrays, validateSolution, windowsKept
+
+
+def solvedSolution(problem) -> Solution:
+    Parameters.nIterations = 50
+    alns = ALNS(problem, 6, 6)
+    alns.execute(plotFinal=False)
+    return alns.bestSolution
+
+
+def copyArrays(solution: Solution) -> dict[str, np.ndarray]:
+    return {name: array.copy() for name, array in solution.toArrays().items()}
+
+
+def testSolutionsAreValid(smallProblem, windowProblem):
+    for problem in (smallProblem, windowProblem):
+        solution = solvedSolution(problem)
+        assert validateSolution(solution) == []
+        restored = Solution.fromArrays(problem, solution.toArrays())
+        assert abs(restored.cost - solution.cost) < 1e-6
+        assert restored.fingerprint == solution.fingerprint
+        assert validateArrays(problem, arraysFromDict(solution.toDict()), solution.cost) == []
+
+
+def testDetectsFaults(smallProblem):
+    solution = solvedSolution(smallProblem)
+    nD = len(smallProblem.depots)
+
+    arrays = copyArrays(solution)
+    assert validateArrays(smallProblem, arrays, solution.cost + 1)[0].startswith("The cost")
+
+    # a customer is visited twice instead of another one
+    arrays = copyArrays(solution)
+    nodes, offsets = arrays["nodes_2"], arrays["offsets_2"]
+    first, second = nodes[offsets[0]+1], nodes[offsets[-1]-2]
+    nodes[offsets[-1]-2] = first
+    errors = " ".join(validateArrays(smallProblem, arrays))
+    assert f"Customers [{second}] are not served" in errors
+    assert f"Customers [{first}] are served more than once" in errors
+
+    # a route that ends at another satellite
+    arrays = copyArrays(solution)
+    nodes, offsets = arrays["nodes_2"], arrays["offsets_2"]
+    nodes[offsets[1]-1] = nD + (nodes[offsets[1]-1] - nD + 1) % len(smallProblem.satellites)
+    assert any("do not start and end at the same satellite" in error for error in validateArrays(smallProblem, arrays))
+
+    # an overloaded route, so its customers do not receive their demand and the satellites are unbalanced
+    arrays = copyArrays(solution)
+    arrays["loads_2"][0] += smallProblem.capacity_second
+    errors = " ".join(validateArrays(smallProblem, arrays))
+    assert "exceed the capacity" in errors
+    assert "do not receive their demand" in errors
+    assert "Satellites" in errors
+
+    # malformed offsets
+    arrays = copyArrays(solution)
+    arrays["offsets_1"][-1] += 1
+    assert validateArrays(smallProblem, arrays) == ["Echelon 1: the offsets do not split the nodes into routes"]
+
+
+def testWindowsKeptMatchesRoute(windowProblem):
+    rng = random.Random(1)
+    sat = windowProblem.satellites[0]
+    outcomes = set()
+    for _ in range(200):
+        customers = rng.sample(windowProblem.customerLoc, 3)
+        route = Route([sat] + customers + [sat], windowProblem, False, [loc.demand for loc in customers])
+        kept = windowsKept(windowProblem, [loc.nodeID for loc in route.locations])
+        assert kept == route.computeSchedule()
+        outcomes.add(kept)
+    assert outcomes == {True, False}